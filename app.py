@@ -1,100 +1,323 @@
-from flask import Flask, jsonify, session
-from config import SECRET_KEY, default_user_setup_done
-
-# Import all the functions from routes package
-from routes import (
-    generate_admin_code,
-    setup_default_user,
-    index,
-    register,
-    login,
-    admin_dashboard,
-    generate_report,
-    logout,
-    home,
-    handle_vehicle,
-    calculate_charge,
-    create_user,
-    delete_user,
-    admin_register,
-    checkin,
-    checkout,
-    delete_admin,
-    update_existing_admins,
-    get_vehicle_suggestions
-)
-
-app = Flask(__name__)
-app.secret_key = SECRET_KEY
-
-# Register all the routes with their respective functions
-app.before_request(setup_default_user)
-
-@app.route('/')
-def route_index():
-    return index()
-
-@app.route('/register', methods=['GET', 'POST'])
-def route_register():
-    return register()
-
-@app.route('/login', methods=['GET', 'POST'])
-def route_login():
-    return login()
-
-@app.route('/admin_dashboard')
-def route_admin_dashboard():
-    return admin_dashboard()
-
-@app.route('/generate_report', methods=['POST'])
-def route_generate_report():
-    return generate_report()
-
-@app.route('/logout')
-def route_logout():
-    return logout()
-
-@app.route('/home')
-def route_home():
-    return home()
-
-@app.route('/handle_vehicle', methods=['POST'])
-def route_handle_vehicle():
-    return handle_vehicle()
-
-@app.route('/route_create_user', methods=['POST'])
-def route_create_user():
-    return create_user()
-
-@app.route('/route_delete_user/<username>', methods=['POST'])
-def route_delete_user(username):
-    try:
-        if not session.get('is_admin'):
-            return jsonify({'success': False, 'message': 'Unauthorized'})
-        return delete_user(username)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
-
-@app.route('/admin_register', methods=['GET', 'POST'])
-def route_admin_register():
-    return admin_register()
-
-@app.route('/route_checkin', methods=['POST'])
-def route_checkin():
-    return checkin()
-
-@app.route('/route_checkout', methods=['POST'])
-def route_checkout():
-    return checkout()
-
-@app.route('/route_delete_admin/<username>', methods=['POST'])
-def route_delete_admin(username):
-    return delete_admin(username)
-
-@app.route('/route_get_vehicle_suggestions')
-def route_get_vehicle_suggestions():
-    return get_vehicle_suggestions()
+import click
+import json
+import time
+from datetime import timedelta
+from flask import Flask, jsonify, request, session
+from config import SECRET_KEY, COLD_START_BUDGET_MS, ARCHIVE_AFTER_MONTHS, EXPORT_BATCH_SIZE, mongo
+from db_monitor import command_monitor
+from metrics import register_metrics
+from indexes import ensure_indexes, ensure_indexes_once, verify_indexes
+from suggestion_index import suggestion_index
+from rollups import backfill_rollups
+from partitions import migrate_legacy_records
+from offline_journal import offline_journal
+from report_cache import report_cache
+
+# Route functions resolve on their first call, so importing the app does not import the route
+# modules (and openpyxl, smtplib, ...) until a request needs them
+from routes import lazy_view
+
+generate_admin_code = lazy_view('generate_admin_code')
+setup_default_user = lazy_view('setup_default_user')
+index = lazy_view('index')
+register = lazy_view('register')
+login = lazy_view('login')
+admin_dashboard = lazy_view('admin_dashboard')
+generate_report = lazy_view('generate_report')
+logout = lazy_view('logout')
+home = lazy_view('home')
+handle_vehicle = lazy_view('handle_vehicle')
+calculate_charge = lazy_view('calculate_charge')
+create_user = lazy_view('create_user')
+delete_user = lazy_view('delete_user')
+admin_register = lazy_view('admin_register')
+checkin = lazy_view('checkin')
+checkout = lazy_view('checkout')
+bulk_operations = lazy_view('bulk_operations')
+delete_admin = lazy_view('delete_admin')
+update_existing_admins = lazy_view('update_existing_admins')
+get_vehicle_suggestions = lazy_view('get_vehicle_suggestions')
+cache_stats = lazy_view('cache_stats')
+list_users = lazy_view('list_users')
+list_active_vehicles = lazy_view('list_active_vehicles')
+list_admins = lazy_view('list_admins')
+export_metrics = lazy_view('export_metrics')
+offline_status = lazy_view('offline_status')
+health = lazy_view('health')
+submit_report_job = lazy_view('submit_report_job')
+report_job_status = lazy_view('report_job_status')
+download_report_job = lazy_view('download_report_job')
+cancel_report_job = lazy_view('cancel_report_job')
+
+
+def create_app(mongo_uri=None, db_name=None, client_options=None, client_factory=None):
+    # Builds the Flask app. No MongoDB connection is opened here: each process creates its
+    # client on first use, so gunicorn can fork workers after importing the app. The arguments
+    # override the MONGO_* settings, e.g. to point a benchmark at another database.
+    #
+    # The connection is not per app. Routes, caches and background workers reach MongoDB through
+    # the proxies in config, which all resolve through the one process-wide `mongo` connection,
+    # so the arguments reconfigure it for every app in the process: two apps built with
+    # different settings end up sharing the last ones. Tests that need separate databases run
+    # in separate processes.
+    if mongo_uri or db_name or client_options or client_factory:
+        mongo.configure(mongo_uri, db_name, client_options, client_factory)
+
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    # The process-wide connection, for code that has the app at hand
+    app.extensions['mongo'] = mongo
+
+    # Per-endpoint latency and DB round trips, registered ahead of the other request hooks
+    register_metrics(app, command_monitor)
+
+    # The first request each process serves creates any missing index; check-in depends on them
+    @app.before_request
+    def ensure_indexes_before_serving():
+        if request.endpoint not in ('static', 'route_metrics', 'route_health'):
+            ensure_indexes_once()
+
+    # Register all the routes with their respective functions
+    app.before_request(setup_default_user)
+
+    @app.route('/')
+    def route_index():
+        return index()
+
+    @app.route('/register', methods=['GET', 'POST'])
+    def route_register():
+        return register()
+
+    @app.route('/login', methods=['GET', 'POST'])
+    def route_login():
+        return login()
+
+    @app.route('/admin_dashboard')
+    def route_admin_dashboard():
+        return admin_dashboard()
+
+    @app.route('/generate_report', methods=['POST'])
+    def route_generate_report():
+        return generate_report()
+
+    # Background report jobs: submit, poll, download, cancel
+    @app.route('/route_report_jobs', methods=['POST'])
+    def route_submit_report_job():
+        return submit_report_job()
+
+    @app.route('/route_report_jobs/<job_id>')
+    def route_report_job_status(job_id):
+        return report_job_status(job_id)
+
+    @app.route('/route_report_jobs/<job_id>/download')
+    def route_download_report_job(job_id):
+        return download_report_job(job_id)
+
+    @app.route('/route_report_jobs/<job_id>/cancel', methods=['POST'])
+    def route_cancel_report_job(job_id):
+        return cancel_report_job(job_id)
+
+    @app.route('/logout')
+    def route_logout():
+        return logout()
+
+    @app.route('/home')
+    def route_home():
+        return home()
+
+    @app.route('/handle_vehicle', methods=['POST'])
+    def route_handle_vehicle():
+        return handle_vehicle()
+
+    @app.route('/route_create_user', methods=['POST'])
+    def route_create_user():
+        return create_user()
+
+    @app.route('/route_delete_user/<username>', methods=['POST'])
+    def route_delete_user(username):
+        try:
+            if not session.get('is_admin'):
+                return jsonify({'success': False, 'message': 'Unauthorized'})
+            return delete_user(username)
+        except Exception as e:
+            return jsonify({'success': False, 'message': str(e)})
+
+    @app.route('/admin_register', methods=['GET', 'POST'])
+    def route_admin_register():
+        return admin_register()
+
+    @app.route('/route_checkin', methods=['POST'])
+    def route_checkin():
+        return checkin()
+
+    @app.route('/route_checkout', methods=['POST'])
+    def route_checkout():
+        return checkout()
+
+    @app.route('/route_bulk_operations', methods=['POST'])
+    def route_bulk_operations():
+        return bulk_operations()
+
+    @app.route('/route_delete_admin/<username>', methods=['POST'])
+    def route_delete_admin(username):
+        return delete_admin(username)
+
+    @app.route('/route_get_vehicle_suggestions')
+    def route_get_vehicle_suggestions():
+        return get_vehicle_suggestions()
+
+    @app.route('/route_list_users')
+    def route_list_users():
+        return list_users()
+
+    @app.route('/route_list_active_vehicles')
+    def route_list_active_vehicles():
+        return list_active_vehicles()
+
+    @app.route('/route_list_admins')
+    def route_list_admins():
+        return list_admins()
+
+    @app.route('/metrics')
+    def route_metrics():
+        return export_metrics()
+
+    @app.route('/route_cache_stats')
+    def route_cache_stats():
+        return cache_stats()
+
+    @app.route('/route_offline_status')
+    def route_offline_status():
+        return offline_status()
+
+    @app.route('/health')
+    def route_health():
+        return health()
+
+    # Replays offline booth entries to MongoDB in the background (only when OFFLINE_JOURNAL_PATH is set).
+    # Started from the first request so each forked worker runs its own thread.
+    app.before_request(offline_journal.start_sync)
+
+    @app.cli.command('ensure-indexes')
+    @click.option('--verify', is_flag=True, help='Fail if a hot query still plans a collection scan.')
+    def ensure_indexes_command(verify):
+        ensure_indexes()
+        click.echo('Indexes ensured.')
+        if verify:
+            failures = verify_indexes()
+            for failure in failures:
+                click.echo(f"COLLSCAN on {failure['collection']}: {failure['query']} ({' -> '.join(failure['stages'])})")
+            if failures:
+                raise click.ClickException(f'{len(failures)} hot queries are not covered by an index')
+            click.echo('All hot queries use an index.')
+
+    @app.cli.command('backfill-rollups')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First checkout day to rebuild.')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last checkout day to rebuild.')
+    def backfill_rollups_command(start, end):
+        end_exclusive = end + timedelta(days=1) if end else None
+        count = backfill_rollups(start, end_exclusive)
+        # Multi-day financial reports are built from the rollups
+        report_cache.clear()
+        click.echo(f'Rebuilt {count} daily rollup documents.')
+
+    @app.cli.command('partition-completed-records')
+    @click.option('--batch-size', default=1000, show_default=True, help='Records moved per batch.')
+    def partition_completed_records_command(batch_size):
+        # One-off move of the unpartitioned completed_records collection into monthly partitions
+        moved = migrate_legacy_records(batch_size)
+        click.echo(f'Moved {moved} completed records into monthly partitions.')
+
+    @app.cli.command('archive-completed-records')
+    @click.option('--keep-months', default=ARCHIVE_AFTER_MONTHS, show_default=True,
+                  help='Newest months kept in MongoDB, including the current one.')
+    @click.option('--month', 'months', multiple=True, help='Archive only this month (YYYYMM); repeatable.')
+    @click.option('--batch-size', default=10000, show_default=True, help='Records per Parquet row group.')
+    def archive_completed_records_command(keep_months, months, batch_size):
+        from archive import archive_month, closed_months
+        closed = closed_months(keep_months)
+        for month in months:
+            if month not in closed:
+                raise click.ClickException(f'{month} is not a closed month with records in MongoDB')
+        for month in months or closed:
+            count = archive_month(month, batch_size)
+            click.echo(f'Archived {count} records from {month}.')
+        if not (months or closed):
+            click.echo('No closed months to archive.')
+
+    @app.cli.command('export-parquet')
+    @click.option('--full', is_flag=True, help='Rewrite the whole export instead of appending since the watermark.')
+    @click.option('--batch-size', default=EXPORT_BATCH_SIZE, show_default=True, help='Rows per record batch.')
+    def export_parquet_command(full, batch_size):
+        from parquet_export import export_parquet
+        result = export_parquet(full=full, batch_size=batch_size)
+        click.echo(f"Exported {result['completed_records']} completed records and {result['vehicles']} active vehicles; "
+                   f"watermark {result['watermark']['checkout_time']}.")
+
+    @app.cli.command('simulate-tariffs')
+    @click.argument('plans_file', type=click.File('r'))
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First checkout day to replay.')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last checkout day to replay.')
+    @click.option('--user', 'handled_by', help='Only replay records handled by this user.')
+    @click.option('--chunk-size', default=100000, show_default=True, help='Records priced per batch.')
+    @click.option('--verify', is_flag=True, help='Cross-check every price against the scalar calculate_charge.')
+    def simulate_tariffs_command(plans_file, start, end, handled_by, chunk_size, verify):
+        # plans_file is a JSON list of rate plans: name, initial_amount, initial_duration, extra_charge, extra_charge_duration
+        from tariff import simulate_rate_plans
+        end_exclusive = end + timedelta(days=1) if end else None
+        started = time.perf_counter()
+        summary = simulate_rate_plans(json.load(plans_file), start, end_exclusive, handled_by, chunk_size, verify)
+        elapsed = time.perf_counter() - started
+        click.echo(f"Replayed {summary['records']} records in {elapsed:.2f}s, actual revenue {summary['actual_revenue']:.2f}")
+        for plan in summary['plans']:
+            delta_pct = f" ({plan['delta_pct']:+.2f}%)" if plan['delta_pct'] is not None else ''
+            line = f"{plan['name']}: revenue {plan['revenue']:.2f}, delta {plan['delta']:+.2f}{delta_pct}"
+            if verify:
+                line += f", scalar mismatches {plan['scalar_mismatches']}"
+            click.echo(line)
+        if verify and any(plan['scalar_mismatches'] for plan in summary['plans']):
+            raise click.ClickException('Vectorized prices differ from calculate_charge')
+
+    @app.cli.command('sync-journal')
+    def sync_journal_command():
+        if not offline_journal.enabled:
+            raise click.ClickException('OFFLINE_JOURNAL_PATH is not set')
+        replayed = offline_journal.sync_once()
+        status = offline_journal.status()
+        click.echo(f"Replayed {replayed} entries; {status['pending']} pending, {status['conflict_count']} conflicts, "
+                   f"{status['failed_count']} failed.")
+        if status['last_sync_error']:
+            raise click.ClickException(f"MongoDB unreachable: {status['last_sync_error']}")
+
+    @app.cli.command('profile-startup')
+    @click.option('--top', default=20, show_default=True, help='Number of modules to list.')
+    @click.option('--runs', default=3, show_default=True, help='Cold imports to time; the fastest one is reported.')
+    @click.option('--budget', type=float, default=COLD_START_BUDGET_MS, show_default=True,
+                  help='Fail if importing the app takes longer than this many milliseconds.')
+    def profile_startup_command(top, runs, budget):
+        from startup_profile import profile_startup
+        total_ms, modules = profile_startup('app', runs)
+        packages = {}
+        for name, self_ms, _ in modules:
+            package = name.split('.', 1)[0]
+            packages[package] = packages.get(package, 0) + self_ms
+        click.echo(f"{'package':<32}{'self ms':>10}")
+        for package, self_ms in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            click.echo(f'{package:<32}{self_ms:>10.1f}')
+        click.echo(f"\n{'module':<48}{'self ms':>10}{'cumulative ms':>15}")
+        for name, self_ms, cumulative_ms in sorted(modules, key=lambda module: -module[1])[:top]:
+            click.echo(f'{name:<48}{self_ms:>10.1f}{cumulative_ms:>15.1f}')
+        click.echo(f'\nimport app: {total_ms:.1f} ms (budget {budget:.0f} ms)')
+        if total_ms > budget:
+            raise click.ClickException(f'App import took {total_ms:.1f} ms, over the {budget:.0f} ms budget')
+
+    return app
+
+
+app = create_app()
 
 if __name__ == '__main__':
+    ensure_indexes()
     update_existing_admins()
+    suggestion_index.rebuild()
     app.run()
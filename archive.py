@@ -0,0 +1,178 @@
+import operator
+import os
+from datetime import datetime
+from bson import json_util
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import db, ARCHIVE_DIR, ARCHIVE_AFTER_MONTHS, ARCHIVE_COMPRESSION
+from partitions import PREFIX, archive_path, hot_months
+
+# Cold tier for completed records: a closed month is written to one Parquet file, sorted by
+# handler and checkout time so row-group statistics let reads skip most of the file, and the
+# archived records are deleted from its MongoDB partition. Imported only when a job or a report
+# touches archived months.
+
+SCHEMA = pa.schema([
+    ('_id', pa.string()),
+    ('vehicle_number', pa.string()),
+    ('handled_by', pa.string()),
+    ('checkout_by', pa.string()),
+    ('checkin_time', pa.timestamp('us')),
+    ('checkout_time', pa.timestamp('us')),
+    ('initial_payment', pa.float64()),
+    ('additional_charge', pa.float64()),
+    ('total_charge', pa.float64()),
+    ('initial_payment_mode', pa.string()),
+    ('additional_payment_mode', pa.string()),
+    # Any other fields (older record layouts), as extended JSON
+    ('extra', pa.string())
+])
+COLUMNS = [field.name for field in SCHEMA if field.name != 'extra']
+NUMERIC_COLUMNS = {'initial_payment', 'additional_charge', 'total_charge'}
+# Columns and comparisons pushed down to the Parquet reader
+PUSHDOWN_COLUMNS = ('_id', 'vehicle_number', 'handled_by', 'checkout_time')
+PUSHDOWN_OPERATORS = {'$eq': operator.eq, '$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le}
+
+# Query operators the archive reader evaluates; report and job filters only use these
+OPERATORS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value is not None and value > operand,
+    '$gte': lambda value, operand: value is not None and value >= operand,
+    '$lt': lambda value, operand: value is not None and value < operand,
+    '$lte': lambda value, operand: value is not None and value <= operand,
+    '$in': lambda value, operand: value in operand
+}
+
+
+def _row(record):
+    row = {}
+    for column in COLUMNS:
+        value = record.get(column)
+        if column == '_id':
+            value = json_util.dumps(value)
+        elif column in NUMERIC_COLUMNS and value is not None:
+            value = float(value)
+        row[column] = value
+    extra = {key: value for key, value in record.items() if key not in COLUMNS}
+    row['extra'] = json_util.dumps(extra) if extra else None
+    return row
+
+
+def _record(row):
+    record = {key: value for key, value in row.items() if key != 'extra' and value is not None}
+    record['_id'] = json_util.loads(row['_id'])
+    if row.get('extra'):
+        record.update(json_util.loads(row['extra']))
+    return record
+
+
+def archive_month(month, batch_size=10000):
+    # Writes completed_records_<month> to its Parquet file, carrying over the rows of an earlier
+    # file for the month, then deletes the archived records from the partition. The collection is
+    # not dropped: a late offline replay may still write to it, and whatever lands there during
+    # or after this run is read alongside the file until the next run picks it up.
+    collection = db[f'{PREFIX}_{month}']
+    path = archive_path(month)
+    partial = f'{path}.partial'
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    archived_ids = []
+    carried = 0
+    writer = pq.ParquetWriter(partial, SCHEMA, compression=ARCHIVE_COMPRESSION)
+    try:
+        batch = []
+        cursor = collection.find({}).sort([('handled_by', 1), ('checkout_time', -1)]).batch_size(batch_size)
+        for record in cursor:
+            archived_ids.append(record['_id'])
+            batch.append(_row(record))
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=SCHEMA))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=SCHEMA))
+        if os.path.exists(path):
+            # Rows read again from the partition (an earlier run stopped before clearing it) replace
+            # their copies in the old file
+            rewritten = pa.array([json_util.dumps(_id) for _id in archived_ids], pa.string())
+            for existing in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                table = pa.Table.from_batches([existing])
+                table = table.filter(pc.invert(pc.is_in(table['_id'], value_set=rewritten)))
+                writer.write_table(table)
+                carried += table.num_rows
+    finally:
+        writer.close()
+
+    if pq.ParquetFile(partial).metadata.num_rows != len(archived_ids) + carried:
+        os.remove(partial)
+        raise RuntimeError(f'{PREFIX}_{month}: archive file is incomplete')
+    os.replace(partial, path)
+    for start in range(0, len(archived_ids), batch_size):
+        collection.delete_many({'_id': {'$in': archived_ids[start:start + batch_size]}})
+    return len(archived_ids)
+
+
+def closed_months(keep_months=ARCHIVE_AFTER_MONTHS, now=None):
+    # Hot partitions holding records, older than the newest keep_months months (the current
+    # month always stays)
+    now = now or datetime.now()
+    index = now.year * 12 + now.month - 1 - (max(keep_months, 1) - 1)
+    cutoff = f'{index // 12:04d}{index % 12 + 1:02d}'
+    return [month for month in hot_months()
+            if month < cutoff and db[f'{PREFIX}_{month}'].find_one({}, {'_id': 1}) is not None]
+
+
+def archive_closed_months(keep_months=ARCHIVE_AFTER_MONTHS, batch_size=10000):
+    return [(month, archive_month(month, batch_size)) for month in closed_months(keep_months)]
+
+
+def _matches(record, query):
+    for field, condition in query.items():
+        value = record.get(field)
+        if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+            for operator, operand in condition.items():
+                if operator not in OPERATORS:
+                    raise ValueError(f'Archived records do not support {operator} queries')
+                if not OPERATORS[operator](value, operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _pushdown(query):
+    # Arrow filter for the conditions row-group statistics can prune on; _matches() still checks every row
+    expression = None
+    for field, condition in query.items():
+        if field not in PUSHDOWN_COLUMNS:
+            continue
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for op, operand in condition.items():
+            if op not in PUSHDOWN_OPERATORS or operand is None or (field == '_id' and op != '$eq'):
+                continue
+            if field == '_id':
+                operand = json_util.dumps(operand)
+            part = PUSHDOWN_OPERATORS[op](ds.field(field), operand)
+            expression = part if expression is None else expression & part
+    return expression
+
+
+def read_archive(path, query, projection=None, batch_size=None):
+    # Records in an archive file matching a find() filter, shaped like the MongoDB documents
+    dataset = ds.dataset(path, format='parquet')
+    for batch in dataset.to_batches(filter=_pushdown(query), batch_size=batch_size or 10000):
+        for row in batch.to_pylist():
+            record = _record(row)
+            if not _matches(record, query):
+                continue
+            if projection:
+                included = [key for key, value in projection.items() if value and key != '_id']
+                if included:
+                    record = {key: record[key] for key in ['_id'] + included if key in record}
+                if not projection.get('_id', 1):
+                    record.pop('_id', None)
+            yield record
+
@@ -0,0 +1,17 @@
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app
+from async_app import app as async_app, ASYNC_PATHS, mirror_url_rules
+
+# ASGI entry point: check-in, checkout, suggestions and the admin dashboard run as coroutines
+# on Motor, everything else is the Flask app. Run with e.g.
+#   hypercorn --workers 4 --bind 0.0.0.0:8000 asgi:application
+mirror_url_rules(flask_app)
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+async def application(scope, receive, send):
+    # Lifespan events go to the async app so each worker opens and closes its Motor client
+    if scope['type'] == 'lifespan' or scope.get('path') in ASYNC_PATHS:
+        await async_app(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
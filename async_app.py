@@ -0,0 +1,88 @@
+import time
+from pymongo.errors import ConnectionFailure
+from quart import Quart, g, request
+from config import SECRET_KEY
+from metrics import request_latency
+from offline_journal import offline_journal
+import async_db
+
+from async_routes import (
+    admin_dashboard,
+    checkin,
+    checkout,
+    get_vehicle_suggestions
+)
+
+# Async serving mode for the booth endpoints. asgi.py sends these URLs here and every other
+# URL to the Flask app; both sign the session cookie with the same key and format.
+app = Quart(__name__)
+app.secret_key = SECRET_KEY
+
+@app.before_serving
+async def open_database():
+    async_db.connect()
+    # Replays offline booth entries in the background (only when OFFLINE_JOURNAL_PATH is set)
+    offline_journal.start_sync()
+    await ensure_indexes()
+
+async def ensure_indexes():
+    # Check-in relies on the unique index to reject duplicates. An offline booth can start
+    # without MongoDB; the first request after it is back creates the indexes.
+    try:
+        await async_db.ensure_indexes()
+    except ConnectionFailure:
+        if not offline_journal.enabled:
+            raise
+
+@app.after_serving
+async def close_database():
+    async_db.close()
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+async def ensure_indexes_before_serving():
+    if not async_db.indexes_ensured():
+        await ensure_indexes()
+
+@app.after_request
+async def record_request_metrics(response):
+    # Round trips are not counted here: Motor runs commands on its own threads
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_latency.observe(time.perf_counter() - started, request.endpoint or 'unknown',
+                                request.method, str(response.status_code))
+    return response
+
+# Same URLs and endpoint names as app.py
+@app.route('/admin_dashboard')
+async def route_admin_dashboard():
+    return await admin_dashboard()
+
+@app.route('/route_checkin', methods=['POST'])
+async def route_checkin():
+    return await checkin()
+
+@app.route('/route_checkout', methods=['POST'])
+async def route_checkout():
+    return await checkout()
+
+@app.route('/route_get_vehicle_suggestions')
+async def route_get_vehicle_suggestions():
+    return await get_vehicle_suggestions()
+
+# Paths served by this app
+ASYNC_PATHS = {rule.rule for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+
+
+def mirror_url_rules(flask_app):
+    # url_for() in templates and redirects has to resolve the Flask-only endpoints too. They are
+    # registered without a view, since the dispatcher never routes those paths here.
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint not in app.view_functions:
+            app.add_url_rule(rule.rule, rule.endpoint, methods=rule.methods - {'HEAD', 'OPTIONS'})
+    for key, value in flask_app.config.items():
+        if key.startswith('SESSION_') or key == 'PERMANENT_SESSION_LIFETIME':
+            app.config[key] = value
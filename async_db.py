@@ -0,0 +1,74 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import MONGO_URI, MONGO_DB_NAME, mongo_client_options
+from cache import user_cache, rate_cache, user_rate_pipeline, cache_user_rate
+from datetime import datetime
+from indexes import INDEXES
+from partitions import PARTITION_INDEXES, ensured_partitions, partition_name
+
+# Motor client for the async serving mode. It is bound to the event loop it is created on,
+# so each worker process opens its own when it starts serving.
+_client = None
+_indexes_ensured = False
+
+
+def connect():
+    global _client
+    _client = AsyncIOMotorClient(MONGO_URI, **mongo_client_options())
+
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def get_client():
+    return _client
+
+
+def get_db():
+    return _client[MONGO_DB_NAME]
+
+
+async def ensure_indexes():
+    global _indexes_ensured
+    for collection_name, indexes in INDEXES.items():
+        if indexes:
+            await get_db()[collection_name].create_indexes(indexes)
+    await partition_for(datetime.now())
+    _indexes_ensured = True
+
+
+def indexes_ensured():
+    return _indexes_ensured
+
+
+async def partition_for(moment):
+    # Async counterpart of partitions.partition_for()
+    name = partition_name(moment)
+    if name not in ensured_partitions:
+        await get_db()[name].create_indexes(PARTITION_INDEXES)
+        ensured_partitions.add(name)
+    return get_db()[name]
+
+
+# Same caches as the sync routes, so a worker serving both keeps one copy of each user and rate
+
+async def get_rate(rate_id):
+    rate = rate_cache.get(rate_id)
+    if rate is None:
+        rate = await get_db().rates.find_one({'_id': rate_id})
+        if rate:
+            rate_cache.set(rate_id, rate)
+    return rate
+
+
+async def get_user_rate(username):
+    # Returns (user, rate); a user cache miss loads both in one round trip
+    user = user_cache.get(username)
+    if user is not None:
+        return user, await get_rate(user['rate_id'])
+
+    users = await get_db().users.aggregate(user_rate_pipeline(username)).to_list(1)
+    return cache_user_rate(username, users[0] if users else None)
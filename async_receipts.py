@@ -0,0 +1,10 @@
+from quart import current_app
+from receipts import compact_receipt, receipt_template_name
+
+
+async def receipt_payload(kind, fields, values):
+    # Async counterpart of receipts.receipt_payload; Quart's Jinja environment renders asynchronously
+    if (values.get('receipt_format') or '').lower() == 'compact':
+        return compact_receipt(kind, fields)
+    template = current_app.jinja_env.get_template(receipt_template_name(kind))
+    return {'receipt': await template.render_async(**fields)}
@@ -0,0 +1,13 @@
+# Coroutine versions of the booth endpoints, served by async_app.py
+
+from .admin_dashboard import admin_dashboard
+from .checkin import checkin
+from .checkout import checkout
+from .get_vehicle_suggestions import get_vehicle_suggestions
+
+__all__ = [
+    'admin_dashboard',
+    'checkin',
+    'checkout',
+    'get_vehicle_suggestions'
+]
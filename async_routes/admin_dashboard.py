@@ -0,0 +1,25 @@
+from quart import session, redirect, url_for, render_template, make_response
+from datetime import datetime
+import time
+from async_db import get_db
+from routes.admin_dashboard import dashboard_pipeline, dashboard_context, server_timing
+
+async def admin_dashboard():
+    if not session.get('is_admin'):
+        return redirect(url_for('route_login'))
+
+    current_admin = session['username']
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    timings = {}
+
+    started = time.perf_counter()
+    dashboard = (await get_db().users.aggregate(dashboard_pipeline(current_admin, today_start)).to_list(1))[0]
+    timings['users_vehicles'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = await make_response(await render_template('admin_dashboard.html',
+                         **dashboard_context(dashboard, current_admin)))
+    timings['render'] = time.perf_counter() - started
+
+    response.headers['Server-Timing'] = server_timing(timings)
+    return response
@@ -0,0 +1,86 @@
+import asyncio
+from quart import session, redirect, url_for, request, jsonify
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from async_db import get_db, get_user_rate
+from async_receipts import receipt_payload
+from suggestion_index import suggestion_index
+from receipts import checkin_receipt_fields
+from offline_journal import offline_journal
+from routes.checkin import new_ticket, record_offline_checkin
+
+async def checkin_offline(vehicle_number, payment_mode, handler_username, values, ticket_id=None):
+    # Same journal as the sync route; SQLite calls run on a worker thread to keep the loop free
+    response, receipt_fields = await asyncio.to_thread(
+        record_offline_checkin, vehicle_number, payment_mode, handler_username, ticket_id)
+    if receipt_fields:
+        response.update(await receipt_payload('checkin', receipt_fields, values))
+    return jsonify(response)
+
+async def checkin():
+    if 'username' not in session:
+        return redirect(url_for('route_login'))
+    
+    ticket = None
+    try:
+        values = await request.values
+        vehicle_number = values['vehicle_number'].upper()
+        payment_mode = values['payment_mode']
+        handler_username = session['username']
+        
+        # Keep journal order: while offline entries are pending, new ones queue behind them
+        if offline_journal.enabled and await asyncio.to_thread(offline_journal.has_pending):
+            return await checkin_offline(vehicle_number, payment_mode, handler_username, values)
+        
+        # Get the user and their rate, served from the in-process cache when warm
+        user, rate = await get_user_rate(handler_username)
+        if not user:
+            return jsonify({
+                'error': True,
+                'message': 'User not found!'
+            })
+            
+        if not rate:
+            return jsonify({
+                'error': True,
+                'message': 'Rate configuration not found!'
+            })
+        
+        # The unique partial index on active (vehicle_number, handled_by) rejects duplicates
+        checkin_time = datetime.now()
+        try:
+            ticket = new_ticket(vehicle_number, payment_mode, handler_username, rate, checkin_time)
+            await get_db().vehicles.insert_one(ticket)
+        except DuplicateKeyError:
+            return jsonify({
+                'error': True,
+                'message': f'Vehicle {vehicle_number} is already checked in under your account!'
+            })
+        suggestion_index.add(handler_username, vehicle_number)
+        if offline_journal.enabled:
+            # Local copies that let this booth keep working if the link drops
+            await asyncio.to_thread(offline_journal.mirror_checkin, ticket)
+            await asyncio.to_thread(offline_journal.remember_rate, handler_username, rate)
+        
+        receipt = await receipt_payload('checkin', checkin_receipt_fields(
+            vehicle_number, checkin_time, rate, payment_mode, handler_username), values)
+        
+        return jsonify({
+            'success': True,
+            'message': f'Vehicle {vehicle_number} has been successfully checked in!',
+            **receipt
+        })
+                            
+    except ConnectionFailure as e:
+        if offline_journal.enabled:
+            return await checkin_offline(vehicle_number, payment_mode, handler_username, values,
+                                         ticket.get('_id') if ticket else None)
+        return jsonify({
+            'error': True,
+            'message': f'Error during check-in: {str(e)}'
+        })
+    except Exception as e:
+        return jsonify({
+            'error': True,
+            'message': f'Error during check-in: {str(e)}'
+        })
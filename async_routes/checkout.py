@@ -0,0 +1,173 @@
+import asyncio
+from quart import request, session, redirect, url_for, jsonify
+from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from config import MONGO_TRANSACTIONS
+from async_db import get_client, get_db, get_rate, partition_for
+from async_receipts import receipt_payload
+from suggestion_index import suggestion_index
+from rollups import rollup_updates
+from partitions import find_one_completed
+from receipts import checkout_receipt_fields
+from report_cache import report_cache
+from offline_journal import offline_journal
+from routes.checkout import (
+    CheckoutAborted,
+    additional_payment_response,
+    already_checked_out,
+    closed_elsewhere_filter,
+    calculate_checkout_charges,
+    checkout_claim_filter,
+    checkout_timestamp,
+    completed_record_for,
+    record_offline_checkout,
+    unclaimed_response
+)
+
+
+async def get_checkout_rate(vehicle, db_session=None):
+    # Tickets checked in before the rate snapshot was stored fall back to the rates collection
+    if vehicle.get('rate'):
+        return vehicle['rate']
+    if db_session is None:
+        return await get_rate(vehicle.get('rate_id'))
+    return await get_db().rates.find_one({'_id': vehicle.get('rate_id')}, session=db_session)
+
+
+async def claim_and_complete(db_session, vehicle_filter, payment_mode, checkout_time, checkout_by):
+    # Same order as the sync route: completed record first, then the ticket is removed
+    db = get_db()
+    vehicle = await db.vehicles.find_one(
+        checkout_claim_filter(vehicle_filter, payment_mode, checkout_time), session=db_session)
+    if not vehicle:
+        return None
+    
+    rate = await get_checkout_rate(vehicle, db_session)
+    if not rate:
+        raise CheckoutAborted({
+            'error': True,
+            'message': 'Rate configuration not found!'
+        })
+    
+    additional_charge, total_charge = calculate_checkout_charges(vehicle, rate, checkout_time)
+    if additional_charge > 0 and not payment_mode:
+        raise CheckoutAborted(additional_payment_response(
+            vehicle, rate, checkout_time, additional_charge, total_charge))
+    
+    completed_record = completed_record_for(
+        vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, checkout_by)
+    partition = await partition_for(checkout_time)
+    try:
+        await partition.insert_one(completed_record, session=db_session)
+    except DuplicateKeyError:
+        if db_session is not None:
+            raise
+        await db.vehicles.delete_one({'_id': vehicle['_id']})
+        raise already_checked_out(vehicle)
+    
+    removed = (await db.vehicles.delete_one({'_id': vehicle['_id']}, session=db_session)).deleted_count
+    if not removed and await asyncio.to_thread(
+            find_one_completed, closed_elsewhere_filter(vehicle, checkout_time), {'_id': 1}):
+        await partition.delete_one({'_id': vehicle['_id']}, session=db_session)
+        raise already_checked_out(vehicle)
+    
+    try:
+        await db.daily_rollups.bulk_write(rollup_updates(completed_record), ordered=False, session=db_session)
+    except Exception as e:
+        if db_session is not None:
+            raise
+        # The checkout itself is recorded; `flask backfill-rollups` repairs the totals
+        print(f"Error updating daily rollups: {str(e)}")
+    
+    return {
+        'vehicle': vehicle,
+        'rate': rate,
+        'additional_charge': additional_charge,
+        'total_charge': total_charge
+    }
+
+
+async def checkout_vehicle(vehicle_filter, payment_mode, checkout_time, checkout_by):
+    if MONGO_TRANSACTIONS:
+        async with await get_client().start_session() as db_session:
+            result = await db_session.with_transaction(
+                lambda s: claim_and_complete(s, vehicle_filter, payment_mode, checkout_time, checkout_by))
+    else:
+        result = await claim_and_complete(None, vehicle_filter, payment_mode, checkout_time, checkout_by)
+    if result:
+        # A ticket from an earlier day leaves that day's check-in reports
+        report_cache.invalidate(result['vehicle'].get('handled_by'), result['vehicle'].get('checkin_time'), checkout_time)
+    return result
+
+
+async def checkout_offline(vehicle_number, payment_mode, handler_username, values):
+    # Same journal as the sync route; SQLite calls run on a worker thread to keep the loop free
+    response, receipt_fields = await asyncio.to_thread(
+        record_offline_checkout, vehicle_number, payment_mode, handler_username)
+    if receipt_fields:
+        response.update(await receipt_payload('checkout', receipt_fields, values))
+    return jsonify(response)
+
+
+async def checkout():
+    if 'username' not in session:
+        return redirect(url_for('route_login'))
+    
+    try:
+        values = await request.values
+        vehicle_number = values.get('vehicle_number', '').upper()
+        payment_mode = values.get('payment_mode')
+        handler_username = session['username']
+        
+        # Keep journal order: while offline entries are pending, new ones queue behind them
+        if offline_journal.enabled and await asyncio.to_thread(offline_journal.has_pending):
+            return await checkout_offline(vehicle_number, payment_mode, handler_username, values)
+        
+        checkout_time = checkout_timestamp()
+        
+        try:
+            result = await checkout_vehicle({
+                'vehicle_number': vehicle_number,
+                'handled_by': handler_username,
+                'checkout_time': None
+            }, payment_mode, checkout_time, handler_username)
+        except CheckoutAborted as e:
+            return jsonify(e.payload)
+        
+        if not result:
+            active_vehicles = await get_db().vehicles.find({
+                'vehicle_number': vehicle_number,
+                'checkout_time': None
+            }).to_list(None)
+            vehicle = next((v for v in active_vehicles if v.get('handled_by') == handler_username), None)
+            rate = await get_checkout_rate(vehicle) if vehicle else None
+            return jsonify(unclaimed_response(vehicle_number, active_vehicles, vehicle, rate, checkout_time))
+        
+        vehicle = result['vehicle']
+        suggestion_index.remove(vehicle.get('handled_by'), vehicle['vehicle_number'])
+        if offline_journal.enabled:
+            await asyncio.to_thread(offline_journal.mirror_checkout, vehicle['vehicle_number'], vehicle.get('handled_by'))
+        
+        receipt = await receipt_payload('checkout', checkout_receipt_fields(
+            vehicle, result['rate'], checkout_time, result['additional_charge'], result['total_charge'],
+            payment_mode, handler_username), values)
+        
+        return jsonify({
+            'success': True,
+            'message': f'Vehicle {vehicle_number} has been successfully checked out!',
+            **receipt
+        })
+                            
+    except ConnectionFailure as e:
+        if offline_journal.enabled:
+            return await checkout_offline(vehicle_number, payment_mode, handler_username, values)
+        print(f"Error during check-out: {str(e)}")
+        return jsonify({
+            'error': True,
+            'message': f'Error during check-out: {str(e)}'
+        })
+    except Exception as e:
+        print(f"Error during check-out: {str(e)}")  # Debug print
+        return jsonify({
+            'error': True,
+            'message': f'Error during check-out: {str(e)}'
+        })
@@ -0,0 +1,36 @@
+import asyncio
+from quart import request, jsonify, session
+from pymongo.errors import ConnectionFailure
+from async_db import get_db
+from suggestion_index import suggestion_index
+from offline_journal import offline_journal
+
+async def get_vehicle_suggestions():
+    query = request.args.get('query', '').upper()
+    if len(query) < 2:
+        return jsonify({'suggestions': []})
+    
+    handler_username = session.get('username')
+    if not handler_username:
+        return jsonify({'suggestions': []})
+    
+    # Served from the same in-memory prefix index as the sync route
+    suggestions = suggestion_index.suggest(handler_username, query, 5)
+    if suggestions is None:
+        # Index is stale for this user, reload their active plates from the database
+        since = suggestion_index.begin_load()
+        try:
+            numbers = await get_db().vehicles.distinct(
+                'vehicle_number', {'handled_by': handler_username, 'checkout_time': None})
+        except BaseException as e:
+            suggestion_index.abort_load()
+            if not isinstance(e, ConnectionFailure) or not offline_journal.enabled:
+                raise
+            # Offline: suggest from the booth's local copy of the active tickets
+            return jsonify({'suggestions': await asyncio.to_thread(
+                offline_journal.active_plates, handler_username, query, 5)})
+        # Check-ins and checkouts that happened while the query was awaited are replayed on top
+        suggestion_index.set_handler(handler_username, numbers, since)
+        suggestions = suggestion_index.suggest(handler_username, query, 5)
+    
+    return jsonify({'suggestions': suggestions or []})
@@ -0,0 +1 @@
+# Request-workflow benchmarks; run with `python -m benchmarks.run --help`
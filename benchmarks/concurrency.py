@@ -0,0 +1,184 @@
+import http.client
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+import click
+
+from benchmarks.run import REPO_ROOT, git_revision
+
+# Servers compared by default: the Flask app as app.py serves it, and the ASGI dispatcher
+SERVER_COMMANDS = {
+    'sync': '{python} -m flask --app app run --port {port} --with-threads',
+    'async': '{python} -m hypercorn --workers {workers} --bind 127.0.0.1:{port} asgi:application'
+}
+
+
+class HttpResponse:
+    def __init__(self, status, headers, body):
+        self.status_code = status
+        self.headers = headers
+        self._body = body
+
+    def get_json(self, silent=False):
+        try:
+            return json.loads(self._body)
+        except ValueError:
+            if silent:
+                return None
+            raise
+
+
+class HttpClient:
+    # One keep-alive connection with the test-client calls the workloads use
+
+    def __init__(self, port):
+        self._connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self._cookie = None
+
+    def _send(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self._cookie:
+            headers['Cookie'] = self._cookie
+        self._connection.request(method, path, body=body, headers=headers)
+        response = self._connection.getresponse()
+        body = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self._cookie = cookie.split(';', 1)[0]
+        return HttpResponse(response.status, response.headers, body)
+
+    def get(self, path, query_string=None):
+        if query_string:
+            path = f'{path}?{urlencode(query_string)}'
+        return self._send('GET', path)
+
+    def post(self, path, data=None):
+        return self._send('POST', path, urlencode(data or {}),
+                          {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def close(self):
+        self._connection.close()
+
+
+def start_server(command, port, workers, env):
+    args = shlex.split(command.format(python=shlex.quote(sys.executable), port=port, workers=workers))
+    process = subprocess.Popen(args, cwd=REPO_ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(f'Server exited early: {command}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/login')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise click.ClickException(f'Server did not start within 60s: {command}')
+
+
+def run_mode(command, port, workers, connections, vehicles, typed, seed, db):
+    # Every connection is one booth: check-in burst, suggestion typing, then on-time checkouts
+    from benchmarks.workloads import (
+        Recorder, STAFF_PASSWORD, seed_data, make_plates,
+        checkin_burst, suggestion_typing, checkout_within_initial
+    )
+
+    staff = seed_data(db, connections)
+    plates = make_plates(connections * vehicles, random.Random(seed))
+    env = dict(os.environ)
+    process = start_server(command, port, workers, env)
+    clients = []
+    try:
+        booths = []
+        for i, username in enumerate(staff):
+            client = HttpClient(port)
+            client.post('/login', data={'username': username, 'password': STAFF_PASSWORD})
+            clients.append(client)
+            booths.append((client, plates[i::connections]))
+
+        recorder = Recorder(count_round_trips=False)
+        recorder.phase('checkin', connections, [
+            lambda b=b: checkin_burst(recorder, b[0], b[1]) for b in booths])
+        recorder.phase('suggestions', connections, [
+            lambda b=b: suggestion_typing(recorder, b[0], b[1][:typed]) for b in booths])
+        recorder.phase('checkout', connections, [
+            lambda b=b: checkout_within_initial(recorder, b[0], b[1]) for b in booths])
+        return recorder.summary()
+    finally:
+        for client in clients:
+            client.close()
+        process.terminate()
+        process.wait(timeout=30)
+
+
+@click.command()
+@click.option('--mongo-uri', default='mongodb://localhost:27017', show_default=True)
+@click.option('--db-name', default='ParkingTokenSystemBench', show_default=True,
+              help='Database to use; it is emptied before each mode.')
+@click.option('--connections', default=32, show_default=True, help='Concurrent booth connections.')
+@click.option('--vehicles', default=50, show_default=True, help='Vehicles checked in per connection.')
+@click.option('--typed', default=5, show_default=True, help='Plates typed into the suggestion box per connection.')
+@click.option('--workers', default=1, show_default=True, help='Server worker processes for the async mode.')
+@click.option('--port', default=8765, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+@click.option('--sync-cmd', default=SERVER_COMMANDS['sync'], show_default=True,
+              help='Command serving app:app; {python}, {port} and {workers} are filled in.')
+@click.option('--async-cmd', default=SERVER_COMMANDS['async'], show_default=True,
+              help='Command serving asgi:application.')
+@click.option('--out', 'out_path', type=click.Path(dir_okay=False), help='Results file (default bench_results/concurrency-<time>-<commit>.json).')
+def main(mongo_uri, db_name, connections, vehicles, typed, workers, port, seed, sync_cmd, async_cmd, out_path):
+    # Sync vs async throughput under concurrent connections; needs a running MongoDB since the
+    # async mode talks to it through Motor
+    if db_name == 'ParkingTokenSystem':
+        raise click.UsageError('Refusing to run against the application database')
+    os.environ['MONGO_URI'] = mongo_uri
+    os.environ['MONGO_DB_NAME'] = db_name
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from config import db
+
+    commit, dirty = git_revision()
+    modes = {}
+    for mode, command in (('sync', sync_cmd), ('async', async_cmd)):
+        click.echo(f'Running {mode}: {connections} connections x {vehicles} vehicles')
+        modes[mode] = run_mode(command, port, workers, connections, vehicles, typed, seed, db)
+
+    click.echo(f"{'endpoint':<14}{'sync req/s':>12}{'async req/s':>13}{'speedup':>9}{'sync p95':>10}{'async p95':>11}{'errors':>8}")
+    for label, sync_result in modes['sync'].items():
+        async_result = modes['async'].get(label)
+        if not async_result:
+            continue
+        speedup = async_result['throughput_rps'] / sync_result['throughput_rps'] if sync_result['throughput_rps'] else 0
+        errors = sync_result['errors'] + async_result['errors']
+        click.echo(f"{label:<14}{sync_result['throughput_rps']:>12}{async_result['throughput_rps']:>13}{speedup:>8.2f}x"
+                   f"{sync_result['latency_ms']['p95']:>10.2f}{async_result['latency_ms']['p95']:>11.2f}{errors:>8}")
+
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {'connections': connections, 'vehicles': vehicles, 'typed': typed, 'workers': workers, 'seed': seed},
+        'commands': {'sync': sync_cmd, 'async': async_cmd},
+        'modes': modes
+    }
+    if not out_path:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        out_path = os.path.join(REPO_ROOT, 'bench_results', f"concurrency-{stamp}-{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {out_path}')
+
+
+if __name__ == '__main__':
+    main()
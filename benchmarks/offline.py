@@ -0,0 +1,172 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import click
+
+from benchmarks.run import REPO_ROOT, git_revision
+from benchmarks.concurrency import HttpClient, start_server, SERVER_COMMANDS
+
+
+def start_mongod(mongod, dbpath, port):
+    process = subprocess.Popen([mongod, '--dbpath', dbpath, '--port', str(port), '--bind_ip', '127.0.0.1'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    from pymongo import MongoClient
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            MongoClient(f'mongodb://127.0.0.1:{port}', serverSelectionTimeoutMS=500).admin.command('ping')
+            return process
+        except Exception:
+            if process.poll() is not None:
+                raise click.ClickException(f'mongod exited early ({mongod})')
+            time.sleep(0.2)
+    process.kill()
+    raise click.ClickException('mongod did not start within 30s')
+
+
+def wait_for_drain(admin, timeout):
+    # Polls the journal status until every entry has been replayed
+    deadline = time.monotonic() + timeout
+    pending = None
+    while time.monotonic() < deadline:
+        status = admin.get('/route_offline_status').get_json()['journal']
+        if status['pending'] == 0:
+            return status
+        pending = status['pending']
+        time.sleep(0.5)
+    raise click.ClickException(f'Journal still has {pending} pending entries after {timeout}s')
+
+
+@click.command()
+@click.option('--mongod', 'mongod_bin', default='mongod', show_default=True, help='mongod binary started (and killed) by the run.')
+@click.option('--mongo-port', default=27099, show_default=True)
+@click.option('--port', default=8766, show_default=True)
+@click.option('--staff', default=4, show_default=True)
+@click.option('--vehicles', default=40, show_default=True, help='Vehicles per staff member in each phase.')
+@click.option('--sync-interval', default=1.0, show_default=True, help='OFFLINE_SYNC_INTERVAL for the server.')
+@click.option('--drain-timeout', default=120, show_default=True)
+@click.option('--seed', default=1, show_default=True)
+@click.option('--out', 'out_path', type=click.Path(dir_okay=False), help='Results file (default bench_results/offline-<time>-<commit>.json).')
+def main(mongod_bin, mongo_port, port, staff, vehicles, sync_interval, drain_timeout, seed, out_path):
+    # One shift across a database outage: check in online, kill mongod, keep checking in and
+    # out against the journal, restart mongod and wait for the sync worker to drain the journal.
+    # Fails unless MongoDB ends up with exactly the tickets and completed records the booths issued.
+    if not shutil.which(mongod_bin) and not os.path.exists(mongod_bin):
+        raise click.UsageError(f'{mongod_bin} not found')
+    workdir = tempfile.mkdtemp(prefix='offline-bench-')
+    dbpath = os.path.join(workdir, 'db')
+    os.makedirs(dbpath)
+    mongo_uri = f'mongodb://127.0.0.1:{mongo_port}'
+    os.environ.update({
+        'MONGO_URI': mongo_uri,
+        'MONGO_DB_NAME': 'ParkingTokenSystemBench',
+        'OFFLINE_JOURNAL_PATH': os.path.join(workdir, 'journal.db'),
+        'OFFLINE_SYNC_INTERVAL': str(sync_interval),
+        'MONGO_SERVER_SELECTION_TIMEOUT_MS': '1000'
+    })
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.workloads import (
+        Recorder, ADMIN_USERNAME, STAFF_PASSWORD, seed_data, make_plates,
+        checkin_burst, checkout_within_initial
+    )
+
+    mongod = start_mongod(mongod_bin, dbpath, mongo_port)
+    server = None
+    clients = []
+    try:
+        from config import db
+        from partitions import find_completed
+        users = seed_data(db, staff)
+        plates = make_plates(staff * vehicles * 2, random.Random(seed))
+        server = start_server(SERVER_COMMANDS['sync'], port, 1, dict(os.environ))
+
+        booths = []
+        for i, username in enumerate(users):
+            client = HttpClient(port)
+            client.post('/login', data={'username': username, 'password': STAFF_PASSWORD})
+            clients.append(client)
+            own = plates[i::staff]
+            booths.append((client, own[:vehicles], own[vehicles:]))
+        admin = HttpClient(port)
+        admin.post('/login', data={'username': ADMIN_USERNAME, 'password': STAFF_PASSWORD})
+        clients.append(admin)
+
+        online = Recorder(count_round_trips=False)
+        online.phase('checkin', staff, [lambda b=b: checkin_burst(online, b[0], b[1]) for b in booths])
+
+        click.echo('Stopping mongod')
+        mongod.kill()
+        mongod.wait()
+        offline = Recorder(count_round_trips=False)
+        # New arrivals, then half of the vehicles that came in while the link was up leave
+        offline.phase('checkin', staff, [lambda b=b: checkin_burst(offline, b[0], b[2]) for b in booths])
+        offline.phase('checkout', staff, [
+            lambda b=b: checkout_within_initial(offline, b[0], b[1][:vehicles // 2]) for b in booths])
+
+        click.echo('Restarting mongod')
+        started = time.perf_counter()
+        mongod = start_mongod(mongod_bin, dbpath, mongo_port)
+        status = wait_for_drain(admin, drain_timeout)
+        drain_seconds = time.perf_counter() - started
+
+        expected_active = staff * (vehicles - vehicles // 2 + vehicles)
+        expected_completed = staff * (vehicles // 2)
+        active = db.vehicles.count_documents({'checkout_time': None})
+        completed = sum(1 for _ in find_completed({}, {'_id': 1}))
+        results = {
+            'commit': git_revision()[0],
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'params': {'staff': staff, 'vehicles': vehicles, 'sync_interval': sync_interval, 'seed': seed},
+            'online': online.summary(),
+            'offline': offline.summary(),
+            'drain_seconds': round(drain_seconds, 2),
+            'journal': {key: status[key] for key in ('synced', 'conflict_count', 'failed_count', 'pending')},
+            'mongo': {
+                'active': active,
+                'expected_active': expected_active,
+                'completed': completed,
+                'expected_completed': expected_completed
+            }
+        }
+    finally:
+        for client in clients:
+            client.close()
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        mongod.kill()
+        mongod.wait()
+
+    for phase in ('online', 'offline'):
+        for label, result in results[phase].items():
+            click.echo(f"{phase} {label}: {result['requests']} requests, {result['errors']} errors, "
+                       f"{result['throughput_rps']} req/s, p95 {result['latency_ms']['p95']:.2f} ms")
+    click.echo(f"Journal drained in {results['drain_seconds']}s: {results['journal']}")
+    click.echo(f"MongoDB: {results['mongo']}")
+
+    if not out_path:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        out_path = os.path.join(REPO_ROOT, 'bench_results', f"offline-{stamp}-{(results['commit'] or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {out_path}')
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    errors = sum(r['errors'] for phase in ('online', 'offline') for r in results[phase].values())
+    mongo = results['mongo']
+    if errors or results['journal']['conflict_count'] or results['journal']['failed_count'] or mongo['active'] != mongo['expected_active'] \
+            or mongo['completed'] != mongo['expected_completed']:
+        raise click.ClickException('Offline run lost or duplicated work')
+
+
+if __name__ == '__main__':
+    main()
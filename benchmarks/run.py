@@ -0,0 +1,130 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+import click
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_revision():
+    # Commit the results belong to, and whether the tree had uncommitted changes
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=REPO_ROOT, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def load_app(backend, mongo_uri, db_name):
+    client_factory = None
+    if backend == 'memory':
+        try:
+            import mongomock
+        except ImportError:
+            raise click.UsageError('The memory backend needs mongomock (pip install mongomock)')
+        client_factory = mongomock.MongoClient
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from app import create_app
+    from config import db
+    app = create_app(mongo_uri if backend == 'mongo' else None, db_name, client_factory=client_factory)
+    return app, db
+
+
+def compare_results(baseline, current, threshold):
+    # Prints the change per endpoint and returns the regressions beyond the threshold (percent)
+    regressions = []
+    click.echo(f"\nCompared with {baseline.get('commit') or 'unknown commit'}:")
+    for label, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(label)
+        if not before:
+            click.echo(f'  {label}: no baseline')
+            continue
+        changes = []
+        for key in ('p50', 'p95', 'p99'):
+            old, new = before['latency_ms'][key], result['latency_ms'][key]
+            change = (new - old) / old * 100 if old else 0
+            changes.append(f'{key} {old:.2f} -> {new:.2f} ms ({change:+.1f}%)')
+            if key == 'p95' and change > threshold:
+                regressions.append(f'{label} p95 latency {change:+.1f}%')
+        if before.get('throughput_rps') and result.get('throughput_rps'):
+            change = (result['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100
+            changes.append(f'throughput {change:+.1f}%')
+        if before.get('db_round_trips') and result.get('db_round_trips'):
+            old, new = before['db_round_trips']['mean'], result['db_round_trips']['mean']
+            changes.append(f'round trips {old} -> {new}')
+            # Round trips are deterministic, so any increase is a regression
+            if new > old:
+                regressions.append(f'{label} round trips {old} -> {new}')
+        click.echo(f'  {label}: ' + ', '.join(changes))
+    return regressions
+
+
+@click.command()
+@click.option('--backend', type=click.Choice(['memory', 'mongo']), default='memory', show_default=True,
+              help='memory uses mongomock; mongo needs a running server (round trips are only counted there).')
+@click.option('--mongo-uri', default='mongodb://localhost:27017', show_default=True)
+@click.option('--db-name', default='ParkingTokenSystemBench', show_default=True,
+              help='Database to use; it is emptied before the run.')
+@click.option('--staff', default=4, show_default=True, help='Staff accounts working the shift.')
+@click.option('--vehicles', default=100, show_default=True, help='Vehicles checked in per staff member.')
+@click.option('--typed', default=10, show_default=True, help='Plates typed into the suggestion box per staff member.')
+@click.option('--workers', default=1, show_default=True, help='Staff members served concurrently.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--out', 'out_path', type=click.Path(dir_okay=False), help='Results file (default bench_results/<time>-<commit>.json).')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), help='Earlier results file to compare against.')
+@click.option('--threshold', default=10.0, show_default=True, help='p95 regression (percent) that fails --compare.')
+def main(backend, mongo_uri, db_name, staff, vehicles, typed, workers, seed, out_path, baseline_path, threshold):
+    if db_name == 'ParkingTokenSystem':
+        raise click.UsageError('Refusing to run against the application database')
+
+    app, db = load_app(backend, mongo_uri, db_name)
+    from benchmarks.workloads import run_shift
+
+    commit, dirty = git_revision()
+    click.echo(f'Running shift: {staff} staff x {vehicles} vehicles on {backend} ({workers} workers)')
+    endpoints = run_shift(app, db, staff, vehicles, typed, workers, seed,
+                          count_round_trips=backend == 'mongo')
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'backend': backend,
+        'python': platform.python_version(),
+        'params': {'staff': staff, 'vehicles': vehicles, 'typed': typed, 'workers': workers, 'seed': seed},
+        'endpoints': endpoints
+    }
+
+    click.echo(f"{'endpoint':<22}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'trips':>7}")
+    for label, result in endpoints.items():
+        trips = result['db_round_trips']['mean'] if result['db_round_trips'] else '-'
+        click.echo(f"{label:<22}{result['requests']:>9}{result['errors']:>8}{result['throughput_rps']:>10}"
+                   f"{result['latency_ms']['p50']:>9.2f}{result['latency_ms']['p95']:>9.2f}"
+                   f"{result['latency_ms']['p99']:>9.2f}{trips:>7}")
+
+    if not out_path:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        out_path = os.path.join(REPO_ROOT, 'bench_results', f"{stamp}-{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {out_path}')
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != results['params'] or baseline.get('backend') != backend:
+            click.echo('Warning: baseline was recorded with different parameters or backend')
+        regressions = compare_results(baseline, results, threshold)
+        if regressions:
+            click.echo('Regressions: ' + '; '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import math
+import random
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+ADMIN_USERNAME = 'bench_admin'
+STAFF_PASSWORD = 'bench'
+
+# Rate used by every benchmark user: two hours included, then hourly extra charges
+BENCH_RATE = {
+    'initial_amount': 20.0,
+    'initial_duration': 2.0,
+    'extra_charge': 10.0,
+    'extra_charge_duration': 1.0
+}
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    # Collects per-endpoint latencies, round trips and errors from several worker threads
+
+    def __init__(self, count_round_trips=True):
+        self.count_round_trips = count_round_trips
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.round_trips = {}
+        self.errors = {}
+        self.elapsed = {}
+
+    def request(self, label, send, check):
+        started = time.perf_counter()
+        response = send()
+        latency = time.perf_counter() - started
+        # Only a real MongoDB reports commands to the monitor behind this header
+        round_trips = response.headers.get('X-DB-Round-Trips') if self.count_round_trips else None
+        ok = response.status_code == 200 and check(response.get_json(silent=True) or {})
+        with self._lock:
+            self.latencies.setdefault(label, []).append(latency)
+            if round_trips is not None:
+                self.round_trips.setdefault(label, []).append(int(round_trips))
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return response
+
+    def phase(self, label, workers, jobs):
+        # Runs one job per staff member concurrently; throughput is measured over the whole phase
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(job) for job in jobs]:
+                future.result()
+        self.elapsed[label] = self.elapsed.get(label, 0) + time.perf_counter() - started
+
+    def summary(self):
+        results = {}
+        for label, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            round_trips = self.round_trips.get(label)
+            elapsed = self.elapsed.get(label)
+            results[label] = {
+                'requests': len(latencies),
+                'errors': self.errors.get(label, 0),
+                'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+                'latency_ms': {
+                    'p50': round(percentile(latencies, 50) * 1000, 3),
+                    'p95': round(percentile(latencies, 95) * 1000, 3),
+                    'p99': round(percentile(latencies, 99) * 1000, 3),
+                    'mean': round(sum(latencies) / len(latencies) * 1000, 3)
+                },
+                'db_round_trips': {
+                    'mean': round(sum(round_trips) / len(round_trips), 2),
+                    'max': max(round_trips)
+                } if round_trips else None
+            }
+        return results
+
+
+def make_plates(count, rng):
+    # Plates in the usual state/district/series/number layout, unique within the run
+    plates = set()
+    while len(plates) < count:
+        plates.add('%s%02d%s%04d' % (
+            rng.choice(['KA', 'TN', 'KL', 'MH', 'AP']),
+            rng.randint(1, 60),
+            ''.join(rng.choice(string.ascii_uppercase) for _ in range(2)),
+            rng.randint(0, 9999)
+        ))
+    return sorted(plates)
+
+
+def seed_data(db, staff_count):
+    # Starts from an empty benchmark database with one admin, one rate and the staff accounts
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+
+    from indexes import ensure_indexes
+    ensure_indexes()
+
+    now = datetime.now()
+    rate_id = ObjectId()
+    db.rates.insert_one({'_id': rate_id, **BENCH_RATE})
+    db.admins.insert_one({'username': ADMIN_USERNAME, 'password': STAFF_PASSWORD, 'created_at': now})
+    staff = [f'bench_staff_{i}' for i in range(staff_count)]
+    db.users.insert_many([{
+        'username': username,
+        'password': STAFF_PASSWORD,
+        'rate_id': rate_id,
+        'created_by': ADMIN_USERNAME,
+        'created_at': now
+    } for username in staff])
+    return staff
+
+
+def backdate(db, username, plates, hours):
+    # Moves check-ins into the past so their checkout falls into the extra-charge period
+    db.vehicles.update_many(
+        {'vehicle_number': {'$in': plates}, 'handled_by': username, 'checkout_time': None},
+        {'$set': {'checkin_time': datetime.now() - timedelta(hours=hours)}}
+    )
+
+
+def checkin_burst(recorder, client, plates):
+    for plate in plates:
+        recorder.request('checkin', lambda: client.post('/route_checkin', data={
+            'vehicle_number': plate,
+            'payment_mode': 'Cash',
+            'receipt_format': 'compact'
+        }), lambda data: data.get('success'))
+
+
+def suggestion_typing(recorder, client, plates):
+    # One request per keystroke once the two-character minimum is reached
+    for plate in plates:
+        for length in range(2, len(plate) + 1):
+            recorder.request('suggestions', lambda: client.get(
+                '/route_get_vehicle_suggestions', query_string={'query': plate[:length]}),
+                lambda data: 'suggestions' in data)
+
+
+def checkout_within_initial(recorder, client, plates):
+    for plate in plates:
+        recorder.request('checkout', lambda: client.post('/route_checkout', data={
+            'vehicle_number': plate,
+            'receipt_format': 'compact'
+        }), lambda data: data.get('success'))
+
+
+def checkout_quote(recorder, client, plates):
+    # Without a payment mode an overstayed ticket is only priced, not closed
+    for plate in plates:
+        recorder.request('checkout_quote', lambda: client.post('/route_checkout', data={
+            'vehicle_number': plate,
+            'receipt_format': 'compact'
+        }), lambda data: data.get('needsAdditionalPayment'))
+
+
+def checkout_with_additional(recorder, client, plates):
+    for plate in plates:
+        recorder.request('checkout_additional', lambda: client.post('/route_checkout', data={
+            'vehicle_number': plate,
+            'payment_mode': 'UPI',
+            'receipt_format': 'compact'
+        }), lambda data: data.get('success'))
+
+
+def run_shift(app, db, staff_count, vehicles, typed, workers, seed, count_round_trips=True):
+    # One shift: every staff member checks in a burst of vehicles, types a few plates into
+    # the suggestion box, then checks out half on time and asks for and settles the extra
+    # charge on the other half
+    rng = random.Random(seed)
+    staff = seed_data(db, staff_count)
+    plates = make_plates(staff_count * vehicles, rng)
+    shifts = []
+    for i, username in enumerate(staff):
+        client = app.test_client()
+        client.post('/login', data={'username': username, 'password': STAFF_PASSWORD})
+        own = plates[i::staff_count]
+        rng.shuffle(own)
+        half = len(own) // 2
+        shifts.append({
+            'username': username,
+            'client': client,
+            'plates': own,
+            'typed': own[:typed],
+            'on_time': own[:half],
+            'overstay': own[half:]
+        })
+
+    recorder = Recorder(count_round_trips)
+    recorder.phase('checkin', workers, [
+        lambda s=s: checkin_burst(recorder, s['client'], s['plates']) for s in shifts])
+    recorder.phase('suggestions', workers, [
+        lambda s=s: suggestion_typing(recorder, s['client'], s['typed']) for s in shifts])
+    recorder.phase('checkout', workers, [
+        lambda s=s: checkout_within_initial(recorder, s['client'], s['on_time']) for s in shifts])
+
+    for s in shifts:
+        backdate(db, s['username'], s['overstay'], BENCH_RATE['initial_duration'] + 1.5)
+    recorder.phase('checkout_quote', workers, [
+        lambda s=s: checkout_quote(recorder, s['client'], s['overstay']) for s in shifts])
+    recorder.phase('checkout_additional', workers, [
+        lambda s=s: checkout_with_additional(recorder, s['client'], s['overstay']) for s in shifts])
+    return recorder.summary()
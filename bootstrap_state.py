@@ -0,0 +1,26 @@
+from cache import TTLCache
+from config import admins_collection, BOOTSTRAP_STATE_TTL
+
+# Whether the system is initialized, i.e. at least one admin account exists. setup_default_user
+# asks on every request, so a positive answer is cached for BOOTSTRAP_STATE_TTL seconds (an admin
+# deleted through another worker is noticed within that time). An uninitialized system is checked
+# again on every request until the first admin registers.
+_state = TTLCache(1, BOOTSTRAP_STATE_TTL)
+
+
+def is_initialized():
+    if _state.get('initialized'):
+        return True
+    initialized = admins_collection.find_one({}, {'_id': 1}) is not None
+    if initialized:
+        _state.set('initialized', True)
+    return initialized
+
+
+def invalidate():
+    # Called after admins are created or deleted in this process
+    _state.clear()
+
+
+def bootstrap_stats():
+    return _state.stats()
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from config import users_collection, rates_collection, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+from metrics import register_collector
+
+
+class TTLCache:
+    # Bounded LRU cache whose entries also expire after ttl seconds
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+user_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+rate_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+
+def get_rate(rate_id):
+    rate = rate_cache.get(rate_id)
+    if rate is None:
+        rate = rates_collection.find_one({'_id': rate_id})
+        if rate:
+            rate_cache.set(rate_id, rate)
+    return rate
+
+
+def user_rate_pipeline(username):
+    return [
+        {'$match': {'username': username}},
+        {'$limit': 1},
+        {
+            '$lookup': {
+                'from': 'rates',
+                'localField': 'rate_id',
+                'foreignField': '_id',
+                'as': 'rate'
+            }
+        }
+    ]
+
+
+def cache_user_rate(username, user):
+    # Splits the joined rate off an aggregated user document and primes both caches
+    if not user:
+        return None, None
+
+    rates = user.pop('rate')
+    rate = rates[0] if rates else None
+    user_cache.set(username, user)
+    if rate:
+        rate_cache.set(rate['_id'], rate)
+    return user, rate
+
+
+def get_user_rate(username):
+    # Returns (user, rate); a user cache miss loads both in one round trip
+    user = user_cache.get(username)
+    if user is not None:
+        return user, get_rate(user['rate_id'])
+
+    return cache_user_rate(username, next(users_collection.aggregate(user_rate_pipeline(username)), None))
+
+
+def invalidate_user(username):
+    # This process only; other workers catch up within CACHE_TTL_SECONDS (see config)
+    user_cache.invalidate(username)
+
+
+def invalidate_rate(rate_id):
+    rate_cache.invalidate(rate_id)
+
+
+def cache_stats():
+    return {
+        'users': user_cache.stats(),
+        'rates': rate_cache.stats()
+    }
+
+
+def _cache_metrics():
+    lines = []
+    for field, metric_type, help_text in (
+        ('hits', 'counter', 'Cache lookups served from memory.'),
+        ('misses', 'counter', 'Cache lookups that went to the database.'),
+        ('size', 'gauge', 'Entries currently cached.')
+    ):
+        name = f'app_cache_{field}_total' if metric_type == 'counter' else f'app_cache_{field}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for cache_name, stats in cache_stats().items():
+            lines.append(f'{name}{{cache="{cache_name}"}} {stats[field]}')
+    return lines
+
+
+register_collector(_cache_metrics)
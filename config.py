@@ -1,24 +1,167 @@
-from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
+from db_monitor import command_monitor
+from mongo import MongoConnection, ClientProxy, DatabaseProxy, CollectionProxy
 
 load_dotenv()
 
 # MongoDB Configuration
-MONGO_URI = 'your db link'
-# Create a MongoClient instance
-client = MongoClient(MONGO_URI)
+MONGO_URI = os.getenv('MONGO_URI', 'your db link')
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'ParkingTokenSystem')
+
+# SQLite file for the offline booth journal; empty disables offline mode
+OFFLINE_JOURNAL_PATH = os.getenv('OFFLINE_JOURNAL_PATH', '')
+# Seconds between replay attempts of the offline journal
+OFFLINE_SYNC_INTERVAL = float(os.getenv('OFFLINE_SYNC_INTERVAL', '5'))
+
+# How long an operation waits for a reachable server; kept short when offline mode can take over
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv(
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS', '3000' if OFFLINE_JOURNAL_PATH else '30000'))
+
+# Connection pool and timeouts, per worker process. Unset values keep the driver defaults.
+MONGO_MAX_POOL_SIZE = os.getenv('MONGO_MAX_POOL_SIZE')
+MONGO_MIN_POOL_SIZE = os.getenv('MONGO_MIN_POOL_SIZE')
+MONGO_MAX_IDLE_TIME_MS = os.getenv('MONGO_MAX_IDLE_TIME_MS')
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+MONGO_CONNECT_TIMEOUT_MS = os.getenv('MONGO_CONNECT_TIMEOUT_MS')
+MONGO_SOCKET_TIMEOUT_MS = os.getenv('MONGO_SOCKET_TIMEOUT_MS')
+# Wire compression, e.g. "zstd,snappy,zlib" (zstd and snappy need their Python packages)
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS')
+MONGO_ZLIB_LEVEL = os.getenv('MONGO_ZLIB_LEVEL')
+# Read preference (primary, primaryPreferred, secondaryPreferred, ...), read concern level and
+# write concern (w as a number or "majority", journal, timeout)
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE')
+MONGO_READ_CONCERN = os.getenv('MONGO_READ_CONCERN')
+MONGO_WRITE_CONCERN_W = os.getenv('MONGO_WRITE_CONCERN_W')
+MONGO_WRITE_CONCERN_J = os.getenv('MONGO_WRITE_CONCERN_J')
+MONGO_WRITE_CONCERN_TIMEOUT_MS = os.getenv('MONGO_WRITE_CONCERN_TIMEOUT_MS')
+MONGO_APP_NAME = os.getenv('MONGO_APP_NAME', 'parking-token-system')
+
+
+def mongo_client_options():
+    # Keyword arguments for MongoClient (and Motor's client in async mode)
+    options = {
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'appname': MONGO_APP_NAME,
+        'event_listeners': [command_monitor]
+    }
+    for option, value in (
+        ('maxPoolSize', MONGO_MAX_POOL_SIZE),
+        ('minPoolSize', MONGO_MIN_POOL_SIZE),
+        ('maxIdleTimeMS', MONGO_MAX_IDLE_TIME_MS),
+        ('waitQueueTimeoutMS', MONGO_WAIT_QUEUE_TIMEOUT_MS),
+        ('connectTimeoutMS', MONGO_CONNECT_TIMEOUT_MS),
+        ('socketTimeoutMS', MONGO_SOCKET_TIMEOUT_MS),
+        ('zlibCompressionLevel', MONGO_ZLIB_LEVEL),
+        ('wTimeoutMS', MONGO_WRITE_CONCERN_TIMEOUT_MS)
+    ):
+        if value:
+            options[option] = int(value)
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    if MONGO_READ_PREFERENCE:
+        options['readPreference'] = MONGO_READ_PREFERENCE
+    if MONGO_READ_CONCERN:
+        options['readConcernLevel'] = MONGO_READ_CONCERN
+    if MONGO_WRITE_CONCERN_W:
+        options['w'] = int(MONGO_WRITE_CONCERN_W) if MONGO_WRITE_CONCERN_W.isdigit() else MONGO_WRITE_CONCERN_W
+    if MONGO_WRITE_CONCERN_J:
+        options['journal'] = MONGO_WRITE_CONCERN_J.lower() == 'true'
+    return options
+
+
+# The client itself is created on first use in each process (see mongo.py)
+mongo = MongoConnection(MONGO_URI, MONGO_DB_NAME, mongo_client_options())
+client = ClientProxy(mongo)
+
+# Run checkout's delete + insert inside a multi-document transaction (needs a replica set)
+MONGO_TRANSACTIONS = os.getenv('MONGO_TRANSACTIONS', 'false').lower() == 'true'
+
+# In-process cache for user and rate lookups. Creating or deleting a user only clears the
+# cache of the worker that handled the request; every other worker keeps serving its copy until
+# it expires. So for up to CACHE_TTL_SECONDS after a change, another worker may still accept a
+# deleted user or price new check-ins with the user's old rate (the ticket keeps that rate
+# snapshot). Lower it to shorten that window, at the cost of more lookups.
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '30'))
+
+# Seconds before a handler's in-memory plate index is reloaded from the database; it also
+# picks up check-ins made by other worker processes
+SUGGESTION_INDEX_TTL = float(os.getenv('SUGGESTION_INDEX_TTL', '30'))
+
+# Documents fetched per cursor batch when exporting reports
+REPORT_BATCH_SIZE = int(os.getenv('REPORT_BATCH_SIZE', '1000'))
+
+# Largest batch accepted by the bulk check-in/checkout endpoint
+BULK_MAX_OPERATIONS = int(os.getenv('BULK_MAX_OPERATIONS', '200'))
+
+# Rows per page in the admin dashboard tables
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', '25'))
+
+# Completed records live in monthly collections (completed_records_YYYYMM). Months older than
+# the newest ARCHIVE_AFTER_MONTHS are moved to zstd-compressed Parquet files in ARCHIVE_DIR by
+# `flask archive-completed-records`; reports read those files transparently.
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '3'))
+ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'zstd')
+
+# Parquet datasets written by `flask export-parquet` for analytics (see parquet_export.py)
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '10000'))
+# Checkouts younger than this are left for the next incremental export
+EXPORT_SETTLE_SECONDS = float(os.getenv('EXPORT_SETTLE_SECONDS', '300'))
+
+# Generated report files are kept in REPORT_CACHE_DIR (see report_cache.py), at most
+# REPORT_CACHE_MAX_BYTES in total. A report covering today is reused for REPORT_CACHE_OPEN_TTL
+# seconds (0 turns that off); reports of closed days are kept until a late write changes the day.
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', 'report_cache')
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+REPORT_CACHE_OPEN_TTL = float(os.getenv('REPORT_CACHE_OPEN_TTL', '60'))
+
+# Background report jobs (see report_jobs.py). Every web worker process runs up to
+# REPORT_JOB_WORKERS report builds in a pool of its own ('process', or 'thread' where child
+# processes are not an option); an admin may have REPORT_JOBS_PER_ADMIN jobs queued or running.
+# Jobs not finished within REPORT_JOB_TIMEOUT seconds fail; results are kept in REPORT_JOB_DIR
+# for REPORT_JOB_RETENTION seconds.
+REPORT_JOB_DIR = os.getenv('REPORT_JOB_DIR', 'report_jobs')
+REPORT_JOB_EXECUTOR = os.getenv('REPORT_JOB_EXECUTOR', 'process')
+REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+REPORT_JOBS_PER_ADMIN = int(os.getenv('REPORT_JOBS_PER_ADMIN', '2'))
+REPORT_JOB_TIMEOUT = float(os.getenv('REPORT_JOB_TIMEOUT', '1800'))
+REPORT_JOB_RETENTION = float(os.getenv('REPORT_JOB_RETENTION', '86400'))
+
+# Most milliseconds `import app` may take before `flask profile-startup --budget` fails
+COLD_START_BUDGET_MS = float(os.getenv('COLD_START_BUDGET_MS', '500'))
+
+# Outgoing mail (admin registration OTPs). Point SMTP_HOST/SMTP_PORT at a local stand-in
+# server and set SMTP_STARTTLS=0 to test without Gmail; an empty SMTP_USERNAME skips login.
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '1') == '1'
+SMTP_USERNAME = os.getenv('SMTP_USERNAME', os.getenv('ADMIN_EMAIL', ''))
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', os.getenv('ADMIN_APP_PASSWORD', ''))
+# Seconds any single SMTP operation may block the mail worker
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '10'))
+# Attempts per message, with SMTP_RETRY_BACKOFF seconds (doubling) between them
+SMTP_MAX_ATTEMPTS = int(os.getenv('SMTP_MAX_ATTEMPTS', '3'))
+SMTP_RETRY_BACKOFF = float(os.getenv('SMTP_RETRY_BACKOFF', '2'))
+# The reused connection is closed after this many idle seconds, before the server drops it
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', '60'))
+MAIL_QUEUE_SIZE = int(os.getenv('MAIL_QUEUE_SIZE', '100'))
+
+# Seconds a worker trusts that an admin account exists before checking again
+BOOTSTRAP_STATE_TTL = float(os.getenv('BOOTSTRAP_STATE_TTL', '60'))
 
 # Access the database and collections
-db = client.ParkingTokenSystem
-admins_collection = db.admins
-users_collection = db.users
-rates_collection = db.rates
-vehicles_collection = db.vehicles
-completed_records = db.completed_records
+db = DatabaseProxy(mongo)
+admins_collection = CollectionProxy(mongo, 'admins')
+users_collection = CollectionProxy(mongo, 'users')
+rates_collection = CollectionProxy(mongo, 'rates')
+vehicles_collection = CollectionProxy(mongo, 'vehicles')
+# Unpartitioned completed records from before the monthly split; see partitions.py
+completed_records = CollectionProxy(mongo, 'completed_records')
+daily_rollups = CollectionProxy(mongo, 'daily_rollups')
+report_jobs_collection = CollectionProxy(mongo, 'report_jobs')
 
 # Application Configuration
-SECRET_KEY = 'app secret key'
-
-# Global variables
-default_user_setup_done = False 
+SECRET_KEY = 'app secret key' 
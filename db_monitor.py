@@ -0,0 +1,45 @@
+import threading
+from pymongo import monitoring
+from metrics import db_command_latency, db_command_failures
+
+
+class CommandMonitor(monitoring.CommandListener):
+    # Counts the MongoDB commands (round trips) issued by the current request thread
+    # and records per-collection command latency
+
+    def __init__(self):
+        self._local = threading.local()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self._local.round_trips = 0
+
+    @property
+    def round_trips(self):
+        return getattr(self._local, 'round_trips', 0)
+
+    def started(self, event):
+        self._local.round_trips = self.round_trips + 1
+        target = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            target = event.command.get('collection')
+        collection = target if isinstance(target, str) else ''
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), '')
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        db_command_latency.observe(event.duration_micros / 10**6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        db_command_latency.observe(event.duration_micros / 10**6, collection, event.command_name)
+        db_command_failures.inc(collection, event.command_name)
+
+
+command_monitor = CommandMonitor()
@@ -0,0 +1,152 @@
+import threading
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure
+from config import db
+from partitions import ensure_partition_indexes, partition_name
+
+# Indexes the routes rely on, per collection. create_indexes() is a no-op for
+# indexes that already exist, so this can be applied on every startup. The monthly
+# completed_records partitions take partitions.PARTITION_INDEXES.
+INDEXES = {
+    'vehicles': [
+        # One active ticket per vehicle and handler; check-in relies on this to reject duplicates.
+        # Also serves checkout, the ownership check and anchored-prefix suggestions.
+        IndexModel(
+            [('vehicle_number', ASCENDING), ('handled_by', ASCENDING)],
+            name='active_vehicle_per_handler',
+            unique=True,
+            partialFilterExpression={'checkout_time': None}
+        ),
+        # Current/check-in reports and the admin dashboard
+        IndexModel([('handled_by', ASCENDING), ('checkin_time', DESCENDING)], name='handler_checkin_time')
+    ],
+    'users': [
+        IndexModel([('username', ASCENDING)], name='username', unique=True),
+        IndexModel([('email', ASCENDING)], name='email', sparse=True),
+        # Admin dashboard: users created by an admin, newest first
+        IndexModel([('created_by', ASCENDING), ('created_at', DESCENDING)], name='created_by_created_at')
+    ],
+    'admins': [
+        IndexModel([('username', ASCENDING)], name='username', unique=True),
+        IndexModel([('created_at', DESCENDING)], name='created_at')
+    ],
+    'rates': [],
+    'daily_rollups': [
+        # One document per handler, day and payment mode; also serves the date-range financial report
+        IndexModel(
+            [('handled_by', ASCENDING), ('day', ASCENDING), ('payment_mode', ASCENDING)],
+            name='handler_day_payment_mode',
+            unique=True
+        )
+    ],
+    'report_jobs': [
+        # Per-admin limit and status lookups
+        IndexModel([('admin', ASCENDING), ('status', ASCENDING)], name='admin_status'),
+        # Purge of finished jobs
+        IndexModel([('finished_at', ASCENDING)], name='finished_at')
+    ]
+}
+
+# Query shapes issued by the routes, checked with explain() in verify mode.
+# Each entry is (collection, description, filter, sort).
+_day = datetime(2024, 1, 1)
+_next_day = datetime(2024, 1, 2)
+HOT_QUERIES = [
+    ('vehicles', 'checkout: active ticket for this handler',
+     {'vehicle_number': 'KA01AB1234', 'handled_by': 'staff', 'checkout_time': None}, None),
+    ('vehicles', 'checkout: active ticket for any handler',
+     {'vehicle_number': 'KA01AB1234', 'checkout_time': None}, None),
+    ('vehicles', 'get_vehicle_suggestions: prefix match',
+     {'vehicle_number': {'$regex': '^KA01'}, 'handled_by': 'staff', 'checkout_time': None}, None),
+    ('vehicles', 'generate_report: current',
+     {'checkout_time': None, 'handled_by': 'staff'}, None),
+    ('vehicles', 'generate_report: checkins / financial',
+     {'checkin_time': {'$gte': _day, '$lt': _next_day}, 'handled_by': 'staff'}, None),
+    ('vehicles', 'admin_dashboard: active vehicles',
+     {'handled_by': {'$in': ['staff']}, 'checkout_time': None}, [('checkin_time', DESCENDING)]),
+    (partition_name(datetime.now()), 'generate_report: checkouts / financial',
+     {'checkout_time': {'$gte': _day, '$lt': _next_day}, 'handled_by': 'staff'}, None),
+    ('users', 'login / checkin: user by username',
+     {'username': 'staff'}, None),
+    ('users', 'login: user by username or email',
+     {'$or': [{'username': 'staff', 'password': 'x'}, {'email': 'staff', 'password': 'x'}]}, None),
+    ('users', 'admin_dashboard: users created by admin',
+     {'created_by': 'admin'}, [('created_at', DESCENDING)]),
+    ('admins', 'login / admin_register: admin by username',
+     {'username': 'admin'}, None),
+    ('rates', 'checkin / checkout: rate by id',
+     {'_id': 'rate'}, None),
+    ('daily_rollups', 'checkout: rollup increment',
+     {'handled_by': 'staff', 'day': _day, 'payment_mode': 'Cash'}, None),
+    ('daily_rollups', 'generate_report: financial_range',
+     {'handled_by': 'staff', 'day': {'$gte': _day, '$lte': _next_day}}, [('day', ASCENDING), ('payment_mode', ASCENDING)])
+]
+
+
+# Whether this process has applied INDEXES; see ensure_indexes_once()
+_indexes_ensured = False
+_ensure_lock = threading.Lock()
+
+
+def ensure_indexes():
+    global _indexes_ensured
+    for collection_name, indexes in INDEXES.items():
+        if indexes:
+            db[collection_name].create_indexes(indexes)
+    ensure_partition_indexes()
+    _indexes_ensured = True
+
+
+def ensure_indexes_once():
+    # Run before the first request a process serves, so the indexes exist under gunicorn and
+    # `flask run` too: check-in and bulk check-in rely on active_vehicle_per_handler alone to
+    # reject duplicates. With MongoDB unreachable the routes go offline and a later request
+    # tries again; any other failure (e.g. duplicate active tickets blocking the unique index)
+    # is raised, so the app does not serve check-ins without the index.
+    if _indexes_ensured:
+        return
+    with _ensure_lock:
+        if _indexes_ensured:
+            return
+        try:
+            ensure_indexes()
+        except ConnectionFailure:
+            pass
+
+
+def _plan_stages(plan):
+    # Slot-based engine plans (MongoDB 6.0+) nest the classic plan under queryPlan
+    if 'queryPlan' in plan:
+        return _plan_stages(plan['queryPlan'])
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages.extend(_plan_stages(plan['inputStage']))
+    for input_stage in plan.get('inputStages', []):
+        stages.extend(_plan_stages(input_stage))
+    return stages
+
+
+def explain_stages(collection_name, query, sort=None):
+    # Stages of the winning plan for a find() query
+    cursor = db[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+    # Sharded clusters wrap each shard's plan
+    plans = [shard['winningPlan'] for shard in winning_plan.get('shards', [])] or [winning_plan]
+    return [stage for plan in plans for stage in _plan_stages(plan)]
+
+
+def verify_indexes():
+    # Returns the hot queries whose winning plan still contains a collection scan
+    failures = []
+    for collection_name, description, query, sort in HOT_QUERIES:
+        stages = explain_stages(collection_name, query, sort)
+        if 'COLLSCAN' in stages:
+            failures.append({
+                'collection': collection_name,
+                'query': description,
+                'stages': stages
+            })
+    return failures
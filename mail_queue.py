@@ -0,0 +1,169 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+from config import (
+    SMTP_HOST,
+    SMTP_PORT,
+    SMTP_STARTTLS,
+    SMTP_USERNAME,
+    SMTP_PASSWORD,
+    SMTP_TIMEOUT,
+    SMTP_MAX_ATTEMPTS,
+    SMTP_RETRY_BACKOFF,
+    SMTP_IDLE_SECONDS,
+    MAIL_QUEUE_SIZE
+)
+from metrics import Counter, register_collector
+
+# Outgoing mail is handed to a background thread, so a slow or hanging SMTP server never holds
+# a request. The thread keeps one SMTP connection open between messages and checks it with
+# NOOP before reuse.
+
+mail_messages = Counter(
+    'mail_messages_total', 'Outgoing emails by outcome (sent, retried, failed, dropped).',
+    ('outcome',))
+
+# Errors a retry will not fix
+PERMANENT_ERRORS = (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError)
+
+
+class MailQueue:
+
+    def __init__(self, host, port, starttls, username, password, timeout, max_attempts,
+                 retry_backoff, idle_seconds, maxsize):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.idle_seconds = idle_seconds
+        self.last_error = None
+        self._queue = queue.Queue(maxsize)
+        self._smtp = None
+        self._thread = None
+        self._thread_pid = None
+        self._thread_lock = threading.Lock()
+
+    def send(self, message):
+        # Queues an email.message.Message; False when the queue is full
+        self._start()
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            mail_messages.inc('dropped')
+            print(f"Mail queue full, dropping email to {message['To']}")
+            return False
+
+    def _start(self):
+        # Threads do not survive fork(), so each worker process starts its own
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._smtp = None
+            self._queue = queue.Queue(self._queue.maxsize)
+            self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _connection(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+        self._smtp = self._connect()
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def _deliver(self, message):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._connection().send_message(message)
+                mail_messages.inc('sent')
+                self.last_error = None
+                return True
+            except PERMANENT_ERRORS as e:
+                self.last_error = str(e)
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                self.last_error = str(e)
+                self._disconnect()
+                if attempt < self.max_attempts:
+                    mail_messages.inc('retried')
+                    time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+        mail_messages.inc('failed')
+        print(f"Error sending email to {message['To']}: {self.last_error}")
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                message = self._queue.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            try:
+                self._deliver(message)
+            except Exception as e:
+                print(f"Mail worker error: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout=None):
+        # Waits until every queued email has been sent or given up on; False on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+
+mail_queue = MailQueue(SMTP_HOST, SMTP_PORT, SMTP_STARTTLS, SMTP_USERNAME, SMTP_PASSWORD, SMTP_TIMEOUT,
+                       SMTP_MAX_ATTEMPTS, SMTP_RETRY_BACKOFF, SMTP_IDLE_SECONDS, MAIL_QUEUE_SIZE)
+
+
+def _mail_metrics():
+    return mail_messages.render() + [
+        '# HELP mail_queue_depth Emails waiting for the mail worker.',
+        '# TYPE mail_queue_depth gauge',
+        f'mail_queue_depth {mail_queue.depth()}'
+    ]
+
+
+register_collector(_mail_metrics)
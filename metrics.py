@@ -0,0 +1,119 @@
+import threading
+import time
+from flask import g, request
+
+# Minimal Prometheus-style metrics kept in process memory
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+                labels = list(zip(self.label_names, label_values))
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", bound)])} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(list(zip(self.label_names, label_values)))} {value}')
+        return lines
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.',
+    ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+request_round_trips = Histogram(
+    'http_request_db_round_trips', 'MongoDB commands issued per request.',
+    ('endpoint',), ROUND_TRIP_BUCKETS)
+db_command_latency = Histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command latency by collection and command.',
+    ('collection', 'command'), LATENCY_BUCKETS)
+db_command_failures = Counter(
+    'mongodb_command_failures_total', 'Failed MongoDB commands by collection and command.',
+    ('collection', 'command'))
+
+# Callables returning extra exposition lines, e.g. cache statistics
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+def render_metrics():
+    lines = []
+    for metric in (request_latency, request_round_trips, db_command_latency, db_command_failures):
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+def register_metrics(app, command_monitor):
+    # Registered before any other request hook so the whole hook chain is measured
+    @app.before_request
+    def start_request_timer():
+        command_monitor.reset()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unknown'
+            request_latency.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+            request_round_trips.observe(command_monitor.round_trips, endpoint)
+        response.headers['X-DB-Round-Trips'] = str(command_monitor.round_trips)
+        return response
@@ -0,0 +1,110 @@
+import os
+import threading
+from pymongo import MongoClient
+
+
+class MongoConnection:
+    # Creates the MongoClient on first use in each process. A client must not be shared across
+    # fork(), so a worker forked by gunicorn after the parent touched the database opens its own
+    # pool instead of reusing the parent's sockets.
+
+    def __init__(self, uri, db_name, options=None, client_factory=MongoClient):
+        self.uri = uri
+        self.db_name = db_name
+        self.options = dict(options or {})
+        self.client_factory = client_factory
+        self._client = None
+        self._pid = None
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def configure(self, uri=None, db_name=None, options=None, client_factory=None):
+        # Changes apply to the next client; the current one (if any) is closed. Everything in
+        # the process using this connection sees the change.
+        with self._lock:
+            if uri is not None:
+                self.uri = uri
+            if db_name is not None:
+                self.db_name = db_name
+            if options is not None:
+                self.options.update(options)
+            if client_factory is not None:
+                self.client_factory = client_factory
+            self._close_locked()
+
+    @property
+    def client(self):
+        client = self._client
+        if client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    # An inherited client is dropped, not closed: closing it would end the
+                    # parent's sessions on sockets the parent still uses
+                    self._client = self.client_factory(self.uri, **self.options)
+                    self._pid = os.getpid()
+                    self._collections = {}
+                client = self._client
+        return client
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    def collection(self, name):
+        # Collection objects are cached per client; the proxies hit this on every operation
+        client = self.client
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = client[self.db_name][name]
+            self._collections[name] = collection
+        return collection
+
+    def _close_locked(self):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+        self._client = None
+        self._pid = None
+        self._collections = {}
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+
+class ClientProxy:
+    # Module-level stand-ins for the client, database and collections, so the routes keep
+    # importing them from config while the real objects are resolved per process
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection.client, name)
+
+    def __getitem__(self, name):
+        return self._connection.client[name]
+
+
+class DatabaseProxy:
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection.db, name)
+
+    def __getitem__(self, name):
+        return self._connection.db[name]
+
+
+class CollectionProxy:
+
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    def __getattr__(self, name):
+        return getattr(self._connection.collection(self._name), name)
+
+    def __repr__(self):
+        return f'CollectionProxy({self._name!r})'
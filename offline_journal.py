@@ -0,0 +1,393 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from bson import json_util
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from config import (
+    users_collection,
+    vehicles_collection,
+    OFFLINE_JOURNAL_PATH,
+    OFFLINE_SYNC_INTERVAL
+)
+from metrics import register_collector
+from rollups import rebuild_rollup, update_rollups
+from partitions import archive_path, find_one_completed, month_of, partition_for
+from report_cache import report_cache
+
+# Local write-ahead journal for booths whose MongoDB link drops. While the database is
+# unreachable (or older journal entries are still waiting to be replayed), check-ins and
+# checkouts are recorded here and served from a local mirror of the active tickets; a
+# background thread replays them to MongoDB in order.
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS journal (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        handled_by TEXT NOT NULL,
+        vehicle_number TEXT NOT NULL,
+        document TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        detail TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS journal_status ON journal (status, seq)',
+    # Active tickets as last seen online plus those opened offline, for pricing offline checkouts
+    '''CREATE TABLE IF NOT EXISTS active_tickets (
+        vehicle_number TEXT NOT NULL,
+        handled_by TEXT NOT NULL,
+        document TEXT NOT NULL,
+        PRIMARY KEY (vehicle_number, handled_by)
+    )''',
+    # Last known rate per user, for offline check-ins
+    '''CREATE TABLE IF NOT EXISTS user_rates (
+        username TEXT PRIMARY KEY,
+        rate TEXT NOT NULL
+    )''',
+    # Only one process replays at a time
+    '''CREATE TABLE IF NOT EXISTS sync_lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        owner TEXT,
+        expires_at REAL NOT NULL DEFAULT 0
+    )''',
+    'INSERT OR IGNORE INTO sync_lease (id, expires_at) VALUES (1, 0)'
+]
+
+SYNC_LEASE_SECONDS = 60
+
+
+class OfflineJournal:
+
+    def __init__(self, path):
+        self.path = path
+        self.last_sync = None
+        self.last_sync_error = None
+        self._local = threading.local()
+        self._remembered_rates = {}
+        self._thread = None
+        self._thread_pid = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    @property
+    def _owner(self):
+        return f'{os.getpid()}-{id(self)}'
+
+    def _connection(self):
+        # One connection per thread; a forked worker opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Every entry is on disk before the booth prints the receipt
+            connection.execute('PRAGMA synchronous=FULL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def has_pending(self):
+        row = self._connection().execute(
+            "SELECT 1 FROM journal WHERE status = 'pending' LIMIT 1").fetchone()
+        return row is not None
+
+    # Local state kept up to date by the online routes
+
+    def remember_rate(self, username, rate):
+        # Only written when the user's rate changed since this process last stored it
+        document = json_util.dumps(rate)
+        if self._remembered_rates.get(username) == document:
+            return
+        self._connection().execute(
+            'INSERT OR REPLACE INTO user_rates (username, rate) VALUES (?, ?)', (username, document))
+        self._remembered_rates[username] = document
+
+    def known_rate(self, username):
+        row = self._connection().execute(
+            'SELECT rate FROM user_rates WHERE username = ?', (username,)).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def mirror_checkin(self, ticket):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO active_tickets (vehicle_number, handled_by, document) VALUES (?, ?, ?)',
+            (ticket['vehicle_number'], ticket['handled_by'], json_util.dumps(ticket)))
+
+    def mirror_checkout(self, vehicle_number, handled_by):
+        self._connection().execute(
+            'DELETE FROM active_tickets WHERE vehicle_number = ? AND handled_by = ?',
+            (vehicle_number, handled_by))
+
+    def active_ticket(self, vehicle_number, handled_by):
+        row = self._connection().execute(
+            'SELECT document FROM active_tickets WHERE vehicle_number = ? AND handled_by = ?',
+            (vehicle_number, handled_by)).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def active_handler(self, vehicle_number):
+        row = self._connection().execute(
+            'SELECT handled_by FROM active_tickets WHERE vehicle_number = ? LIMIT 1',
+            (vehicle_number,)).fetchone()
+        return row[0] if row else None
+
+    def active_plates(self, handled_by, prefix, limit):
+        rows = self._connection().execute(
+            'SELECT vehicle_number FROM active_tickets WHERE handled_by = ? AND vehicle_number >= ? '
+            'ORDER BY vehicle_number LIMIT ?', (handled_by, prefix, limit * 4)).fetchall()
+        return [row[0] for row in rows if row[0].startswith(prefix)][:limit]
+
+    # Offline writes: the journal entry and the mirror change commit together
+
+    def record_checkin(self, ticket):
+        # Returns False when the plate already has an active ticket for this handler
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            exists = connection.execute(
+                'SELECT 1 FROM active_tickets WHERE vehicle_number = ? AND handled_by = ?',
+                (ticket['vehicle_number'], ticket['handled_by'])).fetchone()
+            if exists:
+                connection.execute('ROLLBACK')
+                return False
+            document = json_util.dumps(ticket)
+            connection.execute(
+                'INSERT INTO active_tickets (vehicle_number, handled_by, document) VALUES (?, ?, ?)',
+                (ticket['vehicle_number'], ticket['handled_by'], document))
+            connection.execute(
+                'INSERT INTO journal (op, handled_by, vehicle_number, document, created_at) VALUES (?, ?, ?, ?, ?)',
+                ('checkin', ticket['handled_by'], ticket['vehicle_number'], document, datetime.now().isoformat()))
+            connection.execute('COMMIT')
+            return True
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def record_checkout(self, completed_record):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM active_tickets WHERE vehicle_number = ? AND handled_by = ?',
+                (completed_record['vehicle_number'], completed_record['handled_by']))
+            connection.execute(
+                'INSERT INTO journal (op, handled_by, vehicle_number, document, created_at) VALUES (?, ?, ?, ?, ?)',
+                ('checkout', completed_record['handled_by'], completed_record['vehicle_number'],
+                 json_util.dumps(completed_record), datetime.now().isoformat()))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    # Replay
+
+    def _acquire_lease(self):
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE sync_lease SET owner = ?, expires_at = ? WHERE id = 1 AND (owner = ? OR expires_at < ?)',
+            (self._owner, now + SYNC_LEASE_SECONDS, self._owner, now))
+        return cursor.rowcount == 1
+
+    def _release_lease(self):
+        self._connection().execute(
+            'UPDATE sync_lease SET expires_at = 0 WHERE id = 1 AND owner = ?', (self._owner,))
+
+    def _mark(self, seq, status, detail=None):
+        self._connection().execute(
+            'UPDATE journal SET status = ?, detail = ? WHERE seq = ?', (status, detail, seq))
+
+    def _replay_checkin(self, ticket):
+        # The ticket keeps the _id it was given offline, so a replay that already reached
+        # MongoDB is recognised on the _id
+        try:
+            vehicles_collection.insert_one(ticket)
+            report_cache.invalidate(ticket.get('handled_by'), ticket.get('checkin_time'))
+            return 'synced', None
+        except DuplicateKeyError:
+            if vehicles_collection.find_one({'_id': ticket['_id']}, {'_id': 1}) or find_one_completed(
+                    {'_id': ticket['_id'], 'checkout_time': {'$gte': ticket['checkin_time']}}, {'_id': 1}):
+                return 'synced', None
+            return 'conflict', 'Vehicle was checked in online under the same account while offline'
+
+    def _replay_checkout(self, record):
+        # The completed record keeps the ticket _id: it is written first, so a replay interrupted
+        # before the ticket was removed finishes the removal the next time round
+        partition = partition_for(record['checkout_time'])
+        existing = None
+        if os.path.exists(archive_path(month_of(record['checkout_time']))):
+            # The month was archived since; a replay that already landed may be in the file, where
+            # no unique index catches it
+            existing = find_one_completed({'_id': record['_id'], 'checkout_time': record['checkout_time']})
+        if existing is None:
+            try:
+                partition.insert_one(record)
+            except DuplicateKeyError:
+                existing = partition.find_one({'_id': record['_id']}) or {}
+        if existing is not None:
+            if existing and existing.get('checkout_time') == record['checkout_time'] \
+                    and existing.get('checkout_by') == record['checkout_by']:
+                # An earlier replay of this entry wrote the record and stopped somewhere before
+                # marking it synced, so the ticket removal and the rollup may be missing
+                vehicles_collection.delete_one({'_id': record['_id']})
+                rebuild_rollup(record['handled_by'], record['checkout_time'])
+                report_cache.invalidate(record.get('handled_by'), record.get('checkin_time'), record['checkout_time'])
+                return 'synced', None
+            checkout_by = existing.get('checkout_by') if existing else 'another booth'
+            return 'conflict', f'Ticket was also checked out by {checkout_by}'
+        removed = vehicles_collection.delete_one({'_id': record['_id']}).deleted_count
+        update_rollups([record])
+        # Replays land after the fact, often on days whose reports are already cached
+        report_cache.invalidate(record.get('handled_by'), record.get('checkin_time'), record['checkout_time'])
+        if not removed:
+            # The payment was taken offline, so it is recorded, but the ticket was not active here
+            return 'conflict', 'Ticket was not active in MongoDB; completed record written anyway'
+        return 'synced', None
+
+    def sync_once(self):
+        # Replays pending entries in order; stops at the first connection failure so later
+        # entries never overtake earlier ones. An entry that fails for any other reason is marked
+        # 'failed' with the error and the replay moves on. Returns the number of entries replayed.
+        if not self.enabled or not self._acquire_lease():
+            return 0
+        replayed = 0
+        try:
+            connection = self._connection()
+            while True:
+                row = connection.execute(
+                    "SELECT seq, op, document FROM journal WHERE status = 'pending' ORDER BY seq LIMIT 1").fetchone()
+                if row is None:
+                    break
+                seq, op, document = row
+                try:
+                    document = json_util.loads(document)
+                    if op == 'checkin':
+                        status, detail = self._replay_checkin(document)
+                    else:
+                        status, detail = self._replay_checkout(document)
+                except ConnectionFailure:
+                    raise
+                except Exception as e:
+                    # A bad document or a server-side error will not go away on a retry; left
+                    # pending, the entry would keep every route offline
+                    status, detail = 'failed', f'{type(e).__name__}: {str(e)}'
+                if status != 'synced':
+                    print(f"Offline journal {status} for entry {seq}: {detail}")
+                self._mark(seq, status, detail)
+                replayed += 1
+                self._acquire_lease()
+            self.last_sync = datetime.now()
+            self.last_sync_error = None
+        except ConnectionFailure as e:
+            self.last_sync_error = str(e)
+        finally:
+            self._release_lease()
+        return replayed
+
+    def refresh_mirror(self):
+        # Reloads the active tickets and user rates from MongoDB; skipped while entries are pending
+        # since the local state is then newer than the database
+        if self.has_pending():
+            return
+        tickets = list(vehicles_collection.find({'checkout_time': None}))
+        users = list(users_collection.aggregate([
+            {'$lookup': {'from': 'rates', 'localField': 'rate_id', 'foreignField': '_id', 'as': 'rate'}},
+            {'$project': {'username': 1, 'rate': {'$arrayElemAt': ['$rate', 0]}}}
+        ]))
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if connection.execute("SELECT 1 FROM journal WHERE status = 'pending' LIMIT 1").fetchone():
+                connection.execute('ROLLBACK')
+                return
+            connection.execute('DELETE FROM active_tickets')
+            connection.executemany(
+                'INSERT OR REPLACE INTO active_tickets (vehicle_number, handled_by, document) VALUES (?, ?, ?)',
+                [(t['vehicle_number'], t.get('handled_by'), json_util.dumps(t)) for t in tickets if t.get('handled_by')])
+            connection.executemany(
+                'INSERT OR REPLACE INTO user_rates (username, rate) VALUES (?, ?)',
+                [(u['username'], json_util.dumps(u['rate'])) for u in users if u.get('rate')])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _run(self, interval):
+        refreshed_at = 0
+        while not self._stop.wait(interval):
+            try:
+                self.sync_once()
+                # The mirror only needs to catch up with other booths now and then
+                if not self.last_sync_error and time.monotonic() - refreshed_at > interval * 12:
+                    self.refresh_mirror()
+                    refreshed_at = time.monotonic()
+            except ConnectionFailure:
+                pass
+            except Exception as e:
+                print(f"Offline journal sync error: {str(e)}")
+
+    def start_sync(self, interval=OFFLINE_SYNC_INTERVAL):
+        # Threads do not survive fork(), so a forked worker starts its own on its first request
+        if not self.enabled or (self._thread is not None and self._thread_pid == os.getpid()):
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='offline-journal-sync', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop_sync(self):
+        self._stop.set()
+
+    def status(self):
+        connection = self._connection()
+        counts = dict(connection.execute('SELECT status, COUNT(*) FROM journal GROUP BY status').fetchall())
+        conflicts = [{
+            'seq': seq,
+            'op': op,
+            'status': status,
+            'vehicle_number': vehicle_number,
+            'handled_by': handled_by,
+            'created_at': created_at,
+            'detail': detail
+        } for seq, op, status, vehicle_number, handled_by, created_at, detail in connection.execute(
+            "SELECT seq, op, status, vehicle_number, handled_by, created_at, detail FROM journal "
+            "WHERE status IN ('conflict', 'failed') ORDER BY seq DESC LIMIT 100")]
+        return {
+            'enabled': True,
+            'pending': counts.get('pending', 0),
+            'synced': counts.get('synced', 0),
+            'conflict_count': counts.get('conflict', 0),
+            'failed_count': counts.get('failed', 0),
+            'conflicts': conflicts,
+            'last_sync': self.last_sync.strftime('%Y-%m-%d %H:%M:%S') if self.last_sync else None,
+            'last_sync_error': self.last_sync_error
+        }
+
+
+offline_journal = OfflineJournal(OFFLINE_JOURNAL_PATH)
+
+
+def _journal_metrics():
+    if not offline_journal.enabled:
+        return []
+    status = offline_journal.status()
+    return [
+        '# HELP offline_journal_pending Journal entries waiting to be replayed to MongoDB.',
+        '# TYPE offline_journal_pending gauge',
+        f'offline_journal_pending {status["pending"]}',
+        '# HELP offline_journal_conflicts Journal entries that could not be replayed cleanly.',
+        '# TYPE offline_journal_conflicts gauge',
+        f'offline_journal_conflicts {status["conflict_count"]}',
+        '# HELP offline_journal_failed Journal entries whose replay raised an error.',
+        '# TYPE offline_journal_failed gauge',
+        f'offline_journal_failed {status["failed_count"]}'
+    ]
+
+
+register_collector(_journal_metrics)
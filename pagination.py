@@ -0,0 +1,66 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from config import DASHBOARD_PAGE_SIZE
+
+# Keyset (cursor) pagination over a descending sort on (field, _id)
+
+MAX_PAGE_SIZE = 100
+
+
+def page_size(requested):
+    try:
+        return max(1, min(int(requested), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DASHBOARD_PAGE_SIZE
+
+
+def encode_cursor(sort_value, _id):
+    payload = {
+        'v': sort_value.isoformat() if isinstance(sort_value, datetime) else None,
+        'id': str(_id)
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    sort_value = datetime.fromisoformat(payload['v']) if payload['v'] else None
+    return sort_value, ObjectId(payload['id'])
+
+
+def keyset_filter(field, cursor):
+    # Documents that sort after the cursor; documents without the field sort last
+    if not cursor:
+        return {}
+    sort_value, last_id = decode_cursor(cursor)
+    if sort_value is None:
+        return {field: None, '_id': {'$lt': last_id}}
+    return {
+        '$or': [
+            {field: {'$lt': sort_value}},
+            {field: sort_value, '_id': {'$lt': last_id}},
+            {field: None}
+        ]
+    }
+
+
+def sort_spec(field):
+    return [(field, -1), ('_id', -1)]
+
+
+def build_page(documents, limit, field):
+    # documents holds up to limit + 1 results; the extra one only signals another page
+    documents = list(documents)
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    next_cursor = None
+    if has_more:
+        last = documents[-1]
+        next_cursor = encode_cursor(last.get(field), last['_id'])
+    return documents, next_cursor
+
+
+def format_time(value, fmt='%Y-%m-%d %H:%M:%S'):
+    return value.strftime(fmt) if value else 'N/A'
@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import vehicles_collection, EXPORT_DIR, EXPORT_BATCH_SIZE, EXPORT_SETTLE_SECONDS
+from partitions import find_completed, month_of
+
+# Analytics export: completed records and the active vehicles as Parquet datasets under
+# EXPORT_DIR, partitioned by month (hive layout, month=YYYYMM) and written in record batches.
+#
+#   completed_records/  appended to; an incremental run adds the records checked out since
+#                       the watermark in _watermark.json
+#   vehicles/           the active tickets, replaced by every run
+#
+# Records are only exported once their checkout is EXPORT_SETTLE_SECONDS old, so in-flight
+# checkouts are not skipped. Records replayed from an offline journal later than that are older
+# than the watermark and only reach the export through a --full run.
+
+COMPLETED_SCHEMA = pa.schema([
+    ('_id', pa.string()),
+    ('vehicle_number', pa.string()),
+    ('handled_by', pa.string()),
+    ('checkout_by', pa.string()),
+    ('checkin_time', pa.timestamp('us')),
+    ('checkout_time', pa.timestamp('us')),
+    ('initial_payment', pa.float64()),
+    ('additional_charge', pa.float64()),
+    ('total_charge', pa.float64()),
+    ('initial_payment_mode', pa.string()),
+    ('additional_payment_mode', pa.string()),
+    ('month', pa.string())
+])
+VEHICLE_SCHEMA = pa.schema([
+    ('_id', pa.string()),
+    ('vehicle_number', pa.string()),
+    ('handled_by', pa.string()),
+    ('checkin_time', pa.timestamp('us')),
+    ('payment_mode', pa.string()),
+    ('rate_id', pa.string()),
+    ('initial_amount', pa.float64()),
+    ('initial_duration', pa.float64()),
+    ('extra_charge', pa.float64()),
+    ('extra_charge_duration', pa.float64()),
+    ('month', pa.string())
+])
+PARTITIONING = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+WATERMARK_FILE = '_watermark.json'
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _completed_row(record):
+    return {
+        '_id': str(record['_id']),
+        'vehicle_number': record.get('vehicle_number'),
+        'handled_by': record.get('handled_by'),
+        'checkout_by': record.get('checkout_by'),
+        'checkin_time': record.get('checkin_time'),
+        'checkout_time': record['checkout_time'],
+        'initial_payment': _float(record.get('initial_payment')),
+        'additional_charge': _float(record.get('additional_charge')),
+        'total_charge': _float(record.get('total_charge', record.get('charge'))),
+        'initial_payment_mode': record.get('initial_payment_mode', record.get('payment_mode')),
+        'additional_payment_mode': record.get('additional_payment_mode'),
+        'month': month_of(record['checkout_time'])
+    }
+
+
+def _vehicle_row(vehicle):
+    rate = vehicle.get('rate') or {}
+    return {
+        '_id': str(vehicle['_id']),
+        'vehicle_number': vehicle.get('vehicle_number'),
+        'handled_by': vehicle.get('handled_by'),
+        'checkin_time': vehicle['checkin_time'],
+        'payment_mode': vehicle.get('payment_mode'),
+        'rate_id': str(vehicle['rate_id']) if vehicle.get('rate_id') is not None else None,
+        'initial_amount': _float(rate.get('initial_amount')),
+        'initial_duration': _float(rate.get('initial_duration')),
+        'extra_charge': _float(rate.get('extra_charge')),
+        'extra_charge_duration': _float(rate.get('extra_charge_duration')),
+        'month': month_of(vehicle['checkin_time'])
+    }
+
+
+def _record_batches(documents, to_row, schema, batch_size, counter):
+    # Converts a cursor into RecordBatches of batch_size rows, so memory stays flat
+    rows = []
+    for document in documents:
+        rows.append(to_row(document))
+        if len(rows) >= batch_size:
+            counter['rows'] += len(rows)
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+            rows = []
+    if rows:
+        counter['rows'] += len(rows)
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def _write(batches, schema, base_dir, run):
+    ds.write_dataset(
+        batches,
+        base_dir,
+        schema=schema,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=f'part-{run}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd')
+    )
+
+
+def read_watermark(export_dir=EXPORT_DIR):
+    path = os.path.join(export_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_watermark(export_dir, watermark):
+    path = os.path.join(export_dir, WATERMARK_FILE)
+    with open(f'{path}.partial', 'w') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(f'{path}.partial', path)
+
+
+def _remove_uncommitted(base_dir, committed_run):
+    # Part files of a run that crashed before writing its watermark
+    for root, _, files in os.walk(base_dir):
+        for name in files:
+            if name.startswith('part-') and (committed_run is None or name.split('-')[1] > committed_run):
+                os.remove(os.path.join(root, name))
+
+
+def _replace_dir(target, build):
+    # Writes a dataset next to target, then swaps it in
+    staging = f'{target}.partial'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    build(staging)
+    if os.path.exists(target):
+        retired = f'{target}.old'
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(target, retired)
+        os.replace(staging, target)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, target)
+
+
+def export_parquet(full=False, export_dir=EXPORT_DIR, batch_size=EXPORT_BATCH_SIZE):
+    # Returns {'completed_records': rows written, 'vehicles': rows written, 'watermark': ...}
+    os.makedirs(export_dir, exist_ok=True)
+    now = datetime.now()
+    run = now.strftime('%Y%m%d%H%M%S%f')
+    upper = now - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+    watermark = None if full else read_watermark(export_dir)
+
+    query = {'checkout_time': {'$lt': upper}}
+    if watermark:
+        query['checkout_time']['$gte'] = datetime.fromisoformat(watermark['checkout_time'])
+
+    completed_dir = os.path.join(export_dir, 'completed_records')
+    completed = {'rows': 0}
+    records = find_completed(query, batch_size=batch_size)
+    if full:
+        _replace_dir(completed_dir, lambda staging: _write(
+            _record_batches(records, _completed_row, COMPLETED_SCHEMA, batch_size, completed),
+            COMPLETED_SCHEMA, staging, run))
+    else:
+        _remove_uncommitted(completed_dir, watermark['run'] if watermark else None)
+        _write(_record_batches(records, _completed_row, COMPLETED_SCHEMA, batch_size, completed),
+               COMPLETED_SCHEMA, completed_dir, run)
+
+    vehicles = {'rows': 0}
+    cursor = vehicles_collection.find({'checkout_time': None}).batch_size(batch_size)
+    _replace_dir(os.path.join(export_dir, 'vehicles'), lambda staging: _write(
+        _record_batches(cursor, _vehicle_row, VEHICLE_SCHEMA, batch_size, vehicles),
+        VEHICLE_SCHEMA, staging, run))
+
+    # Next run starts at the upper bound of this one: checkout_time in [previous, upper)
+    watermark = {'run': run, 'checkout_time': upper.isoformat(), 'exported_at': now.isoformat()}
+    _write_watermark(export_dir, watermark)
+    return {'completed_records': completed['rows'], 'vehicles': vehicles['rows'], 'watermark': watermark}
+
+
+# Reader API for local analytics. Files are memory-mapped, and the month partitions and row-group
+# statistics are used to skip data outside the requested range.
+
+def _filters(start=None, end=None, handled_by=None, time_field='checkout_time'):
+    filters = []
+    if start:
+        filters.append(('month', '>=', month_of(start)))
+        filters.append((time_field, '>=', start))
+    if end:
+        filters.append(('month', '<=', month_of(end)))
+        filters.append((time_field, '<', end))
+    if handled_by:
+        filters.append(('handled_by', '==', handled_by))
+    return filters or None
+
+
+def read_completed(start=None, end=None, handled_by=None, columns=None, export_dir=EXPORT_DIR):
+    # Completed records with checkout_time in [start, end) as a pyarrow.Table
+    return pq.read_table(os.path.join(export_dir, 'completed_records'), columns=columns,
+                         filters=_filters(start, end, handled_by), partitioning=PARTITIONING, memory_map=True)
+
+
+def read_active_vehicles(handled_by=None, columns=None, export_dir=EXPORT_DIR):
+    return pq.read_table(os.path.join(export_dir, 'vehicles'), columns=columns,
+                         filters=_filters(handled_by=handled_by), partitioning=PARTITIONING, memory_map=True)
+
+
+def completed_frame(start=None, end=None, handled_by=None, columns=None, export_dir=EXPORT_DIR):
+    # Same as read_completed() as a pandas DataFrame
+    return read_completed(start, end, handled_by, columns, export_dir).to_pandas()
@@ -0,0 +1,189 @@
+import os
+import re
+from itertools import chain
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import BulkWriteError
+from cache import TTLCache
+from config import db, completed_records, ARCHIVE_DIR
+
+# Completed records are split into one collection per checkout month, completed_records_YYYYMM.
+# Checkouts write to the month of their checkout_time and reads only visit the months a query's
+# checkout_time range overlaps. A month moved to the archive tier (archive.py) is read from its
+# Parquet file plus whatever reached its partition afterwards (late offline replays); the next
+# archive run folds those in. The unpartitioned collection from before the split is still read
+# until `flask partition-completed-records` has emptied it.
+#
+# The unique _id index only spans one month, so a completed record's _id (the ticket's) is not
+# unique across months: a guard against closing a ticket twice cannot rely on a duplicate key
+# error alone. Checkout backs out if the ticket was already removed when it goes to remove it;
+# bulk checkout looks in every month since check-in first (completed_ids()).
+
+PREFIX = 'completed_records'
+PARTITION_PATTERN = re.compile(r'^completed_records_(\d{6})$')
+ARCHIVE_PATTERN = re.compile(r'^completed_records_(\d{6})\.parquet$')
+
+PARTITION_INDEXES = [
+    # Check-out and financial reports
+    IndexModel([('handled_by', ASCENDING), ('checkout_time', DESCENDING)], name='handler_checkout_time')
+]
+
+# Partitions whose indexes this process has created (shared with async_db)
+ensured_partitions = set()
+
+# Whether the pre-partitioning collection still holds records
+_legacy_state = TTLCache(1, 300)
+
+
+def month_of(moment):
+    return moment.strftime('%Y%m')
+
+
+def partition_name(moment):
+    return f'{PREFIX}_{month_of(moment)}'
+
+
+def archive_path(month):
+    return os.path.join(ARCHIVE_DIR, f'{PREFIX}_{month}.parquet')
+
+
+def ensure_partition(name):
+    if name not in ensured_partitions:
+        db[name].create_indexes(PARTITION_INDEXES)
+        ensured_partitions.add(name)
+
+
+def partition_for(moment):
+    # Collection for a record checked out at `moment`; a new month gets its indexes on first use
+    name = partition_name(moment)
+    ensure_partition(name)
+    return db[name]
+
+
+def hot_months():
+    return sorted(match.group(1) for match in map(PARTITION_PATTERN.match, db.list_collection_names()) if match)
+
+
+def archived_months():
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(match.group(1) for match in map(ARCHIVE_PATTERN.match, os.listdir(ARCHIVE_DIR)) if match)
+
+
+def ensure_partition_indexes():
+    # Every existing partition plus the current month's; part of ensure_indexes()
+    ensured_partitions.clear()
+    for month in sorted(set(hot_months()) | {month_of(datetime.now())}):
+        ensure_partition(f'{PREFIX}_{month}')
+
+
+def _checkout_range(query):
+    # (first, last) checkout times a query can match, None where it is unbounded
+    condition = query.get('checkout_time')
+    if not isinstance(condition, dict):
+        return (condition, condition) if isinstance(condition, datetime) else (None, None)
+    first = condition.get('$gte', condition.get('$gt'))
+    last = condition.get('$lte', condition.get('$lt'))
+    if '$lt' in condition and '$lte' not in condition:
+        last = condition['$lt'] - timedelta(microseconds=1)
+    return first, last
+
+
+def months_for(query):
+    # Months whose partition or archive file can hold records matching the query
+    first, last = _checkout_range(query)
+    if first is None or last is None:
+        known = sorted(set(hot_months()) | set(archived_months()))
+        return [month for month in known
+                if (first is None or month >= month_of(first)) and (last is None or month <= month_of(last))]
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append(f'{year:04d}{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def legacy_records_present():
+    present = _legacy_state.get('present')
+    if present is None:
+        present = PREFIX in db.list_collection_names() and completed_records.find_one({}, {'_id': 1}) is not None
+        _legacy_state.set('present', present)
+    return present
+
+
+def _with_id(projection):
+    # The projection with _id included, so records can be matched across tiers
+    if not projection:
+        return projection
+    return {key: value for key, value in projection.items() if key != '_id'} or None
+
+
+def _find_archived_month(month, query, projection, batch_size, session=None):
+    # The archive file is only renamed into place once complete. Records written to the month
+    # since are still in its partition; one in both places (archiving stopped before the
+    # partition was cleared) is returned once.
+    from archive import read_archive
+    drop_id = bool(projection) and not projection.get('_id', 1)
+    fetch = _with_id(projection)
+    leftovers = list(db[f'{PREFIX}_{month}'].find(query, fetch, session=session))
+    seen = {record['_id'] for record in leftovers}
+    archived = (record for record in read_archive(archive_path(month), query, fetch, batch_size)
+                if record['_id'] not in seen)
+    for record in chain(leftovers, archived):
+        if drop_id:
+            record.pop('_id', None)
+        yield record
+
+
+def find_completed(query, projection=None, batch_size=None, session=None):
+    # Completed records matching a find() filter, across hot partitions, archived months and the
+    # pre-partitioning collection. Results are grouped by month, not sorted.
+    for month in months_for(query):
+        if os.path.exists(archive_path(month)):
+            yield from _find_archived_month(month, query, projection, batch_size, session)
+        else:
+            cursor = db[f'{PREFIX}_{month}'].find(query, projection, session=session)
+            if batch_size:
+                cursor = cursor.batch_size(batch_size)
+            yield from cursor
+    if legacy_records_present():
+        cursor = completed_records.find(query, projection, session=session)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        yield from cursor
+
+
+def find_one_completed(query, projection=None):
+    return next(find_completed(query, projection), None)
+
+
+def completed_ids(ids, since, session=None):
+    # Which of these ticket _ids already have a completed record, checked out at or after since
+    query = {'_id': {'$in': list(ids)}, 'checkout_time': {'$gte': since}}
+    return {record['_id'] for record in find_completed(query, {'_id': 1}, session=session)}
+
+
+def migrate_legacy_records(batch_size=1000):
+    # Moves records from the unpartitioned collection into their monthly partitions; safe to rerun
+    moved = 0
+    while True:
+        batch = list(completed_records.find({}).sort('_id', ASCENDING).limit(batch_size))
+        if not batch:
+            break
+        by_month = {}
+        for record in batch:
+            by_month.setdefault(partition_name(record['checkout_time']), []).append(record)
+        for name, records in by_month.items():
+            ensure_partition(name)
+            try:
+                db[name].insert_many(records, ordered=False)
+            except BulkWriteError as e:
+                # Already copied by an earlier, interrupted run
+                if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                    raise
+        completed_records.delete_many({'_id': {'$in': [record['_id'] for record in batch]}})
+        moved += len(batch)
+    db.drop_collection(PREFIX)
+    _legacy_state.clear()
+    return moved
@@ -0,0 +1,69 @@
+from datetime import datetime
+from flask import current_app, request
+
+# Compiled receipt templates, loaded once per process (reloaded on every use in debug mode)
+_templates = {}
+
+
+def _get_template(name):
+    template = _templates.get(name)
+    if template is None or current_app.debug:
+        template = current_app.jinja_env.get_template(name)
+        _templates[name] = template
+    return template
+
+
+def checkin_receipt_fields(vehicle_number, checkin_time, rate, payment_mode, staff):
+    return {
+        'vehicle_number': vehicle_number,
+        'checkin_time': checkin_time,
+        'initial_amount': rate['initial_amount'],
+        'initial_duration': rate['initial_duration'],
+        'extra_charge': rate['extra_charge'],
+        'extra_charge_duration': rate['extra_charge_duration'],
+        'payment_mode': payment_mode,
+        'staff': staff
+    }
+
+
+def checkout_receipt_fields(vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, staff):
+    return {
+        'vehicle_number': vehicle['vehicle_number'],
+        'checkin_time': vehicle['checkin_time'],
+        'checkout_time': checkout_time,
+        'initial_amount': rate['initial_amount'],
+        'initial_payment_mode': vehicle.get('payment_mode', 'N/A'),
+        'additional_charge': additional_charge,
+        'additional_payment_mode': payment_mode if additional_charge > 0 else None,
+        'total_charge': total_charge,
+        'staff': staff
+    }
+
+
+def wants_compact_receipt():
+    # Clients opt in with receipt_format=compact and render the receipt themselves
+    return (request.values.get('receipt_format') or '').lower() == 'compact'
+
+
+def compact_receipt(kind, fields):
+    return {
+        'receipt_type': kind,
+        'receipt_data': {
+            key: value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+            for key, value in fields.items()
+        }
+    }
+
+
+def receipt_template_name(kind):
+    return f'receipts/{kind}_receipt.html'
+
+
+def receipt_payload(kind, fields, compact=None):
+    # Either the rendered receipt HTML or just its fields, as the response's receipt entry.
+    # compact defaults to the request's receipt_format.
+    if compact is None:
+        compact = wants_compact_receipt()
+    if compact:
+        return compact_receipt(kind, fields)
+    return {'receipt': _get_template(receipt_template_name(kind)).render(**fields)}
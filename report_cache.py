@@ -0,0 +1,232 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, date, timedelta
+from urllib.parse import quote
+from config import REPORT_CACHE_DIR, REPORT_CACHE_MAX_BYTES, REPORT_CACHE_OPEN_TTL
+from metrics import register_collector
+
+# Generated report files on local disk, laid out as
+#
+#   REPORT_CACHE_DIR/<user>/<day or first_last>/<report_type>.v<schema>.<format>
+#
+# A report over closed days only changes when a record of one of those days is written late
+# (a ticket from yesterday checked out today, an offline journal replay), and those writes call
+# invalidate(). Entries written before their last day closed are reused for open_ttl seconds.
+# Least recently served files are evicted once the directory grows past max_bytes. Worker
+# processes on one host share the directory; each host has its own.
+
+# Touched by invalidate(); a report started before it was touched is not stored
+STAMP = '.invalidated'
+
+
+class ReportCache:
+
+    def __init__(self, directory, max_bytes, open_ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def _user_dir(self, user):
+        return os.path.join(self.directory, quote(user, safe='').replace('.', '%2E'))
+
+    def _path(self, key):
+        # key: (user, report_type, first_day, last_day, schema_version, format)
+        user, report_type, first_day, last_day, version, fmt = key
+        span = first_day.isoformat() if first_day == last_day else f'{first_day.isoformat()}_{last_day.isoformat()}'
+        return os.path.join(self._user_dir(user), span, f'{report_type}.v{version}.{fmt}')
+
+    def cacheable(self, key):
+        return self.open_ttl > 0 or key[3] < date.today()
+
+    def open(self, key):
+        # The cached file opened for reading, or None. The open file stays readable if the
+        # entry is evicted or invalidated while it is being sent.
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        modified = os.fstat(f.fileno()).st_mtime
+        closed_at = datetime.combine(key[3] + timedelta(days=1), datetime.min.time()).timestamp()
+        if modified < closed_at and time.time() - modified > self.open_ttl:
+            f.close()
+            self._count('misses')
+            return None
+        try:
+            # Access time drives eviction; set explicitly so noatime mounts behave the same
+            os.utime(path, (time.time(), modified))
+        except OSError:
+            pass
+        self._count('hits')
+        return f
+
+    def _partial_path(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f'{path}.{os.getpid()}-{threading.get_ident()}.partial'
+
+    def _commit(self, key, partial, started):
+        path = self._path(key)
+        os.replace(partial, path)
+        # Checked after the rename: an invalidate() after this point removes the file itself
+        if self._invalidated_since(key[0], started):
+            os.remove(path)
+            return
+        self._count('stores')
+        self._evict()
+
+    def store_file(self, key, source, started):
+        # Copies a finished report (a file object positioned at its start) into the cache
+        partial = None
+        try:
+            partial = self._partial_path(self._path(key))
+            with open(partial, 'wb') as f:
+                shutil.copyfileobj(source, f)
+            self._commit(key, partial, started)
+        except OSError as e:
+            print(f"Error caching report: {str(e)}")
+            if partial and os.path.exists(partial):
+                os.remove(partial)
+
+    def store_chunks(self, key, chunks, started):
+        # Passes text chunks through while writing them to the cache; a download cut short is
+        # not stored
+        partial = None
+        f = None
+        try:
+            partial = self._partial_path(self._path(key))
+            f = open(partial, 'wb')
+        except OSError as e:
+            print(f"Error caching report: {str(e)}")
+        complete = False
+        try:
+            for chunk in chunks:
+                if f:
+                    f.write(chunk.encode('utf-8'))
+                yield chunk
+            complete = True
+        finally:
+            if f:
+                f.close()
+                try:
+                    if complete:
+                        self._commit(key, partial, started)
+                    else:
+                        os.remove(partial)
+                except OSError as e:
+                    print(f"Error caching report: {str(e)}")
+
+    def _invalidated_since(self, user, started):
+        try:
+            return os.stat(os.path.join(self._user_dir(user), STAMP)).st_mtime >= started
+        except FileNotFoundError:
+            return False
+
+    def invalidate(self, user, *moments):
+        # Drops the user's reports covering the closed days of the given datetimes. Days that
+        # are still open are left to open_ttl, so the common same-day write costs nothing.
+        today = date.today()
+        days = {moment.date().isoformat() for moment in moments if moment is not None and moment.date() < today}
+        if not user or not days:
+            return
+        try:
+            user_dir = self._user_dir(user)
+            os.makedirs(user_dir, exist_ok=True)
+            stamp = os.path.join(user_dir, STAMP)
+            with open(stamp, 'a'):
+                pass
+            os.utime(stamp)
+            for name in os.listdir(user_dir):
+                if name == STAMP:
+                    continue
+                first, _, last = name.partition('_')
+                last = last or first
+                if any(first <= day <= last for day in days):
+                    shutil.rmtree(os.path.join(user_dir, name), ignore_errors=True)
+                    self._count('invalidations')
+        except OSError as e:
+            print(f"Error invalidating cached reports: {str(e)}")
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name == STAMP or name.endswith('.partial'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_atime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._count('evictions')
+            except FileNotFoundError:
+                pass
+            total -= size
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            return {
+                'files': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'open_ttl': self.open_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+report_cache = ReportCache(REPORT_CACHE_DIR, REPORT_CACHE_MAX_BYTES, REPORT_CACHE_OPEN_TTL)
+
+
+def _report_cache_metrics():
+    stats = report_cache.stats()
+    lines = []
+    for field, metric_type, help_text in (
+        ('hits', 'counter', 'Reports served from the report cache.'),
+        ('misses', 'counter', 'Cacheable reports that had to be generated.'),
+        ('evictions', 'counter', 'Cached reports evicted to stay under REPORT_CACHE_MAX_BYTES.'),
+        ('invalidations', 'counter', 'Cached report spans dropped by late writes.'),
+        ('bytes', 'gauge', 'Bytes of cached report files.')
+    ):
+        name = f'report_cache_{field}_total' if metric_type == 'counter' else f'report_cache_{field}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        lines.append(f'{name} {stats[field]}')
+    return lines
+
+
+register_collector(_report_cache_metrics)
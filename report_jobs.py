@@ -0,0 +1,258 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from config import (
+    mongo,
+    report_jobs_collection,
+    REPORT_JOB_DIR,
+    REPORT_JOB_EXECUTOR,
+    REPORT_JOB_WORKERS,
+    REPORT_JOBS_PER_ADMIN,
+    REPORT_JOB_TIMEOUT,
+    REPORT_JOB_RETENTION
+)
+from metrics import Counter, register_collector
+
+# Reports built outside the request: a job is submitted, runs in a bounded pool next to the
+# web worker and is downloaded once done. Job state lives in the report_jobs collection, so any
+# worker can answer status and cancel requests; the file is written to REPORT_JOB_DIR on the
+# host that ran the job.
+#
+#   queued -> running -> done | failed | cancelled
+#
+# A queued job is only started if it is still queued, and a running one checks for
+# cancellation once per REPORT_BATCH_SIZE rows.
+
+ACTIVE = ('queued', 'running')
+
+report_jobs_total = Counter(
+    'report_jobs_total', 'Report jobs by outcome (done, failed, cancelled, rejected).',
+    ('outcome',))
+
+
+def _init_worker(uri, db_name, options):
+    # Runs once in each pool process: same database as the web worker that started the pool
+    mongo.configure(uri, db_name, options)
+
+
+def _result_path(job_id, report_format):
+    return os.path.join(REPORT_JOB_DIR, f'{job_id}.{report_format}')
+
+
+def run_job(job_id):
+    # Executed in the pool. Returns the final status.
+    job = report_jobs_collection.find_one_and_update(
+        {'_id': job_id, 'status': 'queued'},
+        {'$set': {'status': 'running', 'started_at': datetime.now(), 'pid': os.getpid()}})
+    if not job:
+        # Cancelled (or expired) while it waited
+        return None
+
+    from routes.generate_report import build_report, ReportCancelled
+    params = job['params']
+    path = _result_path(job_id, params['format'])
+    deadline = time.monotonic() + REPORT_JOB_TIMEOUT
+
+    def cancelled():
+        if time.monotonic() > deadline:
+            return True
+        current = report_jobs_collection.find_one({'_id': job_id}, {'status': 1})
+        return not current or current['status'] != 'running'
+
+    os.makedirs(REPORT_JOB_DIR, exist_ok=True)
+    partial = f'{path}.partial'
+    try:
+        with open(partial, 'wb') as output:
+            build_report(params['report_type'], params['selected_user'], params.get('date'),
+                         params.get('start_date'), params.get('end_date'), params['format'], output, cancelled)
+        os.replace(partial, path)
+        update = {'status': 'done', 'size': os.path.getsize(path)}
+    except ReportCancelled:
+        if time.monotonic() <= deadline:
+            return 'cancelled'
+        update = {'status': 'failed', 'error': f'Timed out after {REPORT_JOB_TIMEOUT:.0f}s'}
+    except Exception as e:
+        print(f"Error running report job {job_id}: {str(e)}")
+        update = {'status': 'failed', 'error': str(e)}
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    update['finished_at'] = datetime.now()
+    finished = report_jobs_collection.update_one({'_id': job_id, 'status': 'running'}, {'$set': update})
+    if not finished.matched_count:
+        # Cancelled or expired between the last check and the end of the build
+        if os.path.exists(path):
+            os.remove(path)
+        return 'cancelled'
+    return update['status']
+
+
+class ReportJobs:
+
+    def __init__(self, executor, workers, per_admin, timeout, retention):
+        self.executor = executor
+        self.workers = max(workers, 1)
+        self.per_admin = per_admin
+        self.timeout = timeout
+        self.retention = retention
+        self._pool = None
+        self._pid = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # One pool per web worker process, created on first use (after gunicorn's fork)
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                if self.executor == 'thread':
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='report-job')
+                else:
+                    # Spawned, not forked: forking a process with running threads (the mail
+                    # and sync workers, the driver's monitors) can leave locks held in the child
+                    options = {key: value for key, value in mongo.options.items() if key != 'event_listeners'}
+                    self._pool = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker, initargs=(mongo.uri, mongo.db_name, options))
+                self._pid = os.getpid()
+                self._futures = {}
+            return self._pool
+
+    def _start(self, job_id):
+        try:
+            future = self._executor().submit(run_job, job_id)
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed for memory); later jobs get a new pool
+            with self._lock:
+                self._pool = None
+            future = self._executor().submit(run_job, job_id)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+
+    def _finished(self, job_id, future):
+        self._futures.pop(job_id, None)
+        if future.cancelled():
+            report_jobs_total.inc('cancelled')
+            return
+        error = future.exception()
+        if error is None:
+            if future.result():
+                report_jobs_total.inc(future.result())
+            return
+        # run_job records its own failures, so this is the pool itself breaking
+        print(f"Report job {job_id} lost: {str(error)}")
+        report_jobs_total.inc('failed')
+        report_jobs_collection.update_one(
+            {'_id': job_id, 'status': {'$in': list(ACTIVE)}},
+            {'$set': {'status': 'failed', 'error': 'Report worker stopped', 'finished_at': datetime.now()}})
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._pool = None
+
+    def _expire(self, admin):
+        # Jobs past the timeout are failed, including those left behind by a worker that exited
+        cutoff = datetime.now() - timedelta(seconds=self.timeout)
+        report_jobs_collection.update_many(
+            {'admin': admin, 'status': {'$in': list(ACTIVE)}, 'created_at': {'$lt': cutoff}},
+            {'$set': {'status': 'failed', 'error': 'Timed out', 'finished_at': datetime.now()}})
+
+    def purge(self):
+        # Finished jobs older than the retention period, with their files
+        cutoff = datetime.now() - timedelta(seconds=self.retention)
+        for job in report_jobs_collection.find(
+                {'status': {'$nin': list(ACTIVE)}, 'finished_at': {'$lt': cutoff}}, {'params.format': 1}):
+            path = _result_path(job['_id'], job['params']['format'])
+            if os.path.exists(path):
+                os.remove(path)
+            report_jobs_collection.delete_one({'_id': job['_id']})
+
+    def submit(self, admin, params):
+        # Returns (job, None), or (None, message) when the admin is at their limit
+        self.purge()
+        self._expire(admin)
+        job = {
+            '_id': ObjectId(),
+            'admin': admin,
+            'params': params,
+            'status': 'queued',
+            'created_at': datetime.now()
+        }
+        report_jobs_collection.insert_one(job)
+        # Counted after the insert, so concurrent submits cannot both slip under the limit
+        ahead = report_jobs_collection.count_documents(
+            {'admin': admin, 'status': {'$in': list(ACTIVE)}, '_id': {'$lte': job['_id']}})
+        if ahead > self.per_admin:
+            report_jobs_collection.delete_one({'_id': job['_id']})
+            report_jobs_total.inc('rejected')
+            return None, f'You already have {self.per_admin} reports in progress'
+        self._start(job['_id'])
+        return job, None
+
+    def get(self, admin, job_id):
+        # The admin's job, or None (other admins' jobs are not visible)
+        try:
+            job_id = ObjectId(job_id)
+        except (InvalidId, TypeError):
+            return None
+        self._expire(admin)
+        return report_jobs_collection.find_one({'_id': job_id, 'admin': admin})
+
+    def cancel(self, admin, job_id):
+        # Returns the job after the attempt; only queued and running jobs change
+        job = self.get(admin, job_id)
+        if not job:
+            return None
+        report_jobs_collection.update_one(
+            {'_id': job['_id'], 'status': {'$in': list(ACTIVE)}},
+            {'$set': {'status': 'cancelled', 'finished_at': datetime.now()}})
+        future = self._futures.get(job['_id'])
+        if future:
+            # Drops it from this worker's queue if it has not started
+            future.cancel()
+        return report_jobs_collection.find_one({'_id': job['_id']})
+
+    def result_path(self, job):
+        return _result_path(job['_id'], job['params']['format'])
+
+    def pending(self):
+        return sum(1 for future in list(self._futures.values()) if not future.done())
+
+
+report_jobs = ReportJobs(REPORT_JOB_EXECUTOR, REPORT_JOB_WORKERS, REPORT_JOBS_PER_ADMIN,
+                         REPORT_JOB_TIMEOUT, REPORT_JOB_RETENTION)
+
+
+def job_payload(job):
+    # JSON view of a job document
+    payload = {
+        'job_id': str(job['_id']),
+        'status': job['status'],
+        'report_type': job['params']['report_type'],
+        'selected_user': job['params']['selected_user'],
+        'format': job['params']['format'],
+        'created_at': job['created_at'].isoformat(timespec='seconds')
+    }
+    for field in ('started_at', 'finished_at'):
+        if job.get(field):
+            payload[field] = job[field].isoformat(timespec='seconds')
+    for field in ('size', 'error'):
+        if job.get(field) is not None:
+            payload[field] = job[field]
+    return payload
+
+
+def _report_job_metrics():
+    return report_jobs_total.render() + [
+        '# HELP report_jobs_pending Report jobs queued or running in this worker\'s pool.',
+        '# TYPE report_jobs_pending gauge',
+        f'report_jobs_pending {report_jobs.pending()}'
+    ]
+
+
+register_collector(_report_job_metrics)
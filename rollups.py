@@ -0,0 +1,132 @@
+from datetime import timedelta
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from config import daily_rollups
+from partitions import find_completed
+
+# Daily totals per (handled_by, day, payment_mode), kept in step with the completed records
+
+
+def rollup_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_updates(record):
+    # The initial payment counts toward its own mode, an additional charge toward the mode it was paid with
+    day = rollup_day(record['checkout_time'])
+    updates = [UpdateOne(
+        {'handled_by': record['handled_by'], 'day': day, 'payment_mode': record['initial_payment_mode']},
+        {'$inc': {
+            'checkout_count': 1,
+            'initial_amount': record['initial_payment'],
+            'total_amount': record['initial_payment']
+        }},
+        upsert=True
+    )]
+    if record['additional_charge'] > 0 and record['additional_payment_mode']:
+        updates.append(UpdateOne(
+            {'handled_by': record['handled_by'], 'day': day, 'payment_mode': record['additional_payment_mode']},
+            {'$inc': {
+                'additional_amount': record['additional_charge'],
+                'total_amount': record['additional_charge']
+            }},
+            upsert=True
+        ))
+    return updates
+
+
+def update_rollups(records, session=None):
+    updates = [update for record in records for update in rollup_updates(record)]
+    if updates:
+        daily_rollups.bulk_write(updates, ordered=False, session=session)
+
+
+ROLLUP_PROJECTION = {
+    'handled_by': 1,
+    'checkout_time': 1,
+    'initial_payment': 1,
+    'initial_payment_mode': 1,
+    'additional_charge': 1,
+    'additional_payment_mode': 1,
+    '_id': 0
+}
+
+
+def _sum_records(records):
+    # {(handled_by, day, payment_mode): totals} for a stream of completed records
+    totals = {}
+
+    def totals_for(handler, day, mode):
+        key = (handler, day, mode)
+        if key not in totals:
+            totals[key] = {
+                'checkout_count': 0,
+                'initial_amount': 0,
+                'additional_amount': 0,
+                'total_amount': 0
+            }
+        return totals[key]
+
+    for record in records:
+        day = rollup_day(record['checkout_time'])
+        initial = record.get('initial_payment') or 0
+        entry = totals_for(record.get('handled_by'), day, record.get('initial_payment_mode'))
+        entry['checkout_count'] += 1
+        entry['initial_amount'] += initial
+        entry['total_amount'] += initial
+
+        additional = record.get('additional_charge') or 0
+        if additional > 0 and record.get('additional_payment_mode') is not None:
+            entry = totals_for(record.get('handled_by'), day, record['additional_payment_mode'])
+            entry['additional_amount'] += additional
+            entry['total_amount'] += additional
+    return totals
+
+
+def backfill_rollups(start=None, end=None, batch_size=1000):
+    # Recomputes rollups from the completed records for checkouts in [start, end), or all history.
+    # The records are streamed and summed here, so archived months count the same as hot partitions.
+    match = {}
+    if start or end:
+        match['checkout_time'] = {}
+        if start:
+            match['checkout_time']['$gte'] = start
+        if end:
+            match['checkout_time']['$lt'] = end
+
+    totals = _sum_records(find_completed(match, ROLLUP_PROJECTION, batch_size=batch_size))
+
+    replacements = []
+    for (handler, day, mode), entry in totals.items():
+        key = {'handled_by': handler, 'day': day, 'payment_mode': mode}
+        replacements.append(ReplaceOne(key, dict(key, **entry), upsert=True))
+        if len(replacements) >= batch_size:
+            daily_rollups.bulk_write(replacements, ordered=False)
+            replacements = []
+    if replacements:
+        daily_rollups.bulk_write(replacements, ordered=False)
+    return len(totals)
+
+
+def rebuild_rollup(handler, moment):
+    # Recomputes one handler's rollups for the day of `moment` from the completed records. Unlike
+    # update_rollups() it can be repeated safely, for writes that may or may not have been counted
+    # (an offline replay resumed after a crash). A checkout by the same handler counted while this
+    # runs can be overwritten; `flask backfill-rollups` for the day puts it back.
+    day = rollup_day(moment)
+    records = find_completed({'handled_by': handler, 'checkout_time': {'$gte': day, '$lt': day + timedelta(days=1)}},
+                             ROLLUP_PROJECTION)
+    totals = _sum_records(records)
+    updates = [DeleteMany({'handled_by': handler, 'day': day,
+                           'payment_mode': {'$nin': [mode for _, _, mode in totals]}})]
+    for (_, _, mode), entry in totals.items():
+        key = {'handled_by': handler, 'day': day, 'payment_mode': mode}
+        updates.append(ReplaceOne(key, dict(key, **entry), upsert=True))
+    daily_rollups.bulk_write(updates, ordered=True)
+
+
+def find_rollups(handler, start_day, end_day):
+    # Rollup documents for one handler between two days, inclusive
+    return daily_rollups.find({
+        'handled_by': handler,
+        'day': {'$gte': rollup_day(start_day), '$lte': rollup_day(end_day)}
+    }).sort([('day', 1), ('payment_mode', 1)])
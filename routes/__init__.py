@@ -1,43 +1,75 @@
 # This file makes the routes directory a Python package
 
-from .admin_dashboard import admin_dashboard
-from .admin_register import admin_register
-from .calculate_charge import calculate_charge
-from .checkin import checkin
-from .checkout import checkout
-from .create_user import create_user
-from .delete_admin import delete_admin
-from .delete_user import delete_user
-from .generate_admin_code import generate_admin_code
-from .generate_report import generate_report
-from .get_vehicle_suggestions import get_vehicle_suggestions
-from .handle_vehicle import handle_vehicle
-from .home import home
-from .index import index
-from .login import login
-from .logout import logout
-from .register import register
-from .setup_default_user import setup_default_user
-from .update_existing_admins import update_existing_admins
+# Route modules are imported on first use rather than with the package, so a cold worker only
+# loads what it serves (generate_report alone pulls in openpyxl)
+import importlib
 
 __all__ = [
     'admin_dashboard',
     'admin_register',
+    'bulk_operations',
+    'cache_stats',
     'calculate_charge',
+    'cancel_report_job',
     'checkin',
     'checkout',
     'create_user',
     'delete_admin',
     'delete_user',
+    'download_report_job',
+    'export_metrics',
     'generate_admin_code',
     'generate_report',
     'get_vehicle_suggestions',
     'handle_vehicle',
+    'health',
     'home',
     'index',
+    'list_active_vehicles',
+    'list_admins',
+    'list_users',
     'login',
     'logout',
+    'offline_status',
     'register',
+    'report_job_status',
     'setup_default_user',
+    'submit_report_job',
     'update_existing_admins'
-] 
\ No newline at end of file
+] 
+
+
+class LazyView:
+    # Stands in for a view function and imports its module the first time it is called
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._view = None
+
+    def __call__(self, *args, **kwargs):
+        view = self._view
+        if view is None:
+            view = self._view = load(self.__name__)
+        return view(*args, **kwargs)
+
+
+def load(name):
+    # routes/<name>.py defines a function of the same name
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    view = getattr(importlib.import_module(f'{__name__}.{name}'), name)
+    # Importing the submodule bound routes.<name> to the module; point it back at the function
+    globals()[name] = view
+    return view
+
+
+def lazy_view(name):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return LazyView(name)
+
+
+def __getattr__(name):
+    # `from routes import checkin` imports only that module. Once some other module has imported
+    # routes.checkin directly, the package attribute is that submodule, so app.py uses lazy_view
+    return load(name)
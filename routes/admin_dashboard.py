@@ -1,15 +1,13 @@
-from flask import session, redirect, url_for, render_template
+from flask import session, redirect, url_for, render_template, make_response
 from datetime import datetime
-from config import users_collection, admins_collection, vehicles_collection
+import time
+from config import users_collection
 
-def admin_dashboard():
-    if not session.get('is_admin'):
-        return redirect(url_for('route_login'))
-    
-    current_admin = session['username']
-    
-    # Get only users created by this admin
-    regular_users = list(users_collection.aggregate([
+def dashboard_pipeline(current_admin, today_start):
+    # Users created by this admin with their active vehicle and today's check-in counts in one aggregation.
+    # Each user's active tickets are counted inside the $lookup, so only one small document per
+    # user is joined however many vehicles they have handled (needs MongoDB 5.0+).
+    return [
         {
             '$match': {
                 'created_by': current_admin  # Only get users created by current admin
@@ -17,46 +15,70 @@ def admin_dashboard():
         },
         {
             '$lookup': {
-                'from': 'rates',
-                'localField': 'rate_id',
-                'foreignField': '_id',
-                'as': 'rate'
+                'from': 'vehicles',
+                'localField': 'username',
+                'foreignField': 'handled_by',
+                'pipeline': [
+                    {'$match': {'checkout_time': None}},
+                    {'$group': {
+                        '_id': None,
+                        'active': {'$sum': 1},
+                        'today': {'$sum': {'$cond': [{'$gte': ['$checkin_time', today_start]}, 1, 0]}}
+                    }}
+                ],
+                'as': 'vehicle_counts'
             }
         },
         {
-            '$unwind': {
-                'path': '$rate',
-                'preserveNullAndEmptyArrays': True
+            '$facet': {
+                'usernames': [
+                    {'$project': {'_id': 0, 'username': 1}},
+                    {'$sort': {'username': 1}}
+                ],
+                'vehicle_counts': [
+                    {'$unwind': '$vehicle_counts'},
+                    {'$group': {
+                        '_id': None,
+                        'active': {'$sum': '$vehicle_counts.active'},
+                        'today': {'$sum': '$vehicle_counts.today'}
+                    }}
+                ]
             }
-        },
-        {
-            '$sort': {'created_at': -1}
         }
-    ]))
-    
-    # Get active vehicles only for users created by this admin
-    active_vehicles = list(vehicles_collection.find({
-        'handled_by': {'$in': [user['username'] for user in regular_users]},
-        'checkout_time': None
-    }).sort('checkin_time', -1))
-    
-    # Get admin users
-    admin_users = list(admins_collection.find().sort('created_at', -1))
-    
-    # Get total users count for this admin
-    total_users = len(regular_users)
-    
-    # Get today's check-ins count for users created by this admin
+    ]
+
+def dashboard_context(dashboard, current_admin):
+    # Only counts and usernames are loaded here; the tables fetch their rows page by page
+    report_users = [user['username'] for user in dashboard['usernames']]
+    counts = dashboard['vehicle_counts'][0] if dashboard['vehicle_counts'] else {'active': 0, 'today': 0}
+    return {
+        'report_users': report_users,
+        'active_count': counts['active'],
+        'current_user': current_admin,
+        'total_users': len(report_users),
+        'todays_checkins': counts['today']
+    }
+
+def server_timing(timings):
+    # Per-section timings show up in the browser's network panel
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
+
+def admin_dashboard():
+    if not session.get('is_admin'):
+        return redirect(url_for('route_login'))
+
+    current_admin = session['username']
     today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    todays_checkins = vehicles_collection.count_documents({
-        'handled_by': {'$in': [user['username'] for user in regular_users]},
-        'checkin_time': {'$gte': today_start}
-    })
-
-    return render_template('admin_dashboard.html',
-                         regular_users=regular_users,
-                         admin_users=admin_users,
-                         active_vehicles=active_vehicles,
-                         current_user=current_admin,
-                         total_users=total_users,
-                         todays_checkins=todays_checkins) 
\ No newline at end of file
+    timings = {}
+
+    started = time.perf_counter()
+    dashboard = next(users_collection.aggregate(dashboard_pipeline(current_admin, today_start)))
+    timings['users_vehicles'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    response = make_response(render_template('admin_dashboard.html',
+                         **dashboard_context(dashboard, current_admin)))
+    timings['render'] = time.perf_counter() - started
+
+    response.headers['Server-Timing'] = server_timing(timings)
+    return response
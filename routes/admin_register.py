@@ -3,17 +3,17 @@ from datetime import datetime
 from config import admins_collection
 import logging
 import random
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from dotenv import load_dotenv
+from mail_queue import mail_queue
+from bootstrap_state import invalidate as invalidate_bootstrap_state
 
 # Load environment variables
 load_dotenv()
 
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
-ADMIN_APP_PASSWORD = os.getenv('ADMIN_APP_PASSWORD')
 
 def send_otp_email(otp):
     try:
@@ -25,12 +25,8 @@ def send_otp_email(otp):
         body = f"Your OTP for admin registration is: {otp}"
         msg.attach(MIMEText(body, 'plain'))
         
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(ADMIN_EMAIL, ADMIN_APP_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        return True
+        # Sent by the background mail worker; the request does not wait for SMTP
+        return mail_queue.send(msg)
     except Exception as e:
         print(f"Error sending email: {str(e)}")
         return False
@@ -59,6 +55,7 @@ def admin_register():
                 
                 try:
                     result = admins_collection.insert_one(admin)
+                    invalidate_bootstrap_state()
                     if result.inserted_id:
                         # Clear session data
                         session.pop('admin_registration_otp', None)
@@ -100,7 +97,7 @@ def admin_register():
             
             # Send OTP via email
             if send_otp_email(otp):
-                flash('OTP has been sent to admin email', 'success')
+                flash('OTP is on its way to the admin email', 'success')
                 return render_template('admin_register.html', show_otp_form=True)
             else:
                 flash('Failed to send OTP. Please try again', 'danger')
@@ -0,0 +1,265 @@
+from flask import session, redirect, url_for, request, jsonify
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from config import client, vehicles_collection, MONGO_TRANSACTIONS, BULK_MAX_OPERATIONS
+from partitions import completed_ids, partition_for
+from cache import get_user_rate
+from suggestion_index import suggestion_index
+from rollups import update_rollups
+from receipts import checkin_receipt_fields, checkout_receipt_fields, receipt_payload
+from offline_journal import offline_journal
+from report_cache import report_cache
+from routes.checkin import new_ticket
+from routes.checkout import (
+    additional_payment_response,
+    calculate_checkout_charges,
+    checkout_timestamp,
+    completed_record_for,
+    get_checkout_rate,
+    unclaimed_response
+)
+
+
+def _write_errors(error):
+    # Index in the submitted batch -> write error, from an unordered bulk write
+    return {write_error['index']: write_error for write_error in error.details.get('writeErrors', [])}
+
+
+def bulk_checkin(operations, handler_username, compact):
+    user, rate = get_user_rate(handler_username)
+    if not user or not rate:
+        message = 'User not found!' if not user else 'Rate configuration not found!'
+        return [{'error': True, 'message': message} for _ in operations]
+
+    checkin_time = datetime.now()
+    tickets = [new_ticket(op['vehicle_number'], op['payment_mode'], handler_username, rate, checkin_time)
+               for op in operations]
+    failed = {}
+    try:
+        # Unordered, so one duplicate does not stop the rest of the burst
+        vehicles_collection.insert_many(tickets, ordered=False)
+    except BulkWriteError as e:
+        failed = _write_errors(e)
+
+    results = []
+    for i, op in enumerate(operations):
+        vehicle_number = op['vehicle_number']
+        if i in failed:
+            if failed[i].get('code') == 11000:
+                message = f'Vehicle {vehicle_number} is already checked in under your account!'
+            else:
+                message = f'Error during check-in: {failed[i].get("errmsg")}'
+            results.append({'error': True, 'message': message})
+            continue
+        suggestion_index.add(handler_username, vehicle_number)
+        if offline_journal.enabled:
+            offline_journal.mirror_checkin(tickets[i])
+        results.append({
+            'success': True,
+            'message': f'Vehicle {vehicle_number} has been successfully checked in!',
+            **receipt_payload('checkin', checkin_receipt_fields(
+                vehicle_number, checkin_time, rate, op['payment_mode'], handler_username), compact)
+        })
+    return results
+
+
+def complete_batch(db_session, operations, handler_username, checkout_time):
+    # Prices every ticket from one query, then records and removes the payable ones in bulk.
+    # Returns one result per operation; completed ones carry the closed ticket and charges.
+    plates = list({op['vehicle_number'] for op in operations})
+    active = {}
+    for vehicle in vehicles_collection.find({
+        'vehicle_number': {'$in': plates},
+        'handled_by': handler_username,
+        'checkout_time': None
+    }, session=db_session):
+        active[vehicle['vehicle_number']] = vehicle
+
+    results = [None] * len(operations)
+    pending = []
+    for i, op in enumerate(operations):
+        vehicle = active.pop(op['vehicle_number'], None)
+        if not vehicle:
+            continue
+        rate = get_checkout_rate(vehicle, db_session)
+        if not rate:
+            results[i] = {'error': True, 'message': 'Rate configuration not found!'}
+            continue
+        additional_charge, total_charge = calculate_checkout_charges(vehicle, rate, checkout_time)
+        if additional_charge > 0 and not op.get('payment_mode'):
+            results[i] = additional_payment_response(vehicle, rate, checkout_time, additional_charge, total_charge)
+            continue
+        pending.append((i, {
+            'vehicle': vehicle,
+            'rate': rate,
+            'additional_charge': additional_charge,
+            'total_charge': total_charge,
+            'record': completed_record_for(vehicle, rate, checkout_time, additional_charge, total_charge,
+                                           op.get('payment_mode'), handler_username)
+        }))
+
+    if pending:
+        # Tickets another request already completed fail on their own here: inside a transaction a
+        # duplicate key error would abort the whole batch, and a record written in another month
+        # would not raise one at all
+        done = completed_ids([p['vehicle']['_id'] for _, p in pending],
+                             min(p['vehicle']['checkin_time'] for _, p in pending), db_session)
+        for i, item in pending:
+            if item['vehicle']['_id'] in done:
+                vehicle_number = item['vehicle']['vehicle_number']
+                results[i] = {'error': True, 'message': f'Vehicle {vehicle_number} has already been checked out!'}
+        pending = [(i, item) for i, item in pending if item['vehicle']['_id'] not in done]
+
+    if pending:
+        # Completed records reuse the ticket _id, so a ticket another request closed first (after
+        # the check above) is rejected here and left alone
+        failed = {}
+        try:
+            partition_for(checkout_time).insert_many([p['record'] for _, p in pending], ordered=False, session=db_session)
+        except BulkWriteError as e:
+            if db_session is not None:
+                raise
+            failed = _write_errors(e)
+        completed = []
+        for position, (i, item) in enumerate(pending):
+            if position in failed:
+                vehicle_number = item['vehicle']['vehicle_number']
+                if failed[position].get('code') == 11000:
+                    message = f'Vehicle {vehicle_number} has already been checked out!'
+                else:
+                    message = f'Error during check-out: {failed[position].get("errmsg")}'
+                results[i] = {'error': True, 'message': message}
+            else:
+                results[i] = item
+                completed.append(item['record'])
+
+        if completed:
+            vehicles_collection.delete_many({'_id': {'$in': [r['_id'] for r in completed]}}, session=db_session)
+            try:
+                update_rollups(completed, session=db_session)
+            except Exception as e:
+                if db_session is not None:
+                    raise
+                # The checkouts themselves are recorded; `flask backfill-rollups` repairs the totals
+                print(f"Error updating daily rollups: {str(e)}")
+    return results
+
+
+def bulk_checkout(operations, handler_username, compact):
+    checkout_time = checkout_timestamp()
+    if MONGO_TRANSACTIONS:
+        with client.start_session() as db_session:
+            results = db_session.with_transaction(
+                lambda s: complete_batch(s, operations, handler_username, checkout_time))
+    else:
+        results = complete_batch(None, operations, handler_username, checkout_time)
+
+    # Plates with no ticket of this handler: someone else's or not checked in at all
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        others = {}
+        for vehicle in vehicles_collection.find({
+            'vehicle_number': {'$in': list({operations[i]['vehicle_number'] for i in missing})},
+            'checkout_time': None
+        }):
+            others.setdefault(vehicle['vehicle_number'], []).append(vehicle)
+        for i in missing:
+            vehicle_number = operations[i]['vehicle_number']
+            results[i] = unclaimed_response(vehicle_number, others.get(vehicle_number, []), None, None, checkout_time)
+
+    for i, result in enumerate(results):
+        if 'record' not in result:
+            continue
+        vehicle = result['vehicle']
+        suggestion_index.remove(vehicle.get('handled_by'), vehicle['vehicle_number'])
+        if offline_journal.enabled:
+            offline_journal.mirror_checkout(vehicle['vehicle_number'], vehicle.get('handled_by'))
+        report_cache.invalidate(vehicle.get('handled_by'), vehicle.get('checkin_time'))
+        results[i] = {
+            'success': True,
+            'message': f'Vehicle {vehicle["vehicle_number"]} has been successfully checked out!',
+            **receipt_payload('checkout', checkout_receipt_fields(
+                vehicle, result['rate'], checkout_time, result['additional_charge'], result['total_charge'],
+                operations[i].get('payment_mode'), handler_username), compact)
+        }
+    return results
+
+
+def bulk_operations():
+    if 'username' not in session:
+        return redirect(url_for('route_login'))
+
+    try:
+        # Either a JSON array of operations or {"operations": [...], "receipt_format": "compact"}
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            operations = body.get('operations')
+            receipt_format = body.get('receipt_format')
+        else:
+            operations = body
+            receipt_format = request.args.get('receipt_format')
+        compact = (receipt_format or '').lower() == 'compact'
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({
+                'error': True,
+                'message': 'Expected a JSON array of operations!'
+            })
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return jsonify({
+                'error': True,
+                'message': f'At most {BULK_MAX_OPERATIONS} operations per request!'
+            })
+
+        handler_username = session['username']
+        if offline_journal.enabled and offline_journal.has_pending():
+            # Batches go straight to MongoDB, so they wait until offline entries have synced
+            return jsonify({
+                'error': True,
+                'message': 'Offline entries are still syncing, scan plates one at a time for now!'
+            })
+        results = [None] * len(operations)
+        normalized = []
+        for i, op in enumerate(operations):
+            if not isinstance(op, dict) or op.get('action') not in ('checkin', 'checkout') or not op.get('vehicle_number'):
+                results[i] = {'error': True, 'message': 'Each operation needs an action (checkin or checkout) and a vehicle_number!'}
+                continue
+            if op['action'] == 'checkin' and not op.get('payment_mode'):
+                results[i] = {'error': True, 'message': 'Check-in needs a payment_mode!'}
+                continue
+            normalized.append((i, {
+                'action': op['action'],
+                'vehicle_number': str(op['vehicle_number']).upper(),
+                'payment_mode': op.get('payment_mode')
+            }))
+
+        # Consecutive operations of the same kind run as one bulk write, so a plate checked in
+        # and out within the same batch is handled in submission order
+        while normalized:
+            action = normalized[0][1]['action']
+            run = []
+            while normalized and normalized[0][1]['action'] == action:
+                run.append(normalized.pop(0))
+            batch = bulk_checkin if action == 'checkin' else bulk_checkout
+            for (i, op), result in zip(run, batch([op for _, op in run], handler_username, compact)):
+                results[i] = result
+
+        for i, result in enumerate(results):
+            result['index'] = i
+            result['action'] = operations[i].get('action') if isinstance(operations[i], dict) else None
+            if isinstance(operations[i], dict) and operations[i].get('vehicle_number'):
+                result.setdefault('vehicle_number', str(operations[i]['vehicle_number']).upper())
+
+        succeeded = sum(1 for result in results if result.get('success'))
+        return jsonify({
+            'success': True,
+            'message': f'{succeeded} of {len(results)} operations completed',
+            'results': results
+        })
+
+    except Exception as e:
+        print(f"Error during bulk operations: {str(e)}")
+        return jsonify({
+            'error': True,
+            'message': f'Error during bulk operations: {str(e)}'
+        })
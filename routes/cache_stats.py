@@ -0,0 +1,13 @@
+from flask import session, jsonify
+from cache import cache_stats as get_cache_stats
+from bootstrap_state import bootstrap_stats
+from report_cache import report_cache
+
+def cache_stats():
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    return jsonify({'success': True, 'cache': {
+        **get_cache_stats(),
+        'bootstrap': bootstrap_stats(),
+        'reports': report_cache.stats()
+    }})
@@ -0,0 +1,13 @@
+from flask import session, jsonify
+from report_jobs import report_jobs, job_payload
+
+def cancel_report_job(job_id):
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    job = report_jobs.cancel(session['username'], job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Report job not found'})
+    if job['status'] != 'cancelled':
+        return jsonify({'success': False, 'message': f"Report job already {job['status']}", 'job': job_payload(job)})
+    return jsonify({'success': True, 'message': 'Report job cancelled', 'job': job_payload(job)})
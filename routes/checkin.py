@@ -1,115 +1,130 @@
 from flask import session, redirect, url_for, request, jsonify
 from datetime import datetime
-from config import users_collection, rates_collection, vehicles_collection
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from config import vehicles_collection
+from cache import get_user_rate
+from suggestion_index import suggestion_index
+from receipts import checkin_receipt_fields, receipt_payload
+from offline_journal import offline_journal
+
+def new_ticket(vehicle_number, payment_mode, handler_username, rate, checkin_time):
+    return {
+        'vehicle_number': vehicle_number,
+        'checkin_time': checkin_time,
+        'checkout_time': None,
+        'payment_mode': payment_mode,
+        'handled_by': handler_username,
+        'rate_id': rate['_id'],
+        # Snapshot of the rate so checkout can price the ticket without another lookup
+        'rate': {
+            'initial_amount': rate['initial_amount'],
+            'initial_duration': rate['initial_duration'],
+            'extra_charge': rate['extra_charge'],
+            'extra_charge_duration': rate['extra_charge_duration']
+        }
+    }
+
+def record_offline_checkin(vehicle_number, payment_mode, handler_username, ticket_id=None):
+    # MongoDB is unreachable (or earlier offline entries are still syncing): record the ticket
+    # in the local journal, priced with the last rate seen for this user. Returns the response
+    # and the receipt fields (None when nothing was recorded); shared with the async route.
+    rate = offline_journal.known_rate(handler_username)
+    if not rate:
+        return {
+            'error': True,
+            'message': 'Rate configuration not available offline!'
+        }, None
+    
+    now = datetime.now()
+    checkin_time = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    ticket = new_ticket(vehicle_number, payment_mode, handler_username, rate, checkin_time)
+    # The _id is fixed here so a replay that reaches MongoDB twice is recognised; a failed online
+    # insert passes its own, since that write may have landed before the link dropped
+    ticket['_id'] = ticket_id or ObjectId()
+    ticket['recorded_offline'] = True
+    if not offline_journal.record_checkin(ticket):
+        return {
+            'error': True,
+            'message': f'Vehicle {vehicle_number} is already checked in under your account!'
+        }, None
+    suggestion_index.add(handler_username, vehicle_number)
+    
+    return {
+        'success': True,
+        'offline': True,
+        'message': f'Vehicle {vehicle_number} has been checked in (saved offline, will sync when the database is back)!'
+    }, checkin_receipt_fields(vehicle_number, checkin_time, rate, payment_mode, handler_username)
+
+def checkin_offline(vehicle_number, payment_mode, handler_username, ticket_id=None):
+    response, receipt_fields = record_offline_checkin(vehicle_number, payment_mode, handler_username, ticket_id)
+    if receipt_fields:
+        response.update(receipt_payload('checkin', receipt_fields))
+    return jsonify(response)
 
 def checkin():
     if 'username' not in session:
         return redirect(url_for('route_login'))
     
+    ticket = None
     try:
         vehicle_number = request.form['vehicle_number'].upper()
         payment_mode = request.form['payment_mode']
         handler_username = session['username']
         
-        # Get the user and their rate
-        user = users_collection.find_one({'username': handler_username})
+        # Keep journal order: while offline entries are pending, new ones queue behind them
+        if offline_journal.enabled and offline_journal.has_pending():
+            return checkin_offline(vehicle_number, payment_mode, handler_username)
+        
+        # Get the user and their rate, served from the in-process cache when warm
+        user, rate = get_user_rate(handler_username)
         if not user:
             return jsonify({
                 'error': True,
                 'message': 'User not found!'
             })
             
-        rate = rates_collection.find_one({'_id': user['rate_id']})
         if not rate:
             return jsonify({
                 'error': True,
                 'message': 'Rate configuration not found!'
             })
         
-        # Check if vehicle is already checked in by THIS user
-        existing_vehicle = vehicles_collection.find_one({
-            'vehicle_number': vehicle_number,
-            'handled_by': handler_username,
-            'checkout_time': None
-        })
-        
-        if existing_vehicle:
+        # Create new check-in record; the unique partial index on active
+        # (vehicle_number, handled_by) rejects duplicates, so two booths
+        # scanning the same plate cannot both check it in
+        checkin_time = datetime.now()
+        try:
+            ticket = new_ticket(vehicle_number, payment_mode, handler_username, rate, checkin_time)
+            vehicles_collection.insert_one(ticket)
+        except DuplicateKeyError:
             return jsonify({
                 'error': True,
                 'message': f'Vehicle {vehicle_number} is already checked in under your account!'
             })
+        suggestion_index.add(handler_username, vehicle_number)
+        if offline_journal.enabled:
+            # Local copies that let this booth keep working if the link drops
+            offline_journal.mirror_checkin(ticket)
+            offline_journal.remember_rate(handler_username, rate)
         
-        # Create new check-in record
-        checkin_time = datetime.now()
-        vehicles_collection.insert_one({
-            'vehicle_number': vehicle_number,
-            'checkin_time': checkin_time,
-            'checkout_time': None,
-            'payment_mode': payment_mode,
-            'handled_by': handler_username,
-            'rate_id': rate['_id']
-        })
-        
-        # Use existing receipt HTML format but with dynamic values
-        receipt_html = f'''
-        <div class="receipt-container" id="checkinReceipt">
-            <div class="receipt">
-                <div class="receipt-header">
-                    <h2>PARKING TICKET</h2>
-                    <div class="receipt-divider"></div>
-                </div>
-                
-                <div class="receipt-body">
-                    <div class="receipt-row">
-                        <span>Vehicle:</span>
-                        <span>{vehicle_number}</span>
-                    </div>
-                    
-                    <div class="receipt-row">
-                        <span>In:</span>
-                        <span>{checkin_time.strftime('%H:%M %d/%m')}</span>
-                    </div>
-                    
-                    <div class="receipt-divider"></div>
-                    
-                    <div class="receipt-row">
-                        <span>Amount:</span>
-                        <span>₹{rate['initial_amount']}</span>
-                    </div>
-                    
-                    <div class="receipt-row">
-                        <span>Duration:</span>
-                        <span>{rate['initial_duration']} hours</span>
-                    </div>
-                    
-                    <div class="receipt-row">
-                        <span>Mode:</span>
-                        <span>{payment_mode}</span>
-                    </div>
-                    
-                    <div class="receipt-divider"></div>
-                    
-                    <div class="receipt-row">
-                        <span>Staff:</span>
-                        <span>{handler_username}</span>
-                    </div>
-                </div>
-                
-                <div class="receipt-footer">
-                    <p>Thank You!</p>
-                    <small>Extra charges apply after {rate['initial_duration']} hours</small>
-                    <small>(₹{rate['extra_charge']} per {rate['extra_charge_duration']} hours)</small>
-                </div>
-            </div>
-        </div>
-        '''
+        receipt = receipt_payload('checkin', checkin_receipt_fields(
+            vehicle_number, checkin_time, rate, payment_mode, handler_username))
         
         return jsonify({
             'success': True,
             'message': f'Vehicle {vehicle_number} has been successfully checked in!',
-            'receipt': receipt_html
+            **receipt
         })
                             
+    except ConnectionFailure as e:
+        if offline_journal.enabled:
+            return checkin_offline(vehicle_number, payment_mode, handler_username,
+                                   ticket.get('_id') if ticket else None)
+        return jsonify({
+            'error': True,
+            'message': f'Error during check-in: {str(e)}'
+        })
     except Exception as e:
         return jsonify({
             'error': True,
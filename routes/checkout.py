@@ -1,8 +1,242 @@
 from flask import request, session, redirect, url_for, jsonify
 from datetime import datetime
 import math
-from config import vehicles_collection, completed_records, rates_collection
-from routes.calculate_charge import calculate_charge
+from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from config import client, vehicles_collection, rates_collection, MONGO_TRANSACTIONS
+from partitions import find_one_completed, partition_for
+from cache import get_rate, rate_cache
+from suggestion_index import suggestion_index
+from rollups import update_rollups
+from receipts import checkout_receipt_fields, receipt_payload
+from offline_journal import offline_journal
+from report_cache import report_cache
+
+
+class CheckoutAborted(Exception):
+    def __init__(self, payload):
+        super().__init__(payload.get('message', ''))
+        self.payload = payload
+
+
+def get_checkout_rate(vehicle, db_session=None):
+    # Tickets checked in before the rate snapshot was stored fall back to the rates collection
+    if vehicle.get('rate'):
+        return vehicle['rate']
+    if db_session is None:
+        return get_rate(vehicle.get('rate_id'))
+    return rates_collection.find_one({'_id': vehicle.get('rate_id')}, session=db_session)
+
+
+def calculate_checkout_charges(vehicle, rate, checkout_time):
+    elapsed_time = checkout_time - vehicle['checkin_time']
+    hours = elapsed_time.total_seconds() / 3600
+    
+    total_charge = rate['initial_amount']
+    additional_charge = 0
+    
+    if hours > rate['initial_duration']:
+        extra_hours = hours - rate['initial_duration']
+        extra_periods = math.ceil(extra_hours / rate['extra_charge_duration'])
+        additional_charge = extra_periods * rate['extra_charge']
+        total_charge += additional_charge
+    
+    return additional_charge, total_charge
+
+
+def additional_payment_response(vehicle, rate, checkout_time, additional_charge, total_charge):
+    return {
+        'needsAdditionalPayment': True,
+        'vehicle_number': vehicle['vehicle_number'],
+        'checkin_time': vehicle['checkin_time'].strftime('%Y-%m-%d %H:%M:%S'),
+        'checkout_time': checkout_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'initial_payment': rate['initial_amount'],
+        'additional_charge': additional_charge,
+        'total_charge': total_charge
+    }
+
+
+def checkout_timestamp():
+    # BSON dates only keep milliseconds, so price with the same instant the claim filter sees
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def checkout_claim_filter(vehicle_filter, payment_mode, checkout_time):
+    claim_filter = dict(vehicle_filter)
+    if not payment_mode:
+        # Without a payment mode only tickets still inside their initial period can be closed,
+        # priced from the rate snapshot (legacy tickets without one are always claimed)
+        claim_filter['$expr'] = {
+            '$gte': ['$checkin_time', {
+                '$subtract': [checkout_time, {'$multiply': ['$rate.initial_duration', 3600000]}]
+            }]
+        }
+    return claim_filter
+
+
+def completed_record_for(vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, checkout_by):
+    # The completed record keeps the ticket's _id, so it can never be written twice
+    return {
+        '_id': vehicle['_id'],
+        'vehicle_number': vehicle['vehicle_number'],
+        'checkin_time': vehicle['checkin_time'],
+        'checkout_time': checkout_time,
+        'initial_payment': rate['initial_amount'],
+        'additional_charge': additional_charge,
+        'total_charge': total_charge,
+        'initial_payment_mode': vehicle.get('payment_mode', 'N/A'),
+        'additional_payment_mode': payment_mode if additional_charge > 0 else None,
+        'handled_by': vehicle.get('handled_by', checkout_by),
+        'checkout_by': checkout_by
+    }
+
+
+def unclaimed_response(vehicle_number, active_vehicles, vehicle, rate, checkout_time):
+    # Nothing was claimed: the ticket needs an additional payment, belongs to someone else or does not exist
+    if vehicle:
+        if not rate:
+            return {
+                'error': True,
+                'message': 'Rate configuration not found!'
+            }
+        additional_charge, total_charge = calculate_checkout_charges(vehicle, rate, checkout_time)
+        return additional_payment_response(vehicle, rate, checkout_time, additional_charge, total_charge)
+    
+    if active_vehicles:
+        return {
+            'error': True,
+            'message': f'Vehicle {vehicle_number} was checked in by {active_vehicles[0]["handled_by"]}. Only they can check it out.'
+        }
+    return {
+        'error': True,
+        'message': f'No active check-in found for vehicle {vehicle_number}!'
+    }
+
+
+def already_checked_out(vehicle):
+    return CheckoutAborted({
+        'error': True,
+        'message': f'Vehicle {vehicle["vehicle_number"]} has already been checked out!'
+    })
+
+
+def closed_elsewhere_filter(vehicle, checkout_time):
+    # Another completed record of this ticket, i.e. one with a different checkout time
+    return {'_id': vehicle['_id'], 'checkout_time': {'$gte': vehicle['checkin_time'], '$ne': checkout_time}}
+
+
+def claim_and_complete(db_session, vehicle_filter, payment_mode, checkout_time, checkout_by):
+    # The completed record is written before the ticket is removed, so a crash in between
+    # leaves a closed ticket still listed as active (the next checkout attempt removes it)
+    # rather than a removed ticket with no payment record. The record keeps the ticket's _id:
+    # a duplicate key error means another request closed the ticket first.
+    claim_filter = checkout_claim_filter(vehicle_filter, payment_mode, checkout_time)
+    vehicle = vehicles_collection.find_one(claim_filter, session=db_session)
+    if not vehicle:
+        return None
+    
+    rate = get_checkout_rate(vehicle, db_session)
+    if not rate:
+        raise CheckoutAborted({
+            'error': True,
+            'message': 'Rate configuration not found!'
+        })
+    
+    additional_charge, total_charge = calculate_checkout_charges(vehicle, rate, checkout_time)
+    if additional_charge > 0 and not payment_mode:
+        raise CheckoutAborted(additional_payment_response(
+            vehicle, rate, checkout_time, additional_charge, total_charge))
+    
+    completed_record = completed_record_for(
+        vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, checkout_by)
+    partition = partition_for(checkout_time)
+    try:
+        partition.insert_one(completed_record, session=db_session)
+    except DuplicateKeyError:
+        if db_session is not None:
+            raise
+        # Finish the removal in case the request that closed it stopped before doing so
+        vehicles_collection.delete_one({'_id': vehicle['_id']})
+        raise already_checked_out(vehicle)
+    
+    removed = vehicles_collection.delete_one({'_id': vehicle['_id']}, session=db_session).deleted_count
+    if not removed and find_one_completed(closed_elsewhere_filter(vehicle, checkout_time), {'_id': 1}):
+        # Closed meanwhile by a request that wrote its record to another month's partition,
+        # where no duplicate key error could catch it. (A ticket removed by the clean-up above
+        # has no other record, and this checkout stands.)
+        partition.delete_one({'_id': vehicle['_id']}, session=db_session)
+        raise already_checked_out(vehicle)
+    
+    try:
+        update_rollups([completed_record], session=db_session)
+    except Exception as e:
+        if db_session is not None:
+            raise
+        # The checkout itself is recorded; `flask backfill-rollups` repairs the totals
+        print(f"Error updating daily rollups: {str(e)}")
+    
+    return {
+        'vehicle': vehicle,
+        'rate': rate,
+        'additional_charge': additional_charge,
+        'total_charge': total_charge
+    }
+
+
+def checkout_vehicle(vehicle_filter, payment_mode, checkout_time, checkout_by):
+    if MONGO_TRANSACTIONS:
+        with client.start_session() as db_session:
+            result = db_session.with_transaction(
+                lambda s: claim_and_complete(s, vehicle_filter, payment_mode, checkout_time, checkout_by))
+    else:
+        result = claim_and_complete(None, vehicle_filter, payment_mode, checkout_time, checkout_by)
+    if result:
+        # A ticket from an earlier day leaves that day's check-in reports
+        report_cache.invalidate(result['vehicle'].get('handled_by'), result['vehicle'].get('checkin_time'), checkout_time)
+    return result
+
+
+def record_offline_checkout(vehicle_number, payment_mode, handler_username):
+    # MongoDB is unreachable (or earlier offline entries are still syncing): close the ticket
+    # from the local mirror and journal the completed record for replay. Returns the response
+    # and the receipt fields (None when nothing was recorded); shared with the async route.
+    checkout_time = checkout_timestamp()
+    vehicle = offline_journal.active_ticket(vehicle_number, handler_username)
+    if not vehicle:
+        other_handler = offline_journal.active_handler(vehicle_number)
+        return unclaimed_response(
+            vehicle_number, [{'handled_by': other_handler}] if other_handler else [], None, None, checkout_time), None
+    
+    rate = vehicle.get('rate') or rate_cache.get(vehicle.get('rate_id'))
+    if not rate:
+        return {
+            'error': True,
+            'message': 'Rate configuration not available offline!'
+        }, None
+    
+    additional_charge, total_charge = calculate_checkout_charges(vehicle, rate, checkout_time)
+    if additional_charge > 0 and not payment_mode:
+        return additional_payment_response(vehicle, rate, checkout_time, additional_charge, total_charge), None
+    
+    completed_record = completed_record_for(
+        vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, handler_username)
+    completed_record['recorded_offline'] = True
+    offline_journal.record_checkout(completed_record)
+    suggestion_index.remove(vehicle.get('handled_by'), vehicle_number)
+    
+    return {
+        'success': True,
+        'offline': True,
+        'message': f'Vehicle {vehicle_number} has been checked out (saved offline, will sync when the database is back)!'
+    }, checkout_receipt_fields(vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, handler_username)
+
+
+def checkout_offline(vehicle_number, payment_mode, handler_username):
+    response, receipt_fields = record_offline_checkout(vehicle_number, payment_mode, handler_username)
+    if receipt_fields:
+        response.update(receipt_payload('checkout', receipt_fields))
+    return jsonify(response)
+
 
 def checkout():
     if 'username' not in session:
@@ -13,143 +247,55 @@ def checkout():
         payment_mode = request.form.get('payment_mode')
         handler_username = session['username']
         
-        # Find the vehicle check-in record for THIS user
-        vehicle = vehicles_collection.find_one({
-            'vehicle_number': vehicle_number,
-            'handled_by': handler_username,
-            'checkout_time': None
-        })
+        # Keep journal order: while offline entries are pending, new ones queue behind them
+        if offline_journal.enabled and offline_journal.has_pending():
+            return checkout_offline(vehicle_number, payment_mode, handler_username)
+        
+        checkout_time = checkout_timestamp()
         
-        if not vehicle:
-            # If not found under current user, check if it exists under another user
-            other_vehicle = vehicles_collection.find_one({
+        try:
+            result = checkout_vehicle({
                 'vehicle_number': vehicle_number,
+                'handled_by': handler_username,
                 'checkout_time': None
-            })
-            
-            if other_vehicle:
-                return jsonify({
-                    'error': True,
-                    'message': f'Vehicle {vehicle_number} was checked in by {other_vehicle["handled_by"]}. Only they can check it out.'
-                })
-            else:
-                return jsonify({
-                    'error': True,
-                    'message': f'No active check-in found for vehicle {vehicle_number}!'
-                })
-        
-        # Get the rate used during check-in
-        rate = rates_collection.find_one({'_id': vehicle['rate_id']})
-        if not rate:
-            return jsonify({
-                'error': True,
-                'message': 'Rate configuration not found!'
-            })
-        
-        checkout_time = datetime.now()
-        elapsed_time = checkout_time - vehicle['checkin_time']
-        hours = elapsed_time.total_seconds() / 3600
-        
-        # Calculate charges using stored rate
-        total_charge = rate['initial_amount']
-        additional_charge = 0
+            }, payment_mode, checkout_time, handler_username)
+        except CheckoutAborted as e:
+            return jsonify(e.payload)
         
-        if hours > rate['initial_duration']:
-            extra_hours = hours - rate['initial_duration']
-            extra_periods = math.ceil(extra_hours / rate['extra_charge_duration'])
-            additional_charge = extra_periods * rate['extra_charge']
-            total_charge += additional_charge
-        
-        # If additional payment is needed and we don't have payment mode yet
-        if additional_charge > 0 and not payment_mode:
-            return jsonify({
-                'needsAdditionalPayment': True,
+        if not result:
+            active_vehicles = list(vehicles_collection.find({
                 'vehicle_number': vehicle_number,
-                'checkin_time': vehicle['checkin_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                'checkout_time': checkout_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'initial_payment': rate['initial_amount'],
-                'additional_charge': additional_charge,
-                'total_charge': total_charge
-            })
-        
-        # Process checkout with existing record format
-        completed_record = {
-            'vehicle_number': vehicle['vehicle_number'],
-            'checkin_time': vehicle['checkin_time'],
-            'checkout_time': checkout_time,
-            'initial_payment': rate['initial_amount'],
-            'additional_charge': additional_charge,
-            'total_charge': total_charge,
-            'initial_payment_mode': vehicle.get('payment_mode', 'N/A'),
-            'additional_payment_mode': payment_mode if additional_charge > 0 else None,
-            'handled_by': vehicle.get('handled_by', session['username']),
-            'checkout_by': session['username']
-        }
+                'checkout_time': None
+            }))
+            vehicle = next((v for v in active_vehicles if v.get('handled_by') == handler_username), None)
+            rate = get_checkout_rate(vehicle) if vehicle else None
+            return jsonify(unclaimed_response(vehicle_number, active_vehicles, vehicle, rate, checkout_time))
         
-        # Insert into completed_records and delete from vehicles_collection
-        completed_records.insert_one(completed_record)
-        vehicles_collection.delete_one({'_id': vehicle['_id']})
+        vehicle = result['vehicle']
+        suggestion_index.remove(vehicle.get('handled_by'), vehicle['vehicle_number'])
+        if offline_journal.enabled:
+            offline_journal.mirror_checkout(vehicle['vehicle_number'], vehicle.get('handled_by'))
+        rate = result['rate']
+        additional_charge = result['additional_charge']
+        total_charge = result['total_charge']
         
-        # Use existing receipt format with dynamic values
-        receipt_html = f'''
-        <div class="receipt-container" id="checkoutReceipt">
-            <div class="receipt">
-                <div class="receipt-header">
-                    <h2>PARKING RECEIPT</h2>
-                    <div class="receipt-divider"></div>
-                </div>
-                
-                <div class="receipt-body">
-                    <div class="receipt-row">
-                        <span>Vehicle:</span>
-                        <span>{vehicle_number}</span>
-                    </div>
-                    
-                    <div class="receipt-row">
-                        <span>Duration:</span>
-                        <span>{vehicle['checkin_time'].strftime('%H:%M %d/%m')} - {checkout_time.strftime('%H:%M %d/%m')}</span>
-                    </div>
-                    
-                    <div class="receipt-divider"></div>
-                    
-                    <div class="receipt-row">
-                        <span>Initial:</span>
-                        <span>₹{rate['initial_amount']} ({vehicle.get('payment_mode', 'N/A')})</span>
-                    </div>
-                    
-                    {f"""
-                    <div class="receipt-row">
-                        <span>Add.Chrg:</span>
-                        <span>₹{additional_charge} ({payment_mode})</span>
-                    </div>
-                    """ if additional_charge > 0 else ""}
-                    
-                    <div class="receipt-row total">
-                        <span>TOTAL:</span>
-                        <span>₹{total_charge}</span>
-                    </div>
-                    
-                    <div class="receipt-divider"></div>
-                    
-                    <div class="receipt-row">
-                        <span>Staff:</span>
-                        <span>{session['username']}</span>
-                    </div>
-                </div>
-                
-                <div class="receipt-footer">
-                    <p>Thank You!</p>
-                </div>
-            </div>
-        </div>
-        '''
+        receipt = receipt_payload('checkout', checkout_receipt_fields(
+            vehicle, rate, checkout_time, additional_charge, total_charge, payment_mode, session['username']))
         
         return jsonify({
             'success': True,
             'message': f'Vehicle {vehicle_number} has been successfully checked out!',
-            'receipt': receipt_html
+            **receipt
         })
                             
+    except ConnectionFailure as e:
+        if offline_journal.enabled:
+            return checkout_offline(vehicle_number, payment_mode, handler_username)
+        print(f"Error during check-out: {str(e)}")
+        return jsonify({
+            'error': True,
+            'message': f'Error during check-out: {str(e)}'
+        })
     except Exception as e:
         print(f"Error during check-out: {str(e)}")  # Debug print
         return jsonify({
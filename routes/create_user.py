@@ -2,6 +2,7 @@ from flask import request, jsonify, session
 from datetime import datetime
 from config import users_collection, rates_collection
 from bson import ObjectId
+from cache import invalidate_user, invalidate_rate
 
 def create_user():
     if not session.get('is_admin'):
@@ -40,6 +41,8 @@ def create_user():
         # Insert rate and user
         rates_collection.insert_one(rate)
         users_collection.insert_one(user)
+        invalidate_user(username)
+        invalidate_rate(rate['_id'])
 
         # Return success response with user data
         return jsonify({
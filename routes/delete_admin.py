@@ -1,5 +1,6 @@
 from flask import session, redirect, url_for
 from config import admins_collection
+from bootstrap_state import invalidate as invalidate_bootstrap_state
 
 def delete_admin(username):
     if not session.get('is_admin'):
@@ -11,5 +12,6 @@ def delete_admin(username):
                               error="Cannot delete your own account or the main admin account!"))
     
     admins_collection.delete_one({'username': username})
+    invalidate_bootstrap_state()
     return redirect(url_for('route_admin_dashboard', 
                           message='Admin user deleted successfully!')) 
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import jsonify
 from config import db
+from cache import invalidate_user, invalidate_rate
 
 def delete_user(username):
     try:
@@ -16,6 +17,8 @@ def delete_user(username):
             
         # Then delete the user
         result = db.users.delete_one({'username': username, 'is_admin': False})
+        invalidate_user(username)
+        invalidate_rate(user.get('rate_id'))
         
         if result.deleted_count > 0:
             return jsonify({
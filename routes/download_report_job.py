@@ -0,0 +1,22 @@
+import os
+from flask import session, jsonify, send_file
+from report_jobs import report_jobs
+from routes.generate_report import MIMETYPES
+
+def download_report_job(job_id):
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    job = report_jobs.get(session['username'], job_id)
+    if not job or job['status'] != 'done':
+        return jsonify({'success': False, 'message': 'Report is not ready'})
+    path = report_jobs.result_path(job)
+    if not os.path.exists(path):
+        # Built on another host, or removed after REPORT_JOB_RETENTION
+        return jsonify({'success': False, 'message': 'Report file is no longer available'})
+    return send_file(
+        os.path.abspath(path),
+        mimetype=MIMETYPES[job['params']['format']],
+        as_attachment=True,
+        download_name=job['params']['filename']
+    )
@@ -0,0 +1,6 @@
+from flask import Response
+from metrics import render_metrics
+
+def export_metrics():
+    # Prometheus text exposition format
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
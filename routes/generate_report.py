@@ -1,9 +1,491 @@
-from flask import request, redirect, url_for, send_file, session
+from flask import request, redirect, url_for, send_file, session, Response, stream_with_context
 from datetime import datetime, timedelta
 from openpyxl import Workbook
+import csv
 import io
-import math
-from config import vehicles_collection, completed_records, rates_collection, users_collection
+import shutil
+import tempfile
+import time
+from config import vehicles_collection, users_collection, REPORT_BATCH_SIZE
+from rollups import find_rollups
+from partitions import find_completed
+from report_cache import report_cache
+
+# Columns of the check-outs report, in order; fields a record lacks are left out
+CHECKOUT_REPORT_FIELDS = ('vehicle_number', 'checkin_time', 'checkout_time', 'payment_mode', 'charge', 'handled_by')
+
+# Part of the report cache key: bump it whenever the columns or layout of a report change, so
+# files cached by the previous version are not served again
+REPORT_SCHEMA_VERSION = 1
+
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv'
+}
+
+def write_rows_xlsx(rows, output):
+    # Write-only workbooks stream rows to disk, so memory stays flat however many rows the cursor yields
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    headers = None
+    try:
+        for row in rows:
+            if headers is None:
+                headers = list(row.keys())
+                worksheet.append([header.replace('_', ' ').title() for header in headers])
+            worksheet.append([row.get(key) for key in headers])
+    except BaseException:
+        # Closes the sheet's temporary file now rather than when the workbook is collected
+        worksheet.close()
+        raise
+    workbook.save(output)
+
+def write_sheets_xlsx(sheets, output):
+    # sheets: [(title, rows)]; an empty row leaves a blank line
+    workbook = Workbook()
+    for i, (title, rows) in enumerate(sheets):
+        sheet = workbook.active if i == 0 else workbook.create_sheet()
+        sheet.title = title
+        for row in rows:
+            sheet.append(row)
+    workbook.save(output)
+
+class _CsvBuffer:
+    # csv.writer target whose text is handed out and cleared chunk by chunk
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def take(self):
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate(0)
+        return text
+
+def stream_rows_csv(rows):
+    # Same columns as write_rows_xlsx. The header and first row go out at once, then one chunk
+    # per REPORT_BATCH_SIZE rows, so memory does not grow with the result
+    out = _CsvBuffer()
+    headers = None
+    pending = 0
+    for row in rows:
+        if headers is None:
+            headers = list(row.keys())
+            out.writer.writerow([header.replace('_', ' ').title() for header in headers])
+            out.writer.writerow([row.get(key) for key in headers])
+            yield out.take()
+            continue
+        out.writer.writerow([row.get(key) for key in headers])
+        pending += 1
+        if pending >= REPORT_BATCH_SIZE:
+            yield out.take()
+            pending = 0
+    if pending:
+        yield out.take()
+
+def stream_sheets_csv(sheets):
+    # One block per sheet: its title on a line of its own, the rows, then a blank line
+    out = _CsvBuffer()
+    for i, (title, rows) in enumerate(sheets):
+        if i:
+            out.writer.writerow([])
+        out.writer.writerow([title])
+        for row in rows:
+            out.writer.writerow(row)
+        yield out.take()
+
+def checkout_rows(handler, start, end):
+    # Check-outs by date; only the month partition (or archive file) holding that day is read
+    query = {'checkout_time': {'$gte': start, '$lt': end}, 'handled_by': handler}
+    projection = dict({field: 1 for field in CHECKOUT_REPORT_FIELDS}, _id=0)
+    for record in find_completed(query, projection, batch_size=REPORT_BATCH_SIZE):
+        row = {}
+        for field in CHECKOUT_REPORT_FIELDS:
+            if field in record:
+                value = record[field]
+                row[field] = value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+        yield row
+
+def checkout_stats_for(handler, start, end):
+    # Check-out totals per (initial, additional) payment mode pair for one day
+    query = {'checkout_time': {'$gte': start, '$lt': end}, 'handled_by': handler}
+    projection = {
+        'initial_payment_mode': 1,
+        'additional_payment_mode': 1,
+        'initial_payment': 1,
+        'additional_charge': 1,
+        'total_charge': 1,
+        '_id': 0
+    }
+    stats = {}
+    for record in find_completed(query, projection, batch_size=REPORT_BATCH_SIZE):
+        key = (record.get('initial_payment_mode'), record.get('additional_payment_mode'))
+        if key not in stats:
+            stats[key] = {
+                '_id': {'initial_mode': key[0], 'additional_mode': key[1]},
+                'count': 0,
+                'initial_amount': 0,
+                'additional_amount': 0,
+                'total_amount': 0
+            }
+        stats[key]['count'] += 1
+        stats[key]['initial_amount'] += record.get('initial_payment') or 0
+        stats[key]['additional_amount'] += record.get('additional_charge') or 0
+        stats[key]['total_amount'] += record.get('total_charge') or 0
+    return list(stats.values())
+
+def financial_sheets(selected_user, date, date_obj, next_date):
+    # Financial report for one day: check-in stats, check-out stats and a summary
+    checkin_pipeline = [
+        {
+            '$match': {
+                'checkin_time': {
+                    '$gte': date_obj,
+                    '$lt': next_date
+                },
+                'handled_by': selected_user
+            }
+        },
+        {
+            '$group': {
+                '_id': '$payment_mode',
+                'count': {'$sum': 1},
+                'total_amount': {'$sum': 15}
+            }
+        }
+    ]
+    
+    checkin_stats = list(vehicles_collection.aggregate(checkin_pipeline))
+    checkout_stats = checkout_stats_for(selected_user, date_obj, next_date)
+    
+    # Check-in stats
+    checkin_rows = [
+        [f"Check-in Statistics for {selected_user}"],
+        ["Payment Mode", "Vehicle Count", "Total Amount"]
+    ]
+    total_checkins = 0
+    total_checkin_amount = 0
+    checkin_by_mode = {}
+    
+    for stat in checkin_stats:
+        checkin_rows.append([stat['_id'], stat['count'], stat['total_amount']])
+        total_checkins += stat['count']
+        total_checkin_amount += stat['total_amount']
+        checkin_by_mode[stat['_id']] = stat['total_amount']
+    
+    checkin_rows.append(["TOTAL", total_checkins, total_checkin_amount])
+    
+    # Check-out stats with payment mode splits
+    checkout_rows = [
+        [f"Check-out Statistics for {selected_user}"],
+        ["Payment Mode", "Vehicle Count", "Initial Amount", "Additional Amount", "Total Amount"]
+    ]
+    total_checkouts = 0
+    total_initial_amount = 0
+    total_additional_amount = 0
+    total_checkout_amount = 0
+    checkout_summary = {}  # To store amounts by payment mode
+    
+    for stat in checkout_stats:
+        initial_mode = stat['_id']['initial_mode']
+        additional_mode = stat['_id']['additional_mode']
+        
+        # Handle initial payment
+        if initial_mode not in checkout_summary:
+            checkout_summary[initial_mode] = {
+                'count': 0,
+                'initial': 0,
+                'additional': 0,
+                'total': 0
+            }
+        checkout_summary[initial_mode]['count'] += stat['count']
+        checkout_summary[initial_mode]['initial'] += stat['initial_amount']
+        checkout_summary[initial_mode]['total'] += stat['initial_amount']
+        
+        # Handle additional payment if exists
+        if additional_mode:
+            if additional_mode not in checkout_summary:
+                checkout_summary[additional_mode] = {
+                    'count': 0,
+                    'initial': 0,
+                    'additional': 0,
+                    'total': 0
+                }
+            checkout_summary[additional_mode]['additional'] += stat['additional_amount']
+            checkout_summary[additional_mode]['total'] += stat['additional_amount']
+        
+        total_checkouts += stat['count']
+        total_initial_amount += stat['initial_amount']
+        total_additional_amount += stat['additional_amount']
+        total_checkout_amount += stat['total_amount']
+    
+    # Checkout summary by payment mode
+    for mode, data in checkout_summary.items():
+        if mode:  # Skip empty payment modes
+            checkout_rows.append([mode, data['count'], data['initial'], data['additional'], data['total']])
+    
+    # Totals
+    checkout_rows.append(["TOTAL", total_checkouts, total_initial_amount, total_additional_amount, total_checkout_amount])
+    
+    # Detailed summary
+    summary_rows = [[f"Financial Summary for {selected_user} on {date}"], []]
+    
+    # Check-in Summary
+    summary_rows.append(["CHECK-IN SUMMARY"])
+    summary_rows.append(["Total Vehicles Checked In", total_checkins])
+    summary_rows.append(["Check-in Amount by Payment Mode:"])
+    for mode, amount in checkin_by_mode.items():
+        summary_rows.append([f"Total Check-in Amount ({mode})", amount])
+    summary_rows.append(["Total Check-in Amount", total_checkin_amount])
+    summary_rows.append([])
+    
+    # Check-out Summary
+    summary_rows.append(["CHECK-OUT SUMMARY"])
+    summary_rows.append(["Total Vehicles Checked Out", total_checkouts])
+    
+    # Initial Amount Summary
+    summary_rows.append(["Initial Amount by Payment Mode:"])
+    for mode, data in checkout_summary.items():
+        if mode and data['initial'] > 0:
+            summary_rows.append([f"Initial Amount ({mode})", data['initial']])
+    summary_rows.append(["Total Initial Amount", total_initial_amount])
+    summary_rows.append([])
+    
+    # Additional Amount Summary
+    summary_rows.append(["Additional Amount by Payment Mode:"])
+    for mode, data in checkout_summary.items():
+        if mode and data['additional'] > 0:
+            summary_rows.append([f"Additional Amount ({mode})", data['additional']])
+    summary_rows.append(["Total Additional Amount", total_additional_amount])
+    summary_rows.append([])
+    
+    # Total Business Summary
+    summary_rows.append(["TOTAL BUSINESS SUMMARY"])
+    
+    # Combine check-in and check-out amounts by payment mode
+    total_by_mode = {}
+    for mode, amount in checkin_by_mode.items():
+        if mode not in total_by_mode:
+            total_by_mode[mode] = 0
+        total_by_mode[mode] += amount
+    
+    for mode, data in checkout_summary.items():
+        if mode not in total_by_mode:
+            total_by_mode[mode] = 0
+        total_by_mode[mode] += data['total']
+    
+    for mode, total in total_by_mode.items():
+        if mode:  # Skip empty payment modes
+            summary_rows.append([f"Total Business ({mode})", total])
+    
+    summary_rows.append(["TOTAL BUSINESS FOR THE DAY", total_checkin_amount + total_checkout_amount])
+    
+    return [
+        ("Check-in Stats", checkin_rows),
+        ("Check-out Stats", checkout_rows),
+        ("Daily Summary", summary_rows)
+    ]
+
+def financial_range_sheets(selected_user, start_date, end_date):
+    # Multi-day financial report built from the daily rollups only
+    start_obj = datetime.strptime(start_date, '%Y-%m-%d')
+    end_obj = datetime.strptime(end_date, '%Y-%m-%d')
+    
+    checkout_rows = [
+        [f"Check-out Statistics for {selected_user} from {start_date} to {end_date}"],
+        ["Payment Mode", "Vehicle Count", "Initial Amount", "Additional Amount", "Total Amount"]
+    ]
+    daily_rows = [["Date", "Payment Mode", "Vehicle Count", "Initial Amount", "Additional Amount", "Total Amount"]]
+    
+    checkout_summary = {}  # To store amounts by payment mode
+    for rollup in find_rollups(selected_user, start_obj, end_obj):
+        mode = rollup['payment_mode']
+        count = rollup.get('checkout_count', 0)
+        initial = rollup.get('initial_amount', 0)
+        additional = rollup.get('additional_amount', 0)
+        total = rollup.get('total_amount', 0)
+        daily_rows.append([rollup['day'].strftime('%Y-%m-%d'), mode, count, initial, additional, total])
+        
+        if mode not in checkout_summary:
+            checkout_summary[mode] = {
+                'count': 0,
+                'initial': 0,
+                'additional': 0,
+                'total': 0
+            }
+        checkout_summary[mode]['count'] += count
+        checkout_summary[mode]['initial'] += initial
+        checkout_summary[mode]['additional'] += additional
+        checkout_summary[mode]['total'] += total
+    
+    # Summary by payment mode
+    for mode, data in checkout_summary.items():
+        if mode:  # Skip empty payment modes
+            checkout_rows.append([mode, data['count'], data['initial'], data['additional'], data['total']])
+    
+    # Totals
+    checkout_rows.append([
+        "TOTAL",
+        sum(data['count'] for data in checkout_summary.values()),
+        sum(data['initial'] for data in checkout_summary.values()),
+        sum(data['additional'] for data in checkout_summary.values()),
+        sum(data['total'] for data in checkout_summary.values())
+    ])
+    
+    return [
+        ("Check-out Stats", checkout_rows),
+        ("Daily Breakdown", daily_rows)
+    ]
+
+def report_filename(report_type, selected_user, date, start_date, end_date):
+    # Download name without the extension; None for an unknown report type
+    return {
+        'current': f'current_parked_vehicles_{selected_user}',
+        'checkins': f'checkins_{selected_user}_{date}',
+        'checkouts': f'checkouts_{selected_user}_{date}',
+        'financial': f'financial_report_{selected_user}_{date}',
+        'financial_range': f'financial_report_{selected_user}_{start_date}_to_{end_date}'
+    }.get(report_type)
+
+def report_cache_key(report_type, selected_user, date, start_date, end_date, report_format):
+    # None for reports that are not cached: currently parked vehicles change with every
+    # check-in, and open days are only cached when REPORT_CACHE_OPEN_TTL allows it
+    if report_type == 'financial_range':
+        if not start_date or not end_date:
+            return None
+        first_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+        last_day = datetime.strptime(end_date, '%Y-%m-%d').date()
+    elif report_type in ('checkins', 'checkouts', 'financial') and date:
+        first_day = last_day = datetime.strptime(date, '%Y-%m-%d').date()
+    else:
+        return None
+    key = (selected_user, report_type, first_day, last_day, REPORT_SCHEMA_VERSION, report_format)
+    return key if report_cache.cacheable(key) else None
+
+def report_content(report_type, selected_user, date, start_date, end_date):
+    # (rows, sheets) of a report, exactly one of them set: rows is an iterator of dicts (one
+    # sheet, headers from the keys), sheets a list of (title, rows)
+    date_obj = None
+    next_date = None
+    if date:  # Only parse date if provided
+        date_obj = datetime.strptime(date, '%Y-%m-%d')
+        next_date = date_obj + timedelta(days=1)
+    
+    rows = None
+    sheets = None
+    if report_type == 'current':
+        # Pipeline for currently parked vehicles
+        pipeline = [
+            {
+                '$match': {
+                    'checkout_time': None,
+                    'handled_by': selected_user
+                }
+            },
+            {
+                '$project': {
+                    'vehicle_number': 1,
+                    'checkin_time': {
+                        '$dateToString': {
+                            'format': '%Y-%m-%d %H:%M:%S',
+                            'date': '$checkin_time'
+                        }
+                    },
+                    'payment_mode': 1,
+                    'handled_by': 1,
+                    '_id': 0
+                }
+            }
+        ]
+        rows = vehicles_collection.aggregate(pipeline, batchSize=REPORT_BATCH_SIZE)
+        
+    elif report_type == 'checkins':
+        # Pipeline for check-ins by date
+        pipeline = [
+            {
+                '$match': {
+                    'checkin_time': {
+                        '$gte': date_obj,
+                        '$lt': next_date
+                    },
+                    'handled_by': selected_user
+                }
+            },
+            {
+                '$project': {
+                    'vehicle_number': 1,
+                    'checkin_time': {
+                        '$dateToString': {
+                            'format': '%Y-%m-%d %H:%M:%S',
+                            'date': '$checkin_time'
+                        }
+                    },
+                    'payment_mode': 1,
+                    'handled_by': 1,
+                    '_id': 0
+                }
+            }
+        ]
+        rows = vehicles_collection.aggregate(pipeline, batchSize=REPORT_BATCH_SIZE)
+        
+    elif report_type == 'checkouts':
+        # Check-outs by date, from the completed records partitions
+        rows = checkout_rows(selected_user, date_obj, next_date)
+        
+    elif report_type == 'financial':
+        sheets = financial_sheets(selected_user, date, date_obj, next_date)
+    
+    elif report_type == 'financial_range':
+        # Multi-day financial report built from the daily rollups only
+        sheets = financial_range_sheets(selected_user, start_date, end_date)
+    
+    else:
+        raise ValueError(f'Unknown report type {report_type!r}')
+    
+    return rows, sheets
+
+class ReportCancelled(Exception):
+    pass
+
+def _checked(rows, cancelled):
+    # Asks cancelled() once per REPORT_BATCH_SIZE rows
+    for i, row in enumerate(rows, 1):
+        yield row
+        if i % REPORT_BATCH_SIZE == 0 and cancelled():
+            raise ReportCancelled()
+
+def build_report(report_type, selected_user, date, start_date, end_date, report_format, output, cancelled=None):
+    # Writes a whole report to output (a binary file), for callers that do not stream it to a
+    # browser (report jobs). Served from and stored in the report cache like generate_report().
+    # cancelled, if given, is polled while rows are written and stops the build with ReportCancelled.
+    cache_key = report_cache_key(report_type, selected_user, date, start_date, end_date, report_format)
+    if cache_key:
+        cached = report_cache.open(cache_key)
+        if cached:
+            with cached:
+                shutil.copyfileobj(cached, output)
+            return
+    started = time.time()
+    
+    rows, sheets = report_content(report_type, selected_user, date, start_date, end_date)
+    if rows is not None and cancelled:
+        rows = _checked(rows, cancelled)
+    if cancelled and cancelled():
+        raise ReportCancelled()
+    
+    if report_format == 'csv':
+        for chunk in stream_sheets_csv(sheets) if sheets is not None else stream_rows_csv(rows):
+            output.write(chunk.encode('utf-8'))
+    elif sheets is not None:
+        write_sheets_xlsx(sheets, output)
+    else:
+        write_rows_xlsx(rows, output)
+    
+    if cache_key:
+        output.flush()
+        output.seek(0)
+        report_cache.store_file(cache_key, output, started)
 
 def generate_report():
     if not session.get('is_admin'):
@@ -12,6 +494,10 @@ def generate_report():
     report_type = request.form.get('report_type')
     date = request.form.get('date')
     selected_user = request.form.get('selected_user')
+    start_date = request.form.get('start_date')
+    end_date = request.form.get('end_date')
+    # xlsx (default) or csv, which is streamed as it is read
+    report_format = 'csv' if (request.form.get('format') or '').lower() == 'csv' else 'xlsx'
     
     # Verify if admin has access to this user
     user = users_collection.find_one({'username': selected_user})
@@ -19,358 +505,53 @@ def generate_report():
         return redirect(url_for('admin_dashboard', error='You can only generate reports for users you created'))
     
     try:
-        date_obj = None
-        next_date = None
-        if date:  # Only parse date if provided
-            date_obj = datetime.strptime(date, '%Y-%m-%d')
-            next_date = date_obj + timedelta(days=1)
-            
-        workbook = Workbook()
+        filename = report_filename(report_type, selected_user, date, start_date, end_date)
+        cache_key = report_cache_key(report_type, selected_user, date, start_date, end_date, report_format) \
+            if filename else None
+        if cache_key:
+            cached = report_cache.open(cache_key)
+            if cached:
+                return send_file(
+                    cached,
+                    mimetype=MIMETYPES[report_format],
+                    as_attachment=True,
+                    download_name=f'{filename}.{report_format}'
+                )
+        # Anything written after this moment invalidates what is generated below
+        started = time.time()
         
-        if report_type == 'current':
-            # Pipeline for currently parked vehicles
-            pipeline = [
-                {
-                    '$match': {
-                        'checkout_time': None,
-                        'handled_by': selected_user
-                    }
-                },
-                {
-                    '$project': {
-                        'vehicle_number': 1,
-                        'checkin_time': {
-                            '$dateToString': {
-                                'format': '%Y-%m-%d %H:%M:%S',
-                                'date': '$checkin_time'
-                            }
-                        },
-                        'payment_mode': 1,
-                        'handled_by': 1,
-                        '_id': 0
-                    }
-                }
-            ]
-            vehicles = list(vehicles_collection.aggregate(pipeline))
-            filename = f'current_parked_vehicles_{selected_user}.xlsx'
-            
-        elif report_type == 'checkins':
-            # Pipeline for check-ins by date
-            pipeline = [
-                {
-                    '$match': {
-                        'checkin_time': {
-                            '$gte': date_obj,
-                            '$lt': next_date
-                        },
-                        'handled_by': selected_user
-                    }
-                },
-                {
-                    '$project': {
-                        'vehicle_number': 1,
-                        'checkin_time': {
-                            '$dateToString': {
-                                'format': '%Y-%m-%d %H:%M:%S',
-                                'date': '$checkin_time'
-                            }
-                        },
-                        'payment_mode': 1,
-                        'handled_by': 1,
-                        '_id': 0
-                    }
-                }
-            ]
-            vehicles = list(vehicles_collection.aggregate(pipeline))
-            filename = f'checkins_{selected_user}_{date}.xlsx'
-            
-        elif report_type == 'checkouts':
-            # Pipeline for check-outs by date
-            pipeline = [
-                {
-                    '$match': {
-                        'checkout_time': {
-                            '$gte': date_obj,
-                            '$lt': next_date
-                        },
-                        'handled_by': selected_user
-                    }
-                },
-                {
-                    '$project': {
-                        'vehicle_number': 1,
-                        'checkin_time': {
-                            '$dateToString': {
-                                'format': '%Y-%m-%d %H:%M:%S',
-                                'date': '$checkin_time'
-                            }
-                        },
-                        'checkout_time': {
-                            '$dateToString': {
-                                'format': '%Y-%m-%d %H:%M:%S',
-                                'date': '$checkout_time'
-                            }
-                        },
-                        'payment_mode': 1,
-                        'charge': 1,
-                        'handled_by': 1,
-                        '_id': 0
-                    }
-                }
-            ]
-            vehicles = list(completed_records.aggregate(pipeline))
-            filename = f'checkouts_{selected_user}_{date}.xlsx'
-            
-        elif report_type == 'financial':
-            # Financial report generation
-            checkin_pipeline = [
-                {
-                    '$match': {
-                        'checkin_time': {
-                            '$gte': date_obj,
-                            '$lt': next_date
-                        },
-                        'handled_by': selected_user
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$payment_mode',
-                        'count': {'$sum': 1},
-                        'total_amount': {'$sum': 15}
-                    }
-                }
-            ]
-            
-            # Modified checkout pipeline to match actual database structure
-            checkout_pipeline = [
-                {
-                    '$match': {
-                        'checkout_time': {
-                            '$gte': date_obj,
-                            '$lt': next_date
-                        },
-                        'handled_by': selected_user
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': {
-                            'initial_mode': '$initial_payment_mode',
-                            'additional_mode': '$additional_payment_mode'
-                        },
-                        'count': {'$sum': 1},
-                        'initial_amount': {'$sum': '$initial_payment'},
-                        'additional_amount': {'$sum': '$additional_charge'},
-                        'total_amount': {'$sum': '$total_charge'}
-                    }
-                }
-            ]
-            
-            checkin_stats = list(vehicles_collection.aggregate(checkin_pipeline))
-            checkout_stats = list(completed_records.aggregate(checkout_pipeline))
-            
-            # Create sheets
-            checkin_sheet = workbook.active
-            checkin_sheet.title = "Check-in Stats"
-            
-            # Write check-in stats
-            checkin_sheet['A1'] = f"Check-in Statistics for {selected_user}"
-            checkin_sheet['A2'] = "Payment Mode"
-            checkin_sheet['B2'] = "Vehicle Count"
-            checkin_sheet['C2'] = "Total Amount"
-            
-            row = 3
-            total_checkins = 0
-            total_checkin_amount = 0
-            checkin_by_mode = {}
-            
-            for stat in checkin_stats:
-                checkin_sheet[f'A{row}'] = stat['_id']
-                checkin_sheet[f'B{row}'] = stat['count']
-                checkin_sheet[f'C{row}'] = stat['total_amount']
-                total_checkins += stat['count']
-                total_checkin_amount += stat['total_amount']
-                checkin_by_mode[stat['_id']] = stat['total_amount']
-                row += 1
-            
-            checkin_sheet[f'A{row}'] = "TOTAL"
-            checkin_sheet[f'B{row}'] = total_checkins
-            checkin_sheet[f'C{row}'] = total_checkin_amount
-            
-            # Create modified check-out sheet with payment mode splits
-            checkout_sheet = workbook.create_sheet("Check-out Stats")
-            checkout_sheet['A1'] = f"Check-out Statistics for {selected_user}"
-            checkout_sheet['A2'] = "Payment Mode"
-            checkout_sheet['B2'] = "Vehicle Count"
-            checkout_sheet['C2'] = "Initial Amount"
-            checkout_sheet['D2'] = "Additional Amount"
-            checkout_sheet['E2'] = "Total Amount"
-            
-            row = 3
-            total_checkouts = 0
-            total_initial_amount = 0
-            total_additional_amount = 0
-            total_checkout_amount = 0
-            checkout_summary = {}  # To store amounts by payment mode
-            
-            for stat in checkout_stats:
-                initial_mode = stat['_id']['initial_mode']
-                additional_mode = stat['_id']['additional_mode']
-                
-                # Handle initial payment
-                if initial_mode not in checkout_summary:
-                    checkout_summary[initial_mode] = {
-                        'count': 0,
-                        'initial': 0,
-                        'additional': 0,
-                        'total': 0
-                    }
-                checkout_summary[initial_mode]['count'] += stat['count']
-                checkout_summary[initial_mode]['initial'] += stat['initial_amount']
-                checkout_summary[initial_mode]['total'] += stat['initial_amount']
-                
-                # Handle additional payment if exists
-                if additional_mode:
-                    if additional_mode not in checkout_summary:
-                        checkout_summary[additional_mode] = {
-                            'count': 0,
-                            'initial': 0,
-                            'additional': 0,
-                            'total': 0
-                        }
-                    checkout_summary[additional_mode]['additional'] += stat['additional_amount']
-                    checkout_summary[additional_mode]['total'] += stat['additional_amount']
-                
-                total_checkouts += stat['count']
-                total_initial_amount += stat['initial_amount']
-                total_additional_amount += stat['additional_amount']
-                total_checkout_amount += stat['total_amount']
-            
-            # Write checkout summary by payment mode
-            for mode, data in checkout_summary.items():
-                if mode:  # Skip empty payment modes
-                    checkout_sheet[f'A{row}'] = mode
-                    checkout_sheet[f'B{row}'] = data['count']
-                    checkout_sheet[f'C{row}'] = data['initial']
-                    checkout_sheet[f'D{row}'] = data['additional']
-                    checkout_sheet[f'E{row}'] = data['total']
-                    row += 1
-            
-            # Write totals
-            checkout_sheet[f'A{row}'] = "TOTAL"
-            checkout_sheet[f'B{row}'] = total_checkouts
-            checkout_sheet[f'C{row}'] = total_initial_amount
-            checkout_sheet[f'D{row}'] = total_additional_amount
-            checkout_sheet[f'E{row}'] = total_checkout_amount
-            
-            # Create detailed summary sheet
-            summary_sheet = workbook.create_sheet("Daily Summary")
-            summary_sheet['A1'] = f"Financial Summary for {selected_user} on {date}"
-            
-            row = 3
-            # Check-in Summary
-            summary_sheet[f'A{row}'] = "CHECK-IN SUMMARY"
-            row += 1
-            summary_sheet[f'A{row}'] = "Total Vehicles Checked In"
-            summary_sheet[f'B{row}'] = total_checkins
-            row += 1
-            
-            summary_sheet[f'A{row}'] = "Check-in Amount by Payment Mode:"
-            row += 1
-            for mode, amount in checkin_by_mode.items():
-                summary_sheet[f'A{row}'] = f"Total Check-in Amount ({mode})"
-                summary_sheet[f'B{row}'] = amount
-                row += 1
-            
-            summary_sheet[f'A{row}'] = "Total Check-in Amount"
-            summary_sheet[f'B{row}'] = total_checkin_amount
-            row += 2
-            
-            # Check-out Summary
-            summary_sheet[f'A{row}'] = "CHECK-OUT SUMMARY"
-            row += 1
-            summary_sheet[f'A{row}'] = "Total Vehicles Checked Out"
-            summary_sheet[f'B{row}'] = total_checkouts
-            row += 1
-            
-            # Initial Amount Summary
-            summary_sheet[f'A{row}'] = "Initial Amount by Payment Mode:"
-            row += 1
-            for mode, data in checkout_summary.items():
-                if mode and data['initial'] > 0:
-                    summary_sheet[f'A{row}'] = f"Initial Amount ({mode})"
-                    summary_sheet[f'B{row}'] = data['initial']
-                    row += 1
-            
-            summary_sheet[f'A{row}'] = "Total Initial Amount"
-            summary_sheet[f'B{row}'] = total_initial_amount
-            row += 2
-            
-            # Additional Amount Summary
-            summary_sheet[f'A{row}'] = "Additional Amount by Payment Mode:"
-            row += 1
-            for mode, data in checkout_summary.items():
-                if mode and data['additional'] > 0:
-                    summary_sheet[f'A{row}'] = f"Additional Amount ({mode})"
-                    summary_sheet[f'B{row}'] = data['additional']
-                    row += 1
-            
-            summary_sheet[f'A{row}'] = "Total Additional Amount"
-            summary_sheet[f'B{row}'] = total_additional_amount
-            row += 2
-            
-            # Total Business Summary
-            summary_sheet[f'A{row}'] = "TOTAL BUSINESS SUMMARY"
-            row += 1
-            
-            # Combine check-in and check-out amounts by payment mode
-            total_by_mode = {}
-            for mode, amount in checkin_by_mode.items():
-                if mode not in total_by_mode:
-                    total_by_mode[mode] = 0
-                total_by_mode[mode] += amount
-            
-            for mode, data in checkout_summary.items():
-                if mode not in total_by_mode:
-                    total_by_mode[mode] = 0
-                total_by_mode[mode] += data['total']
-            
-            for mode, total in total_by_mode.items():
-                if mode:  # Skip empty payment modes
-                    summary_sheet[f'A{row}'] = f"Total Business ({mode})"
-                    summary_sheet[f'B{row}'] = total
-                    row += 1
-            
-            summary_sheet[f'A{row}'] = "TOTAL BUSINESS FOR THE DAY"
-            summary_sheet[f'B{row}'] = total_checkin_amount + total_checkout_amount
-            
-            filename = f'financial_report_{selected_user}_{date}.xlsx'
+        rows, sheets = report_content(report_type, selected_user, date, start_date, end_date)
         
-        # Write to Excel for non-financial reports
-        if report_type != 'financial':
-            worksheet = workbook.active
-            if vehicles:
-                headers = list(vehicles[0].keys())
-                for col, header in enumerate(headers, start=1):
-                    worksheet.cell(row=1, column=col, value=header.replace('_', ' ').title())
-                
-                for row, vehicle in enumerate(vehicles, start=2):
-                    for col, key in enumerate(headers, start=1):
-                        worksheet.cell(row=row, column=col, value=vehicle[key])
+        if report_format == 'csv':
+            # Streamed straight from the cursor; the first chunk leaves before the rest is read
+            chunks = stream_sheets_csv(sheets) if sheets is not None else stream_rows_csv(rows)
+            if cache_key:
+                chunks = report_cache.store_chunks(cache_key, chunks, started)
+            return Response(
+                stream_with_context(chunks),
+                mimetype='text/csv',
+                headers={'Content-Disposition': f'attachment; filename={filename}.csv'}
+            )
         
-        # Create response
-        output = io.BytesIO()
-        workbook.save(output)
+        # Spool the workbook to a temporary file that is streamed to the client and removed afterwards
+        output = tempfile.TemporaryFile()
+        if sheets is not None:
+            write_sheets_xlsx(sheets, output)
+        else:
+            # Rows come from cursors iterated in batches instead of materializing the whole result
+            write_rows_xlsx(rows, output)
         output.seek(0)
+        if cache_key:
+            report_cache.store_file(cache_key, output, started)
+            output.seek(0)
         
         return send_file(
             output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            mimetype=MIMETYPES['xlsx'],
             as_attachment=True,
-            download_name=filename
+            download_name=f'{filename}.xlsx'
         )
         
     except Exception as e:
         print(f"Error generating report: {str(e)}")
-        return redirect(url_for('admin_dashboard', error='Error generating report')) 
\ No newline at end of file
+        return redirect(url_for('admin_dashboard', error='Error generating report'))
\ No newline at end of file
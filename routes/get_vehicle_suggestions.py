@@ -1,5 +1,7 @@
 from flask import request, jsonify, session
-from config import vehicles_collection
+from pymongo.errors import ConnectionFailure
+from suggestion_index import suggestion_index
+from offline_journal import offline_journal
 
 def get_vehicle_suggestions():
     query = request.args.get('query', '').upper()
@@ -8,16 +10,20 @@ def get_vehicle_suggestions():
     
     # Get current user's username
     handler_username = session.get('username')
+    if not handler_username:
+        return jsonify({'suggestions': []})
     
-    # Find vehicles that match the query AND were handled by this user
-    vehicles = vehicles_collection.find(
-        {
-            'vehicle_number': {'$regex': f'^{query}'},
-            'handled_by': handler_username,  # Add this condition
-            'checkout_time': None  # Only show active vehicles
-        },
-        {'vehicle_number': 1, '_id': 0}
-    ).limit(5)  # Limit to 5 suggestions
+    # Serve active plates handled by this user from the in-memory prefix index
+    suggestions = suggestion_index.suggest(handler_username, query, 5)  # Limit to 5 suggestions
+    if suggestions is None:
+        # Index is stale for this user, reload their active plates from the database
+        try:
+            suggestion_index.load_handler(handler_username)
+        except ConnectionFailure:
+            if not offline_journal.enabled:
+                raise
+            # Offline: suggest from the booth's local copy of the active tickets
+            return jsonify({'suggestions': offline_journal.active_plates(handler_username, query, 5)})
+        suggestions = suggestion_index.suggest(handler_username, query, 5)
     
-    suggestions = [v['vehicle_number'] for v in vehicles]
-    return jsonify({'suggestions': suggestions}) 
\ No newline at end of file
+    return jsonify({'suggestions': suggestions or []})
@@ -1,7 +1,10 @@
 from flask import request, session, redirect, url_for, render_template
 from datetime import datetime
-from config import vehicles_collection, completed_records
+from config import vehicles_collection
+from partitions import partition_for
 from routes.calculate_charge import calculate_charge
+from suggestion_index import suggestion_index
+from report_cache import report_cache
 
 def handle_vehicle():
     if 'username' not in session:
@@ -34,6 +37,7 @@ def handle_vehicle():
                 'handled_by': session['username']
             }
             vehicles_collection.insert_one(vehicle)
+            suggestion_index.add(session['username'], vehicle_number)
 
             # Show success message with Print button
             return render_template('home.html',
@@ -66,13 +70,14 @@ def handle_vehicle():
                 {'$set': {'checkout_time': checkout_time, 'charge': charge}}
             )
 
-            # Move the completed record to the `completed_records` collection
-            completed_records_collection = completed_records
+            # Move the completed record to this month's completed_records partition
             completed_record = vehicles_collection.find_one({'_id': vehicle['_id']})
-            completed_records_collection.insert_one(completed_record)
+            partition_for(checkout_time).insert_one(completed_record)
 
             # Delete the record from the active `vehicles` collection
             vehicles_collection.delete_one({'_id': vehicle['_id']})
+            suggestion_index.remove(vehicle.get('handled_by'), vehicle_number)
+            report_cache.invalidate(vehicle.get('handled_by'), checkin_time)
 
             # Show success message with Print button
             return render_template('home.html',
@@ -0,0 +1,5 @@
+from flask import jsonify
+
+def health():
+    # Liveness check for load balancers; it does not touch MongoDB
+    return jsonify({'status': 'ok'})
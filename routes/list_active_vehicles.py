@@ -0,0 +1,36 @@
+from flask import request, session, jsonify
+from config import users_collection, vehicles_collection
+from pagination import page_size, keyset_filter, sort_spec, build_page, format_time
+
+def list_active_vehicles():
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        limit = page_size(request.args.get('limit'))
+        
+        # Active vehicles only for users created by this admin
+        usernames = users_collection.distinct('username', {'created_by': session['username']})
+        query = {
+            'handled_by': {'$in': usernames},
+            'checkout_time': None
+        }
+        query.update(keyset_filter('checkin_time', request.args.get('cursor')))
+        
+        vehicles = vehicles_collection.find(query).sort(sort_spec('checkin_time')).limit(limit + 1)
+        vehicles, next_cursor = build_page(vehicles, limit, 'checkin_time')
+        
+        return jsonify({
+            'success': True,
+            'items': [{
+                'vehicle_number': vehicle['vehicle_number'],
+                'checkin_time': format_time(vehicle.get('checkin_time')),
+                'payment_mode': vehicle.get('payment_mode'),
+                'handled_by': vehicle.get('handled_by')
+            } for vehicle in vehicles],
+            'next_cursor': next_cursor
+        })
+    
+    except Exception as e:
+        print(f"Error listing active vehicles: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error listing active vehicles: {str(e)}'})
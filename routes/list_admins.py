@@ -0,0 +1,29 @@
+from flask import request, session, jsonify
+from config import admins_collection
+from pagination import page_size, keyset_filter, sort_spec, build_page, format_time
+
+def list_admins():
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        limit = page_size(request.args.get('limit'))
+        query = keyset_filter('created_at', request.args.get('cursor'))
+        
+        admins = admins_collection.find(query).sort(sort_spec('created_at')).limit(limit + 1)
+        admins, next_cursor = build_page(admins, limit, 'created_at')
+        
+        return jsonify({
+            'success': True,
+            'items': [{
+                'username': admin['username'],
+                'created_at': format_time(admin.get('created_at'), '%Y-%m-%d %H:%M'),
+                'is_main_admin': admin['username'] == 'admin',
+                'is_current_user': admin['username'] == session['username']
+            } for admin in admins],
+            'next_cursor': next_cursor
+        })
+    
+    except Exception as e:
+        print(f"Error listing admins: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error listing admins: {str(e)}'})
@@ -0,0 +1,53 @@
+from flask import request, session, jsonify
+from config import users_collection
+from pagination import page_size, keyset_filter, build_page, format_time
+
+def list_users():
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    try:
+        limit = page_size(request.args.get('limit'))
+        match = {'created_by': session['username']}  # Only users created by current admin
+        match.update(keyset_filter('created_at', request.args.get('cursor')))
+        
+        users = users_collection.aggregate([
+            {'$match': match},
+            {'$sort': {'created_at': -1, '_id': -1}},
+            {'$limit': limit + 1},
+            {
+                '$lookup': {
+                    'from': 'rates',
+                    'localField': 'rate_id',
+                    'foreignField': '_id',
+                    'as': 'rate'
+                }
+            },
+            {
+                '$unwind': {
+                    'path': '$rate',
+                    'preserveNullAndEmptyArrays': True
+                }
+            }
+        ])
+        users, next_cursor = build_page(users, limit, 'created_at')
+        
+        return jsonify({
+            'success': True,
+            'items': [{
+                'username': user['username'],
+                'created_at': format_time(user.get('created_at')),
+                'created_by': user.get('created_by') or 'N/A',
+                'rate': {
+                    'initial_amount': user['rate']['initial_amount'],
+                    'initial_duration': user['rate']['initial_duration'],
+                    'extra_charge': user['rate']['extra_charge'],
+                    'extra_charge_duration': user['rate']['extra_charge_duration']
+                } if user.get('rate') else None
+            } for user in users],
+            'next_cursor': next_cursor
+        })
+    
+    except Exception as e:
+        print(f"Error listing users: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error listing users: {str(e)}'})
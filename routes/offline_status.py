@@ -0,0 +1,10 @@
+from flask import session, jsonify
+from offline_journal import offline_journal
+
+def offline_status():
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    if not offline_journal.enabled:
+        return jsonify({'success': True, 'journal': {'enabled': False}})
+    # Pending entries, replay conflicts and failures that need a look and the last sync attempt
+    return jsonify({'success': True, 'journal': offline_journal.status()})
@@ -0,0 +1,14 @@
+from flask import session, jsonify, url_for
+from report_jobs import report_jobs, job_payload
+
+def report_job_status(job_id):
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    job = report_jobs.get(session['username'], job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Report job not found'})
+    payload = job_payload(job)
+    if job['status'] == 'done':
+        payload['download_url'] = url_for('route_download_report_job', job_id=job_id)
+    return jsonify({'success': True, 'job': payload})
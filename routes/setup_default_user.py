@@ -1,15 +1,19 @@
 from flask import request, redirect, url_for, flash
-from config import admins_collection, default_user_setup_done
+from pymongo.errors import ConnectionFailure
+from bootstrap_state import is_initialized
+
+# Served whether or not an admin exists, without touching the database
+EXEMPT_ENDPOINTS = {'static', 'route_admin_register', 'route_metrics', 'route_health'}
 
 def setup_default_user():
-    global default_user_setup_done
-    if not default_user_setup_done:
-        # Check if any admin exists
-        admin_exists = admins_collection.find_one({})
-        if not admin_exists:
-            # Don't create default admin, just set the flag
-            default_user_setup_done = True
-            # If trying to access any route except admin_register, redirect to it
-            if request.endpoint and request.endpoint not in ['route_admin_register', 'static']:
-                flash('No admin exists. Please create an admin account using the master key.', 'warning')
-                return redirect(url_for('route_admin_register')) 
\ No newline at end of file
+    if request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    # Check if any admin exists; with the database unreachable the routes decide (offline mode)
+    try:
+        initialized = is_initialized()
+    except ConnectionFailure:
+        return None
+    if not initialized:
+        # Don't create a default admin; every page leads to admin_register until one exists
+        flash('No admin exists. Please create an admin account using the master key.', 'warning')
+        return redirect(url_for('route_admin_register'))
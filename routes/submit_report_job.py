@@ -0,0 +1,41 @@
+from flask import request, session, jsonify, url_for
+from config import users_collection
+from report_jobs import report_jobs, job_payload
+from routes.generate_report import report_filename
+
+def submit_report_job():
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    # Same fields as the generate_report form
+    params = {
+        'report_type': request.form.get('report_type'),
+        'selected_user': request.form.get('selected_user'),
+        'date': request.form.get('date'),
+        'start_date': request.form.get('start_date'),
+        'end_date': request.form.get('end_date'),
+        'format': 'csv' if (request.form.get('format') or '').lower() == 'csv' else 'xlsx'
+    }
+    filename = report_filename(params['report_type'], params['selected_user'], params['date'],
+                               params['start_date'], params['end_date'])
+    if not filename:
+        return jsonify({'success': False, 'message': 'Unknown report type'})
+    params['filename'] = f"{filename}.{params['format']}"
+    
+    # Verify if admin has access to this user
+    user = users_collection.find_one({'username': params['selected_user']})
+    if not user or user.get('created_by') != session.get('username'):
+        return jsonify({'success': False, 'message': 'You can only generate reports for users you created'})
+    
+    try:
+        job, message = report_jobs.submit(session['username'], params)
+        if not job:
+            return jsonify({'success': False, 'message': message})
+        return jsonify({
+            'success': True,
+            'job': job_payload(job),
+            'status_url': url_for('route_report_job_status', job_id=str(job['_id']))
+        })
+    except Exception as e:
+        print(f"Error submitting report job: {str(e)}")
+        return jsonify({'success': False, 'message': 'Error submitting report'})
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module='app'):
+    # Imports the module in a fresh interpreter with -X importtime and returns
+    # (total_ms, [(module, self_ms, cumulative_ms), ...]) for everything it pulled in
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f'import {module} failed')
+
+    modules = []
+    total_ms = None
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].strip()
+        self_ms = int(fields[0]) / 1000
+        cumulative_ms = int(fields[1]) / 1000
+        modules.append((name, self_ms, cumulative_ms))
+        if name == module:
+            total_ms = cumulative_ms
+    return total_ms, modules
+
+
+def profile_startup(module='app', runs=3):
+    # The fastest of a few cold imports, so a busy machine does not fail the budget on its own
+    best = None
+    for _ in range(runs):
+        total_ms, modules = import_times(module)
+        if best is None or total_ms < best[0]:
+            best = (total_ms, modules)
+    return best
@@ -84,7 +84,7 @@ document.getElementById('createUserForm').addEventListener('submit', function(e)
     
     const formData = new FormData(this);
     const feedbackDiv = document.getElementById('feedback');
-    const tbody = document.querySelector('.custom-table tbody');
+    const tbody = document.getElementById('usersTableBody');
     
     fetch(CREATE_USER_URL, {
         method: 'POST',
@@ -113,26 +113,12 @@ document.getElementById('createUserForm').addEventListener('submit', function(e)
                 throw new Error('Invalid user data received');
             }
             
-            newRow.innerHTML = `
-                <td>${data.user.username}</td>
-                <td>${createdAt}</td>
-                <td>${createdBy}</td>
-                <td>₹${data.user.rate.initial_amount}</td>
-                <td>${data.user.rate.initial_duration} hours</td>
-                <td>₹${data.user.rate.extra_charge}</td>
-                <td>${data.user.rate.extra_charge_duration} hours</td>
-                <td>
-                    <form action="/route_delete_user/${data.user.username}" 
-                          method="POST" 
-                          class="delete-user-form" 
-                          style="display: inline;"
-                          onsubmit="return handleDelete(event, this)">
-                        <button type="submit" class="btn btn-custom btn-custom-danger">
-                            <i class="fas fa-trash"></i> Delete
-                        </button>
-                    </form>
-                </td>
-            `;
+            newRow.innerHTML = userRowCells({
+                username: data.user.username,
+                created_at: createdAt,
+                created_by: createdBy,
+                rate: data.user.rate
+            });
             tbody.insertBefore(newRow, tbody.firstChild);
             
             // Show success message
@@ -157,4 +143,159 @@ document.getElementById('createUserForm').addEventListener('submit', function(e)
     setTimeout(() => {
         feedbackDiv.style.display = 'none';
     }, 5000);
-}); 
\ No newline at end of file
+}); 
+
+// Escape values before inserting them into table rows
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value === null || value === undefined ? '' : String(value);
+    return div.innerHTML;
+}
+
+function userRowCells(user) {
+    const rate = user.rate || {};
+    const rateValue = key => user.rate ? escapeHtml(rate[key]) : 'N/A';
+    return `
+                <td>${escapeHtml(user.username)}</td>
+                <td>${escapeHtml(user.created_at)}</td>
+                <td>${escapeHtml(user.created_by)}</td>
+                <td>₹${rateValue('initial_amount')}</td>
+                <td>${rateValue('initial_duration')} hours</td>
+                <td>₹${rateValue('extra_charge')}</td>
+                <td>${rateValue('extra_charge_duration')} hours</td>
+                <td>
+                    <form action="/route_delete_user/${encodeURIComponent(user.username)}" 
+                          method="POST" 
+                          class="delete-user-form" 
+                          style="display: inline;"
+                          onsubmit="return handleDelete(event, this)">
+                        <button type="submit" class="btn btn-custom btn-custom-danger">
+                            <i class="fas fa-trash"></i> Delete
+                        </button>
+                    </form>
+                </td>
+            `;
+}
+
+function vehicleRowCells(vehicle) {
+    return `
+                <td>${escapeHtml(vehicle.vehicle_number)}</td>
+                <td>${escapeHtml(vehicle.checkin_time)}</td>
+                <td>${escapeHtml(vehicle.payment_mode)}</td>
+                <td>${escapeHtml(vehicle.handled_by)}</td>
+            `;
+}
+
+function adminRowCells(admin) {
+    const canDelete = !admin.is_main_admin && !admin.is_current_user;
+    return `
+                <td>
+                    <i class="fas fa-user-shield text-primary"></i>
+                    ${escapeHtml(admin.username)}
+                    ${admin.is_main_admin ? '<span class="badge bg-warning">Main Admin</span>' : ''}
+                    ${admin.is_current_user ? '<span class="badge bg-info">You</span>' : ''}
+                </td>
+                <td>${escapeHtml(admin.created_at)}</td>
+                <td>
+                    ${canDelete ? `
+                    <form action="/route_delete_admin/${encodeURIComponent(admin.username)}" 
+                          method="POST" class="d-inline"
+                          onsubmit="return confirm('Are you sure you want to delete this admin?')">
+                        <button type="submit" class="btn btn-danger btn-sm">
+                            <i class="fas fa-trash"></i> Delete
+                        </button>
+                    </form>` : ''}
+                </td>
+            `;
+}
+
+// Dashboard tables load one page at a time, following the cursor returned by each request
+function setupPagedTable(options) {
+    const tbody = document.getElementById(options.tbodyId);
+    const button = document.getElementById(options.buttonId);
+    const table = options.tableId ? document.getElementById(options.tableId) : null;
+    const empty = options.emptyId ? document.getElementById(options.emptyId) : null;
+    let nextCursor = null;
+    let loading = false;
+    
+    function loadPage() {
+        if (loading) {
+            return;
+        }
+        loading = true;
+        
+        const params = new URLSearchParams();
+        if (nextCursor) {
+            params.set('cursor', nextCursor);
+        }
+        
+        fetch(`${options.url}?${params.toString()}`, {
+            headers: {
+                'Accept': 'application/json'
+            },
+            credentials: 'same-origin'
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message || 'Failed to load data');
+            }
+            
+            data.items.forEach(item => {
+                const row = document.createElement('tr');
+                row.innerHTML = options.renderRow(item);
+                tbody.appendChild(row);
+            });
+            
+            nextCursor = data.next_cursor;
+            button.style.display = nextCursor ? 'inline-block' : 'none';
+            
+            const hasRows = tbody.children.length > 0;
+            if (table) {
+                table.style.display = hasRows ? 'block' : 'none';
+            }
+            if (empty) {
+                empty.style.display = hasRows ? 'none' : 'block';
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+        })
+        .finally(() => {
+            loading = false;
+        });
+    }
+    
+    button.addEventListener('click', loadPage);
+    loadPage();
+}
+
+setupPagedTable({
+    url: USERS_PAGE_URL,
+    tbodyId: 'usersTableBody',
+    buttonId: 'usersLoadMore',
+    renderRow: userRowCells
+});
+
+setupPagedTable({
+    url: VEHICLES_PAGE_URL,
+    tbodyId: 'vehiclesTableBody',
+    buttonId: 'vehiclesLoadMore',
+    tableId: 'vehiclesTable',
+    emptyId: 'vehiclesEmpty',
+    renderRow: vehicleRowCells
+});
+
+setupPagedTable({
+    url: ADMINS_PAGE_URL,
+    tbodyId: 'adminsTableBody',
+    buttonId: 'adminsLoadMore',
+    tableId: 'adminsTable',
+    emptyId: 'adminsEmpty',
+    renderRow: adminRowCells
+});
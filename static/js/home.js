@@ -1,10 +1,89 @@
+// Receipts are requested in compact mode: the server sends only the fields and they are rendered here
+const RECEIPT_FORMAT = 'compact';
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value === null || value === undefined ? '' : String(value);
+    return div.innerHTML;
+}
+
+// 'YYYY-MM-DD HH:MM:SS' -> 'HH:MM DD/MM'
+function shortTime(value) {
+    return `${value.slice(11, 16)} ${value.slice(8, 10)}/${value.slice(5, 7)}`;
+}
+
+function receiptRow(label, value, extraClass = '') {
+    return `
+                    <div class="receipt-row ${extraClass}">
+                        <span>${label}</span>
+                        <span>${value}</span>
+                    </div>`;
+}
+
+function renderReceipt(data) {
+    if (!data.receipt_data) {
+        return data.receipt;
+    }
+    
+    const r = data.receipt_data;
+    if (data.receipt_type === 'checkin') {
+        return `
+        <div class="receipt-container" id="checkinReceipt">
+            <div class="receipt">
+                <div class="receipt-header">
+                    <h2>PARKING TICKET</h2>
+                    <div class="receipt-divider"></div>
+                </div>
+                <div class="receipt-body">
+                    ${receiptRow('Vehicle:', escapeHtml(r.vehicle_number))}
+                    ${receiptRow('In:', shortTime(r.checkin_time))}
+                    <div class="receipt-divider"></div>
+                    ${receiptRow('Amount:', `₹${escapeHtml(r.initial_amount)}`)}
+                    ${receiptRow('Duration:', `${escapeHtml(r.initial_duration)} hours`)}
+                    ${receiptRow('Mode:', escapeHtml(r.payment_mode))}
+                    <div class="receipt-divider"></div>
+                    ${receiptRow('Staff:', escapeHtml(r.staff))}
+                </div>
+                <div class="receipt-footer">
+                    <p>Thank You!</p>
+                    <small>Extra charges apply after ${escapeHtml(r.initial_duration)} hours</small>
+                    <small>(₹${escapeHtml(r.extra_charge)} per ${escapeHtml(r.extra_charge_duration)} hours)</small>
+                </div>
+            </div>
+        </div>`;
+    }
+    
+    return `
+        <div class="receipt-container" id="checkoutReceipt">
+            <div class="receipt">
+                <div class="receipt-header">
+                    <h2>PARKING RECEIPT</h2>
+                    <div class="receipt-divider"></div>
+                </div>
+                <div class="receipt-body">
+                    ${receiptRow('Vehicle:', escapeHtml(r.vehicle_number))}
+                    ${receiptRow('Duration:', `${shortTime(r.checkin_time)} - ${shortTime(r.checkout_time)}`)}
+                    <div class="receipt-divider"></div>
+                    ${receiptRow('Initial:', `₹${escapeHtml(r.initial_amount)} (${escapeHtml(r.initial_payment_mode)})`)}
+                    ${r.additional_charge > 0 ? receiptRow('Add.Chrg:', `₹${escapeHtml(r.additional_charge)} (${escapeHtml(r.additional_payment_mode)})`) : ''}
+                    ${receiptRow('TOTAL:', `₹${escapeHtml(r.total_charge)}`, 'total')}
+                    <div class="receipt-divider"></div>
+                    ${receiptRow('Staff:', escapeHtml(r.staff))}
+                </div>
+                <div class="receipt-footer">
+                    <p>Thank You!</p>
+                </div>
+            </div>
+        </div>`;
+}
+
 // Common function to handle receipts and messages
 function handleResponse(data) {
     if (data.error) {
         showFlashMessage(data.message, 'danger');
     } else {
         showFlashMessage(data.message, 'success');
-        document.getElementById('receiptContainer').innerHTML = data.receipt;
+        document.getElementById('receiptContainer').innerHTML = renderReceipt(data);
     }
 }
 
@@ -12,6 +91,7 @@ function handleResponse(data) {
 document.getElementById('checkinForm').addEventListener('submit', function(e) {
     e.preventDefault();
     const formData = new FormData(this);
+    formData.append('receipt_format', RECEIPT_FORMAT);
     
     fetch(CHECKIN_URL, {
         method: 'POST',
@@ -27,7 +107,7 @@ document.getElementById('checkinForm').addEventListener('submit', function(e) {
             
             // Insert the receipt HTML into the receipt container
             const receiptContainer = document.getElementById('receiptContainer');
-            receiptContainer.innerHTML = data.receipt;
+            receiptContainer.innerHTML = renderReceipt(data);
             
             // Get the receipt element
             const receipt = receiptContainer.querySelector('.receipt-container');
@@ -52,6 +132,7 @@ document.getElementById('checkinForm').addEventListener('submit', function(e) {
 document.getElementById('checkoutForm').addEventListener('submit', function(e) {
     e.preventDefault();
     const formData = new FormData(this);
+    formData.append('receipt_format', RECEIPT_FORMAT);
     
     fetch(CHECKOUT_URL, {
         method: 'POST',
@@ -69,7 +150,7 @@ document.getElementById('checkoutForm').addEventListener('submit', function(e) {
             
             // Insert the receipt HTML into the receipt container
             const receiptContainer = document.getElementById('receiptContainer');
-            receiptContainer.innerHTML = data.receipt;
+            receiptContainer.innerHTML = renderReceipt(data);
             
             // Get the receipt element
             const receipt = receiptContainer.querySelector('.receipt-container');
@@ -114,6 +195,7 @@ document.getElementById('additionalPaymentForm').addEventListener('submit', func
     }
     
     const formData = new FormData(this);
+    formData.append('receipt_format', RECEIPT_FORMAT);
     console.log('Submitting additional payment with mode:', paymentMode); // Debug log
     
     fetch(CHECKOUT_URL, {
@@ -130,7 +212,7 @@ document.getElementById('additionalPaymentForm').addEventListener('submit', func
                 modal.hide();
             }
             showFlashMessage(data.message, 'success');
-            document.getElementById('receiptContainer').innerHTML = data.receipt;
+            document.getElementById('receiptContainer').innerHTML = renderReceipt(data);
             
             document.getElementById('checkoutForm').reset();
         }
@@ -213,6 +295,7 @@ function showPaymentModal(data) {
         formData.append('payment_mode', selectedPaymentMode);
         formData.append('additional_charge', data.additional_charge);
         formData.append('total_charge', data.total_charge);
+        formData.append('receipt_format', RECEIPT_FORMAT);
         
         fetch(CHECKOUT_URL, {
             method: 'POST',
@@ -225,7 +308,7 @@ function showPaymentModal(data) {
             } else {
                 modal.hide();
                 showFlashMessage(responseData.message, 'success');
-                document.getElementById('receiptContainer').innerHTML = responseData.receipt;
+                document.getElementById('receiptContainer').innerHTML = renderReceipt(responseData);
                 
                 // Wait for receipt to be rendered then print
                 setTimeout(() => {
@@ -0,0 +1,125 @@
+import bisect
+import threading
+import time
+from config import vehicles_collection, SUGGESTION_INDEX_TTL
+
+
+class SuggestionIndex:
+    # Sorted active plates per handler, searched by prefix with bisect
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._plates = {}
+        self._loaded_at = {}
+        self._rebuilt_at = None
+        self._lock = threading.Lock()
+        # add()/remove() calls made while a load from the database is in flight, as
+        # (sequence, handler, vehicle_number, added). A load replays the ones after it began,
+        # since its query may or may not have seen them.
+        self._sequence = 0
+        self._loads = 0
+        self._changes = []
+
+    def begin_load(self):
+        # Call before querying the database; pass the result to set_handler(), or call
+        # abort_load() if the query fails
+        with self._lock:
+            self._loads += 1
+            return self._sequence
+
+    def _end_load_locked(self):
+        self._loads -= 1
+        if not self._loads:
+            self._changes = []
+
+    def abort_load(self):
+        with self._lock:
+            self._end_load_locked()
+
+    def _replay_locked(self, plates, since, handler=None):
+        # plates: {handler: set of numbers}, updated in place
+        for sequence, changed_handler, vehicle_number, added in self._changes:
+            if sequence <= since or (handler is not None and changed_handler != handler):
+                continue
+            numbers = plates.setdefault(changed_handler, set())
+            if added:
+                numbers.add(vehicle_number)
+            else:
+                numbers.discard(vehicle_number)
+
+    def rebuild(self):
+        since = self.begin_load()
+        try:
+            plates = {}
+            for vehicle in vehicles_collection.find({'checkout_time': None}, {'vehicle_number': 1, 'handled_by': 1, '_id': 0}):
+                plates.setdefault(vehicle.get('handled_by'), set()).add(vehicle['vehicle_number'])
+        except BaseException:
+            self.abort_load()
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self._replay_locked(plates, since)
+            self._plates = {handler: sorted(numbers) for handler, numbers in plates.items()}
+            self._loaded_at = {}
+            self._rebuilt_at = now
+            self._end_load_locked()
+
+    def load_handler(self, handler):
+        since = self.begin_load()
+        try:
+            numbers = vehicles_collection.distinct('vehicle_number', {'handled_by': handler, 'checkout_time': None})
+        except BaseException:
+            self.abort_load()
+            raise
+        self.set_handler(handler, numbers, since)
+
+    def set_handler(self, handler, numbers, since):
+        # numbers were queried after begin_load() returned since
+        now = time.monotonic()
+        with self._lock:
+            plates = {handler: set(numbers)}
+            self._replay_locked(plates, since, handler)
+            self._plates[handler] = sorted(plates[handler])
+            self._loaded_at[handler] = now
+            self._end_load_locked()
+
+    def _record_locked(self, handler, vehicle_number, added):
+        self._sequence += 1
+        if self._loads:
+            self._changes.append((self._sequence, handler, vehicle_number, added))
+
+    def _is_fresh(self, handler):
+        loaded_at = max(self._loaded_at.get(handler, 0), self._rebuilt_at or 0)
+        return loaded_at and time.monotonic() - loaded_at < self.ttl
+
+    def add(self, handler, vehicle_number):
+        with self._lock:
+            self._record_locked(handler, vehicle_number, True)
+            plates = self._plates.setdefault(handler, [])
+            i = bisect.bisect_left(plates, vehicle_number)
+            if i == len(plates) or plates[i] != vehicle_number:
+                plates.insert(i, vehicle_number)
+
+    def remove(self, handler, vehicle_number):
+        with self._lock:
+            self._record_locked(handler, vehicle_number, False)
+            plates = self._plates.get(handler, [])
+            i = bisect.bisect_left(plates, vehicle_number)
+            if i < len(plates) and plates[i] == vehicle_number:
+                del plates[i]
+
+    def suggest(self, handler, prefix, limit):
+        # Returns None when this handler's plates are stale and must be reloaded
+        with self._lock:
+            if not self._is_fresh(handler):
+                return None
+            plates = self._plates.get(handler, [])
+            i = bisect.bisect_left(plates, prefix)
+            suggestions = []
+            while i < len(plates) and len(suggestions) < limit and plates[i].startswith(prefix):
+                suggestions.append(plates[i])
+                i += 1
+            return suggestions
+
+
+suggestion_index = SuggestionIndex(SUGGESTION_INDEX_TTL)
@@ -0,0 +1,21 @@
+import pytest
+
+from config import mongo
+
+
+@pytest.fixture
+def memory_db():
+    # The app's collections on an in-memory mongomock client (as in `benchmarks.run --backend memory`)
+    mongomock = pytest.importorskip('mongomock')
+    from cache import rate_cache, user_cache
+    from partitions import ensured_partitions
+
+    original_factory = mongo.client_factory
+    mongo.configure(client_factory=lambda uri, **options: mongomock.MongoClient())
+    try:
+        yield mongo.db
+    finally:
+        mongo.configure(client_factory=original_factory)
+        user_cache.clear()
+        rate_cache.clear()
+        ensured_partitions.clear()
@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+import pytest
+
+from partitions import partition_for
+from routes.checkout import CheckoutAborted, checkout_timestamp, claim_and_complete
+
+RATE = {'initial_amount': 20, 'initial_duration': 2, 'extra_charge': 10, 'extra_charge_duration': 1}
+
+
+def active_ticket(db, checkout_time, _id=1):
+    ticket = {
+        '_id': _id,
+        'vehicle_number': 'KA01AB1234',
+        'handled_by': 'staff',
+        'checkin_time': checkout_time - timedelta(hours=1),
+        'checkout_time': None,
+        'payment_mode': 'Cash',
+        'rate': RATE
+    }
+    db.vehicles.insert_one(ticket)
+    return ticket
+
+
+def checkout(checkout_time):
+    return claim_and_complete(None, {'vehicle_number': 'KA01AB1234', 'handled_by': 'staff', 'checkout_time': None},
+                              'Cash', checkout_time, 'staff')
+
+
+def test_checkout_writes_record_and_removes_ticket(memory_db):
+    checkout_time = checkout_timestamp()
+    active_ticket(memory_db, checkout_time)
+    result = checkout(checkout_time)
+    assert result['total_charge'] == 20
+    assert memory_db.vehicles.count_documents({}) == 0
+    assert partition_for(checkout_time).find_one({'_id': 1})['total_charge'] == 20
+
+
+def test_crash_before_ticket_removal_keeps_the_payment_record(memory_db, monkeypatch):
+    checkout_time = checkout_timestamp()
+    active_ticket(memory_db, checkout_time)
+
+    class Crash(Exception):
+        pass
+
+    def crash(*args, **kwargs):
+        raise Crash()
+
+    monkeypatch.setattr(type(memory_db.vehicles), 'delete_one', crash)
+    with pytest.raises(Crash):
+        checkout(checkout_time)
+    monkeypatch.undo()
+    # The ticket is still active, but its payment is on record
+    assert partition_for(checkout_time).find_one({'_id': 1}) is not None
+    assert memory_db.vehicles.count_documents({}) == 1
+
+    # The next attempt reports the ticket closed and finishes the removal
+    with pytest.raises(CheckoutAborted) as aborted:
+        checkout(checkout_time + timedelta(seconds=5))
+    assert 'already been checked out' in aborted.value.payload['message']
+    assert memory_db.vehicles.count_documents({}) == 0
+    assert partition_for(checkout_time).count_documents({}) == 1
+
+
+def test_ticket_closed_in_another_month_is_not_recorded_twice(memory_db, monkeypatch):
+    checkout_time = checkout_timestamp()
+    ticket = active_ticket(memory_db, checkout_time)
+    memory_db.vehicles.update_one({'_id': 1}, {'$set': {'checkin_time': checkout_time - timedelta(days=40)}})
+    elsewhere = checkout_time - timedelta(days=35)
+    real_delete_one = type(memory_db.vehicles).delete_one
+
+    def closed_meanwhile(collection, query, *args, **kwargs):
+        # Another booth records the ticket in an earlier month and removes it just before this
+        # checkout does
+        monkeypatch.undo()
+        partition_for(elsewhere).insert_one(dict(ticket, checkout_time=elsewhere))
+        real_delete_one(collection, query)
+        return real_delete_one(collection, query, *args, **kwargs)
+
+    monkeypatch.setattr(type(memory_db.vehicles), 'delete_one', closed_meanwhile)
+    with pytest.raises(CheckoutAborted):
+        checkout(checkout_time)
+    assert partition_for(checkout_time).find_one({'_id': 1}) is None
+    assert partition_for(elsewhere).find_one({'_id': 1}) is not None
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from config import mongo
+from indexes import HOT_QUERIES, INDEXES, ensure_indexes, explain_stages
+
+# Runs every hot query shape through explain() against a scratch database. Point
+# TEST_MONGO_URI at a disposable server; the tests are skipped when none is reachable.
+TEST_MONGO_URI = os.getenv('TEST_MONGO_URI', 'mongodb://localhost:27017')
+TEST_DB_NAME = os.getenv('TEST_MONGO_DB_NAME', 'ParkingTokenSystem_index_test')
+
+
+@pytest.fixture(scope='module')
+def index_db():
+    probe = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        probe.admin.command('ping')
+    except PyMongoError:
+        pytest.skip(f'No MongoDB reachable at {TEST_MONGO_URI}')
+    finally:
+        probe.close()
+
+    original_uri, original_db_name = mongo.uri, mongo.db_name
+    mongo.configure(TEST_MONGO_URI, TEST_DB_NAME)
+    mongo.client.drop_database(TEST_DB_NAME)
+    try:
+        # explain() on a missing collection plans EOF, which would hide a collection scan
+        for collection_name in {name for name, _, _, _ in HOT_QUERIES} | set(INDEXES):
+            mongo.db[collection_name].insert_one({'seed': True})
+        ensure_indexes()
+        yield mongo.db
+    finally:
+        mongo.client.drop_database(TEST_DB_NAME)
+        mongo.configure(original_uri, original_db_name)
+
+
+@pytest.mark.parametrize(
+    'collection_name, query, sort',
+    [(name, query, sort) for name, _, query, sort in HOT_QUERIES],
+    ids=[description for _, description, _, _ in HOT_QUERIES]
+)
+def test_hot_query_uses_an_index(index_db, collection_name, query, sort):
+    stages = explain_stages(collection_name, query, sort)
+    assert 'COLLSCAN' not in stages, f"{collection_name} plans {' -> '.join(stages)}"
+
+
+def test_missing_index_is_reported(index_db):
+    # The check itself must notice a scan, or the tests above prove nothing
+    index_db.vehicles.drop_index('handler_checkin_time')
+    try:
+        assert 'COLLSCAN' in explain_stages('vehicles', {'handled_by': 'staff', 'checkin_time': None})
+    finally:
+        ensure_indexes()
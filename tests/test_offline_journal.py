@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+import pytest
+
+import offline_journal as journal_module
+from offline_journal import OfflineJournal
+from partitions import partition_for
+from routes.checkout import checkout_timestamp, completed_record_for
+
+RATE = {'initial_amount': 20, 'initial_duration': 2, 'extra_charge': 10, 'extra_charge_duration': 1}
+
+
+class Died(BaseException):
+    # Stands in for the process being killed: not an Exception, so sync_once() does not catch it
+    pass
+
+
+@pytest.fixture
+def journal(memory_db, tmp_path):
+    return OfflineJournal(str(tmp_path / 'journal.db'))
+
+
+def offline_checkout(db, journal, checkout_time):
+    ticket = {
+        '_id': 1,
+        'vehicle_number': 'KA01AB1234',
+        'handled_by': 'staff',
+        'checkin_time': checkout_time - timedelta(hours=3, minutes=30),
+        'checkout_time': None,
+        'payment_mode': 'Cash',
+        'rate': RATE
+    }
+    db.vehicles.insert_one(ticket)
+    record = completed_record_for(ticket, RATE, checkout_time, 20, 40, 'UPI', 'staff')
+    record['recorded_offline'] = True
+    journal.record_checkout(record)
+    return record
+
+
+def rollups(db):
+    return {doc['payment_mode']: doc['total_amount'] for doc in db.daily_rollups.find({'handled_by': 'staff'})}
+
+
+def test_replay_counts_checkout_once(memory_db, journal):
+    checkout_time = checkout_timestamp()
+    offline_checkout(memory_db, journal, checkout_time)
+    assert journal.sync_once() == 1
+    assert journal.status()['synced'] == 1
+    assert memory_db.vehicles.count_documents({}) == 0
+    assert rollups(memory_db) == {'Cash': 20, 'UPI': 20}
+
+
+@pytest.mark.parametrize('dies_at', ['delete_ticket', 'update_rollups'])
+def test_replay_interrupted_after_record_is_written(memory_db, journal, monkeypatch, dies_at):
+    checkout_time = checkout_timestamp()
+    record = offline_checkout(memory_db, journal, checkout_time)
+
+    def die(*args, **kwargs):
+        raise Died()
+
+    if dies_at == 'delete_ticket':
+        monkeypatch.setattr(journal_module, 'vehicles_collection', type('Vehicles', (), {'delete_one': die})())
+    else:
+        monkeypatch.setattr(journal_module, 'update_rollups', die)
+    with pytest.raises(Died):
+        journal.sync_once()
+    monkeypatch.undo()
+    assert partition_for(checkout_time).find_one({'_id': record['_id']}) is not None
+    assert journal.has_pending()
+
+    # Resuming finds the record already written and still completes the checkout
+    assert journal.sync_once() == 1
+    assert journal.status()['synced'] == 1
+    assert memory_db.vehicles.count_documents({}) == 0
+    assert rollups(memory_db) == {'Cash': 20, 'UPI': 20}
+
+
+def test_replay_interrupted_after_rollups_does_not_count_twice(memory_db, journal, monkeypatch):
+    checkout_time = checkout_timestamp()
+    offline_checkout(memory_db, journal, checkout_time)
+    real_mark = journal._mark
+
+    def die_before_marking(seq, status, detail=None):
+        raise Died()
+
+    monkeypatch.setattr(journal, '_mark', die_before_marking)
+    with pytest.raises(Died):
+        journal.sync_once()
+    monkeypatch.setattr(journal, '_mark', real_mark)
+
+    assert journal.sync_once() == 1
+    assert rollups(memory_db) == {'Cash': 20, 'UPI': 20}
@@ -0,0 +1,19 @@
+from config import COLD_START_BUDGET_MS
+from startup_profile import profile_startup
+
+# Modules the app must not import until a request needs them (see routes.lazy_view)
+DEFERRED_MODULES = ('openpyxl', 'pandas', 'pyarrow', 'smtplib', 'routes.generate_report', 'routes.checkin')
+
+
+def test_app_import_within_budget():
+    # Same measurement as `flask profile-startup --budget`: the fastest of three cold imports
+    # in a fresh interpreter
+    total_ms, _ = profile_startup('app', runs=3)
+    assert total_ms <= COLD_START_BUDGET_MS, \
+        f'import app took {total_ms:.1f} ms, over the {COLD_START_BUDGET_MS:.0f} ms budget'
+
+
+def test_route_modules_are_not_imported_at_startup():
+    _, modules = profile_startup('app', runs=1)
+    imported = {name for name, _, _ in modules}
+    assert not imported.intersection(DEFERRED_MODULES)
@@ -0,0 +1,70 @@
+import suggestion_index as suggestion_module
+from suggestion_index import SuggestionIndex
+
+
+class Vehicles:
+    # Returns the active plates as of the query, then runs `during` as if a check-in or checkout
+    # landed while the result was on its way back
+
+    def __init__(self, plates, during=None):
+        self.plates = plates
+        self.during = during
+
+    def _result(self):
+        snapshot = list(self.plates)
+        if self.during:
+            self.during()
+        return snapshot
+
+    def distinct(self, field, query):
+        return self._result()
+
+    def find(self, query, projection):
+        return [{'vehicle_number': plate, 'handled_by': 'staff'} for plate in self._result()]
+
+
+def test_check_in_during_load_is_kept(monkeypatch):
+    index = SuggestionIndex(60)
+    monkeypatch.setattr(suggestion_module, 'vehicles_collection',
+                        Vehicles(['KA01AA0001'], lambda: index.add('staff', 'KA01AA0002')))
+    index.load_handler('staff')
+    assert index.suggest('staff', 'KA01', 5) == ['KA01AA0001', 'KA01AA0002']
+
+
+def test_checkout_during_load_is_kept(monkeypatch):
+    index = SuggestionIndex(60)
+    monkeypatch.setattr(suggestion_module, 'vehicles_collection',
+                        Vehicles(['KA01AA0001', 'KA01AA0002'], lambda: index.remove('staff', 'KA01AA0001')))
+    index.load_handler('staff')
+    assert index.suggest('staff', 'KA01', 5) == ['KA01AA0002']
+
+
+def test_changes_during_rebuild_are_kept(monkeypatch):
+    index = SuggestionIndex(60)
+
+    def during():
+        index.add('staff', 'KA01AA0003')
+        index.remove('staff', 'KA01AA0001')
+        index.add('other', 'KA02BB0001')
+
+    monkeypatch.setattr(suggestion_module, 'vehicles_collection', Vehicles(['KA01AA0001', 'KA01AA0002'], during))
+    index.rebuild()
+    assert index.suggest('staff', 'KA01', 5) == ['KA01AA0002', 'KA01AA0003']
+    assert index.suggest('other', 'KA02', 5) == ['KA02BB0001']
+
+
+def test_failed_load_leaves_no_change_log(monkeypatch):
+    index = SuggestionIndex(60)
+
+    class Unreachable:
+        def distinct(self, field, query):
+            raise RuntimeError('unreachable')
+
+    monkeypatch.setattr(suggestion_module, 'vehicles_collection', Unreachable())
+    try:
+        index.load_handler('staff')
+    except RuntimeError:
+        pass
+    index.add('staff', 'KA01AA0001')
+    assert index._changes == []
+    assert index.suggest('staff', 'KA01', 5) is None
@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from routes.calculate_charge import calculate_charge
+from tariff import durations_in_hours, price_batch, RATE_FIELDS
+
+CHECKIN = datetime(2024, 3, 1, 8, 30, 0)
+
+PLANS = [
+    {'initial_amount': 20, 'initial_duration': 2, 'extra_charge': 10, 'extra_charge_duration': 1},
+    {'initial_amount': 15.5, 'initial_duration': 1.5, 'extra_charge': 7.25, 'extra_charge_duration': 0.5},
+    {'initial_amount': 0.1, 'initial_duration': 0.25, 'extra_charge': 0.3, 'extra_charge_duration': 0.1},
+    {'initial_amount': 50, 'initial_duration': 24, 'extra_charge': 33.33, 'extra_charge_duration': 12},
+    {'initial_amount': 10, 'initial_duration': 0, 'extra_charge': 2.5, 'extra_charge_duration': 1 / 3}
+]
+
+
+def stays(plan):
+    # Durations around the edges of a plan: exact boundaries, a microsecond either side of
+    # them, sub-second stays and long stays
+    initial = timedelta(hours=plan['initial_duration'])
+    period = timedelta(hours=plan['extra_charge_duration'])
+    microsecond = timedelta(microseconds=1)
+    durations = [timedelta(0), microsecond, timedelta(milliseconds=999), timedelta(days=40, microseconds=7)]
+    for periods in range(6):
+        boundary = initial + periods * period
+        durations.extend([boundary - microsecond, boundary, boundary + microsecond])
+    return [d for d in durations if d >= timedelta(0)]
+
+
+def scalar_prices(checkouts, plan):
+    return [calculate_charge(CHECKIN, checkout, plan) for checkout in checkouts]
+
+
+def vector_prices(checkouts, plan):
+    hours = durations_in_hours([CHECKIN] * len(checkouts), checkouts)
+    return price_batch(hours, *(plan[field] for field in RATE_FIELDS)).tolist()
+
+
+@pytest.mark.parametrize('plan', PLANS)
+def test_boundaries_match_scalar(plan):
+    checkouts = [CHECKIN + duration for duration in stays(plan)]
+    assert vector_prices(checkouts, plan) == scalar_prices(checkouts, plan)
+
+
+@pytest.mark.parametrize('plan', PLANS)
+def test_random_microsecond_durations_match_scalar(plan):
+    rng = random.Random(plan['initial_amount'])
+    checkouts = [CHECKIN + timedelta(microseconds=rng.randrange(0, 3 * 86400 * 10**6)) for _ in range(5000)]
+    assert vector_prices(checkouts, plan) == scalar_prices(checkouts, plan)
+
+
+def test_durations_match_total_seconds():
+    rng = random.Random(1)
+    checkins = [CHECKIN + timedelta(microseconds=rng.randrange(0, 10**12)) for _ in range(1000)]
+    checkouts = [checkin + timedelta(microseconds=rng.randrange(0, 10**11)) for checkin in checkins]
+    expected = [(checkout - checkin).total_seconds() / 3600 for checkin, checkout in zip(checkins, checkouts)]
+    assert durations_in_hours(checkins, checkouts).tolist() == expected
+
+
+def test_per_record_rate_arrays_match_scalar():
+    # The simulator may price each record under its own rate snapshot
+    rng = random.Random(2)
+    checkouts = [CHECKIN + timedelta(microseconds=rng.randrange(0, 86400 * 10**6)) for _ in range(2000)]
+    plans = [rng.choice(PLANS) for _ in checkouts]
+    hours = durations_in_hours([CHECKIN] * len(checkouts), checkouts)
+    rates = [np.array([plan[field] for plan in plans]) for field in RATE_FIELDS]
+    expected = [calculate_charge(CHECKIN, checkout, plan) for checkout, plan in zip(checkouts, plans)]
+    assert price_batch(hours, *rates).tolist() == expected
+
+
+def test_zero_extra_charge_duration_inside_initial_period():
+    plan = {'initial_amount': 30, 'initial_duration': 3, 'extra_charge': 5, 'extra_charge_duration': 0}
+    checkouts = [CHECKIN, CHECKIN + timedelta(hours=1, microseconds=3), CHECKIN + timedelta(hours=3)]
+    assert vector_prices(checkouts, plan) == scalar_prices(checkouts, plan)
+
+
+def test_zero_extra_charge_duration_past_initial_period_raises_like_scalar():
+    plan = {'initial_amount': 30, 'initial_duration': 3, 'extra_charge': 5, 'extra_charge_duration': 0}
+    checkouts = [CHECKIN + timedelta(hours=3, microseconds=1)]
+    with pytest.raises(ZeroDivisionError):
+        scalar_prices(checkouts, plan)
+    with pytest.raises(ZeroDivisionError):
+        vector_prices(checkouts, plan)